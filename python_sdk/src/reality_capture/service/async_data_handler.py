@@ -0,0 +1,858 @@
+import asyncio
+import os.path
+from typing import Optional, AsyncIterator, Callable
+from urllib.parse import urlsplit, urlunsplit
+from reality_capture.service.error import DetailedErrorResponse, DetailedError, Error
+from reality_capture.service.response import Response
+from reality_capture.service.service import RealityCaptureService
+from reality_capture.service.reality_data import RealityDataUpdate, RealityData, ContainerDetails
+from reality_capture.service.bucket import BucketResponse
+from reality_capture.service.data_handler import _DataHandler, _LinkCache, _SasCredential, _RangeWriter, \
+    TransferResult, DataInfo, DataFilter
+from reality_capture.service.transfer import ProgressTracker
+from azure.core import MatchConditions
+from azure.storage.blob import ContentSettings, BlobProperties
+from azure.storage.blob.aio import ContainerClient, BlobPrefix
+
+try:
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+except ImportError:  # aiohttp is an optional dependency, the azure client reports it if missing
+    aiohttp = None
+
+
+if aiohttp is not None:
+    class _PooledAioHttpTransport(AioHttpTransport):
+        """
+        aiohttp transport with a given number of connections. aiohttp limits a session to 100 connections by default.
+        The session is created when the client opens the transport, in the event loop, and closed with the client.
+        """
+
+        def __init__(self, pool_size: int, **kwargs) -> None:
+            super().__init__(session_owner=True, **kwargs)
+            self._pool_size = pool_size
+            self._created = False
+
+        async def open(self):
+            if self.session is None and not self._created:
+                # Same settings as the session the azure transport creates, only the connector differs
+                self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self._pool_size),
+                                                     trust_env=self._use_env_settings,
+                                                     cookie_jar=aiohttp.DummyCookieJar(), auto_decompress=False)
+                self._created = True
+            await super().open()
+
+
+class _AsyncSasCredential(_SasCredential):
+    """
+    SAS of a container, renewed in a worker thread shortly before it expires.
+    The aio pipeline reads the signature in the event loop, where it must not wait for the service: reads return the
+    current SAS and start its renewal in the background, the renewed one is used once it is available.
+    """
+
+    def __init__(self, container_url: str, refresh: Callable[[], Optional[str]], margin: float = 300.0) -> None:
+        super().__init__(container_url, refresh, margin)
+        self._renewal = None
+
+    @property
+    def signature(self) -> str:
+        if self._expires_soon() and (self._renewal is None or self._renewal.done()):
+            self._renewal = asyncio.ensure_future(asyncio.to_thread(self._renew))
+        return self._signature
+
+
+class _AsyncFileReader:
+    """
+    Binary file read in a worker thread, the aio client awaits its reads instead of blocking the event loop.
+    It is not seekable, so that the client reads it chunk by chunk instead of through synchronous sub-streams.
+    """
+
+    def __init__(self, file) -> None:
+        self._file = file
+
+    def seekable(self) -> bool:
+        return False
+
+    async def read(self, size: int = -1) -> bytes:
+        return await asyncio.to_thread(self._file.read, size)
+
+
+class _AsyncDataHandler:
+    @staticmethod
+    def _get_container_client(container_url: str, pool_size: int,
+                              refresh_link: Optional[Callable[[], Optional[str]]] = None, **kwargs) -> ContainerClient:
+        if refresh_link is not None:
+            # The SAS is given as a credential so that it can be renewed, the url must not contain it anymore
+            kwargs["credential"] = _AsyncSasCredential(container_url, refresh_link)
+            container_url = urlunsplit(urlsplit(container_url)._replace(query=""))
+        # Allow one connection per concurrent request, the session only exists once the client is used
+        if aiohttp is not None:
+            kwargs["transport"] = _PooledAioHttpTransport(pool_size)
+        return ContainerClient.from_container_url(container_url, **kwargs)
+
+    @staticmethod
+    async def _walk_blobs(client: ContainerClient, prefix: str,
+                          data_filter: Optional[DataFilter] = None) -> AsyncIterator[BlobProperties]:
+        # Same sharding and filtering as the synchronous listing, with one task per folder instead of one thread
+        results = asyncio.Queue(maxsize=10000)
+        semaphore = asyncio.Semaphore(_DataHandler._LIST_WORKERS)
+        tasks = set()
+        pending = 0
+        done = object()
+
+        def _start(name_prefix, depth):
+            nonlocal pending
+            pending += 1
+            tasks.add(asyncio.ensure_future(_list(name_prefix, depth)))
+
+        async def _list(name_prefix, depth):
+            nonlocal pending
+            try:
+                async with semaphore:
+                    if depth < _DataHandler._LIST_DEPTH:
+                        items = client.walk_blobs(name_starts_with=name_prefix or None, delimiter="/")
+                    else:
+                        items = client.list_blobs(name_starts_with=name_prefix or None)
+                    async for item in items:
+                        if isinstance(item, BlobPrefix):
+                            _start(item.name, depth + 1)
+                        elif data_filter is None or data_filter.matches(
+                                _DataHandler._get_copy_name(item.name, prefix, ""), item.size, item.last_modified):
+                            await results.put(item)
+            except Exception as e:
+                await results.put(e)
+            pending -= 1
+            if pending == 0:
+                await results.put(done)
+
+        try:
+            _start(prefix, 0)
+            while True:
+                item = await results.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def _run(fn, items, max_workers: int) -> None:
+        # A fixed number of workers pull the items, memory does not depend on the number of files
+        items = iter(items)
+
+        async def _worker():
+            for item in items:
+                await fn(item)
+
+        workers = [asyncio.ensure_future(_worker()) for _ in range(max(1, max_workers))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+
+    @staticmethod
+    async def _download_ranges(client: ContainerClient, blob: BlobProperties, writer: _RangeWriter,
+                               progress: ProgressTracker, max_concurrency: int) -> None:
+        # Ranges of a blob are downloaded concurrently and written in place by worker threads, the event loop only
+        # waits for them. Fail rather than mix two versions of the blob if it is modified during the download.
+        downloaded = 0
+
+        async def _download_range(start):
+            nonlocal downloaded
+            length = min(_DataHandler._CHUNK_SIZE, blob.size - start)
+            downloader = await client.download_blob(
+                blob.name,
+                offset=start,
+                length=length,
+                etag=blob.etag,
+                match_condition=MatchConditions.IfNotModified,
+                connection_timeout=60,
+                max_concurrency=1,
+                retry_total=20,
+                retry_connect=10,
+            )
+            await asyncio.to_thread(writer.write_at, await downloader.readall(), start)
+            downloaded += length
+            progress.update(blob.name, downloaded)
+
+        await _AsyncDataHandler._run(_download_range, range(0, blob.size, _DataHandler._CHUNK_SIZE), max_concurrency)
+
+    @staticmethod
+    async def download_data(container_url: str, dst: str, src: str, progress: Optional[ProgressTracker],
+                            sync: bool = False, mirror: bool = False, max_workers: int = 256,
+                            max_concurrency: int = 16,
+                            refresh_link: Optional[Callable[[], Optional[str]]] = None,
+                            data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
+        progress = progress or ProgressTracker()
+        client = _AsyncDataHandler._get_container_client(container_url, max_workers * max_concurrency, refresh_link,
+                                                         max_single_get_size=_DataHandler._CHUNK_SIZE,
+                                                         max_chunk_get_size=_DataHandler._CHUNK_SIZE)
+        result = TransferResult()
+        manifest = await asyncio.to_thread(_DataHandler._read_manifest, dst) if sync else {}
+        blobs = {}
+
+        async def _download_blob(blob):
+            download_file_path = _DataHandler._get_download_path(blob.name, src, dst)
+            if sync and await asyncio.to_thread(_DataHandler._is_downloaded, download_file_path, blob,
+                                                manifest.get(blob.name)):
+                result.skipped.append(blob.name)
+                progress.skip(blob.name, blob.size)
+                return
+
+            await asyncio.to_thread(os.makedirs, os.path.dirname(download_file_path), exist_ok=True)
+            try:
+                writer = await asyncio.to_thread(_RangeWriter, download_file_path, blob.size)
+                try:
+                    await _AsyncDataHandler._download_ranges(client, blob, writer, progress, max_concurrency)
+                finally:
+                    await asyncio.to_thread(writer.close)
+            except BaseException:
+                # Do not leave a truncated file behind if the download failed or was cancelled
+                if os.path.exists(download_file_path):
+                    os.remove(download_file_path)
+                raise
+            progress.complete(blob.name, blob.size)
+            result.transferred.append(blob.name)
+            if sync:
+                stat = await asyncio.to_thread(os.stat, download_file_path)
+                manifest[blob.name] = {"etag": blob.etag, "mtime": stat.st_mtime}
+
+        try:
+            try:
+                async for blob in _AsyncDataHandler._walk_blobs(client, src, data_filter):
+                    blobs[blob.name] = blob
+                progress.start(sum(blob.size for blob in blobs.values()), len(blobs))
+                await _AsyncDataHandler._run(_download_blob, list(blobs.values()), max_workers)
+                progress.flush()
+            finally:
+                # Keep track of what was downloaded even if the transfer stopped, the next sync will resume from it
+                if sync:
+                    await asyncio.to_thread(_DataHandler._write_manifest, dst,
+                                            {name: entry for name, entry in manifest.items() if name in blobs})
+                await client.close()
+            if mirror:
+                expected = {os.path.normpath(_DataHandler._get_download_path(name, src, dst)) for name in blobs}
+                result.deleted = await asyncio.to_thread(_DataHandler._remove_extra_files, dst, expected, data_filter)
+        except InterruptedError as _:
+            de = DetailedErrorResponse(error={"code": "DownloadInterrupted",
+                                              "message": "Download was interrupted by user."})
+            return Response(499, de, None)
+        except Exception as e:
+            de = DetailedErrorResponse(error={"code": "DownloadFailure",
+                                              "message": f"Download failed: {e}."})
+            return Response(500, de, None)
+        result.transferred.sort()
+        result.skipped.sort()
+        return Response(200, None, result)
+
+    @staticmethod
+    async def upload_data(container_url: str, src: str, reality_data_dst: str, progress: Optional[ProgressTracker],
+                          sync: bool = False, max_workers: int = 256, max_concurrency: int = 16,
+                          refresh_link: Optional[Callable[[], Optional[str]]] = None,
+                          data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
+        progress = progress or ProgressTracker()
+        files = await asyncio.to_thread(_DataHandler._get_files_and_sizes, src, data_filter)
+        progress.start(sum(size for _, size in files), len(files))
+        client = _AsyncDataHandler._get_container_client(container_url, max_workers * max_concurrency, refresh_link,
+                                                         max_single_put_size=_DataHandler._CHUNK_SIZE,
+                                                         max_block_size=_DataHandler._CHUNK_SIZE)
+        result = TransferResult()
+        remote_blobs = {}
+
+        async def _upload_file(file_tuple):
+            async def _upload_callback(current, _):
+                progress.update(file_tuple[0], current)
+
+            file_path = os.path.join(src, file_tuple[0]) if os.path.isdir(src) else src
+            blob_name = os.path.join(reality_data_dst, file_tuple[0])
+            content_settings = None
+            if sync:
+                if await asyncio.to_thread(_DataHandler._is_uploaded, file_path, file_tuple[1],
+                                           remote_blobs.get(blob_name)):
+                    result.skipped.append(blob_name)
+                    progress.skip(file_tuple[0], file_tuple[1])
+                    return
+                # Store the hash on the blob so that the next synchronization can compare contents
+                md5 = await asyncio.to_thread(_DataHandler._get_md5, file_path)
+                content_settings = ContentSettings(content_md5=bytearray(md5))
+            data = await asyncio.to_thread(open, file_path, "rb")
+            try:
+                await client.upload_blob(
+                    blob_name,
+                    _AsyncFileReader(data),
+                    length=file_tuple[1],
+                    connection_timeout=60,
+                    max_concurrency=max_concurrency,
+                    retry_total=20,
+                    retry_connect=10,
+                    progress_hook=_upload_callback,
+                    overwrite=True,
+                    content_settings=content_settings,
+                )
+            finally:
+                data.close()
+            progress.complete(file_tuple[0], file_tuple[1])
+            result.transferred.append(blob_name)
+
+        try:
+            try:
+                if sync:
+                    async for blob in _AsyncDataHandler._walk_blobs(client, reality_data_dst):
+                        remote_blobs[blob.name] = blob
+                await _AsyncDataHandler._run(_upload_file, files, max_workers)
+                progress.flush()
+            finally:
+                await client.close()
+        except InterruptedError as _:
+            de = DetailedErrorResponse(error={"code": "UploadInterrupted",
+                                              "message": "Upload was interrupted by user."})
+            return Response(499, de, None)
+        except Exception as e:
+            de = DetailedErrorResponse(error={"code": "UploadFailure",
+                                              "message": f"Upload failed: {e}."})
+            return Response(500, de, None)
+        result.transferred.sort()
+        result.skipped.sort()
+        return Response(200, None, result)
+
+    @staticmethod
+    async def list_data(container_url: str, prefix: str = "",
+                        refresh_link: Optional[Callable[[], Optional[str]]] = None,
+                        data_filter: Optional[DataFilter] = None) -> Response[list[str]]:
+        client = _AsyncDataHandler._get_container_client(container_url, _DataHandler._LIST_WORKERS, refresh_link)
+        try:
+            blob_names = sorted([blob.name async for blob in _AsyncDataHandler._walk_blobs(client, prefix,
+                                                                                             data_filter)])
+        finally:
+            await client.close()
+        return Response(200, None, blob_names)
+
+    @staticmethod
+    async def iter_data(container_url: str, prefix: str = "",
+                        refresh_link: Optional[Callable[[], Optional[str]]] = None) -> AsyncIterator[DataInfo]:
+        client = _AsyncDataHandler._get_container_client(container_url, 1, refresh_link)
+        try:
+            async for blob in client.list_blobs(name_starts_with=prefix or None):
+                yield _DataHandler._get_data_info(blob)
+        finally:
+            await client.close()
+
+    @staticmethod
+    async def delete_data(container_url: str, files_to_delete: list[str], prefix: Optional[str] = None,
+                          max_workers: int = 256,
+                          refresh_link: Optional[Callable[[], Optional[str]]] = None) -> Response[None]:
+        client = _AsyncDataHandler._get_container_client(container_url, max_workers, refresh_link)
+        failed = []
+
+        async def _delete_batch(batch):
+            try:
+                responses = await client.delete_blobs(*batch, raise_on_any_failure=False)
+                statuses = [response.status_code async for response in responses]
+                failed.extend(file for file, status in zip(batch, statuses) if status not in (200, 202))
+            except Exception as _:
+                # The whole batch was rejected, delete its files one by one to know which ones failed
+                for file in batch:
+                    try:
+                        await client.delete_blob(file)
+                    except Exception as _:
+                        failed.append(file)
+
+        try:
+            files = list(dict.fromkeys(files_to_delete))
+            if prefix is not None:
+                listed = set(files)
+                files.extend([blob.name async for blob in _AsyncDataHandler._walk_blobs(client, prefix)
+                              if blob.name not in listed])
+            batches = [files[i:i + _DataHandler._DELETE_BATCH_SIZE]
+                       for i in range(0, len(files), _DataHandler._DELETE_BATCH_SIZE)]
+            await _AsyncDataHandler._run(_delete_batch, batches, max_workers)
+        except Exception as e:
+            de = DetailedErrorResponse(error={"code": "DeletionFailed",
+                                              "message": f"Deletion failed: {e}."})
+            return Response(500, de, None)
+        finally:
+            await client.close()
+        if not failed:
+            return Response(204, None, None)
+        detailed_error = DetailedError(code="DeletionFailed", message="Failed to delete one or multiple files",
+                                       details=[Error(code="DeletionFailed", message="Failed to delete a file",
+                                                      target=fail) for fail in sorted(failed)])
+        return Response(400, DetailedErrorResponse(error=detailed_error), None)
+
+
+class AsyncUploadSession:
+    """
+    Asynchronous uploads to a reality data sharing a single write access and a single authoring period.
+    Authoring is enabled when the session opens and disabled when it closes, whatever the number of uploads.
+    Uploads can run concurrently.
+    Sessions are created with :meth:`AsyncRealityDataHandler.upload_session` and are usually used as
+    asynchronous context managers, :attr:`close_result` then tells whether authoring could be disabled.
+    """
+
+    def __init__(self, handler: "AsyncRealityDataHandler", reality_data_id: str,
+                 itwin_id: Optional[str] = None) -> None:
+        """
+        Constructor method
+
+        :param handler: Handler the session uploads with.
+        :param reality_data_id: Id of the Reality Data.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        """
+        self._handler = handler
+        self._reality_data_id = reality_data_id
+        self._itwin_id = itwin_id
+        self._cond = None
+        self._opened = None
+        self._closed = None
+        self._uploads = 0
+        self._container_url = None
+
+    @property
+    def close_result(self) -> Optional[Response[None]]:
+        """
+        Result of closing the session, None while the session is not closed.
+        """
+        return self._closed
+
+    def _get_cond(self) -> asyncio.Condition:
+        # Created lazily so that the session can be built outside of the event loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def _open(self) -> Response[None]:
+        if self._closed is not None:
+            de = DetailedErrorResponse(error={"code": "SessionClosed",
+                                              "message": "Upload session is closed."})
+            return Response(400, de, None)
+        if self._opened is None or self._opened.is_error():
+            r = await self._handler._get_link(self._reality_data_id, self._itwin_id, False)
+            if not r.is_error():
+                self._container_url = r.value.links.container_url.href
+                r = await self._handler._set_authoring(self._reality_data_id, True)
+            self._opened = Response(r.status_code, r.error, None)
+        return self._opened
+
+    async def open(self) -> Response[None]:
+        """
+        Get write access to the reality data and enable authoring. Does nothing if the session is already open.
+        A closed session can not be opened again.
+
+        :return: A Response[None] containing the error from the service if the session could not be opened,
+         or a SessionClosed error if the session is closed.
+        """
+        async with self._get_cond():
+            return await self._open()
+
+    async def upload_data(self, src: str, reality_data_dst: str = "", sync: bool = False,
+                          data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
+        """
+        Upload files to the reality data of the session. Opens the session if needed.
+
+        :param src: Source path to upload. If directory, all the files in the directory will be uploaded recursively.
+        :param reality_data_dst: Destination of the data inside the Reality Data, default to root.
+        :param sync: If True, files already present in the Reality Data with the same size and content are skipped.
+        :param data_filter: Optional filter of the files to upload, applied while scanning the source.
+        :return: A Response[TransferResult] containing either the uploaded and skipped files
+         or the error from the service.
+        """
+        cond = self._get_cond()
+        async with cond:
+            r = await self._open()
+            if r.is_error():
+                return Response(r.status_code, r.error, None)
+            self._uploads += 1
+        try:
+            # The link is renewed by the transfer itself when its SAS is about to expire
+            return await _AsyncDataHandler.upload_data(self._container_url, src, reality_data_dst,
+                                                       self._handler._get_progress(), sync,
+                                                       self._handler._max_workers, self._handler._max_concurrency,
+                                                       self._handler._get_link_refresh(self._reality_data_id,
+                                                                                       self._itwin_id, False),
+                                                       data_filter)
+        finally:
+            async with cond:
+                self._uploads -= 1
+                cond.notify_all()
+
+    async def close(self) -> Response[None]:
+        """
+        Wait for the running uploads and disable authoring. Authoring is only disabled if the session was opened,
+        closing the session again returns the result of the first close.
+
+        :return: A Response[None] containing the error from the service if authoring could not be disabled.
+        """
+        cond = self._get_cond()
+        async with cond:
+            await cond.wait_for(lambda: self._uploads == 0)
+            if self._closed is None:
+                if self._opened is None or self._opened.is_error():
+                    self._closed = Response(200, None, None)
+                else:
+                    r = await self._handler._set_authoring(self._reality_data_id, False)
+                    self._closed = Response(r.status_code, r.error, None)
+            return self._closed
+
+    async def __aenter__(self) -> "AsyncUploadSession":
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+
+class AsyncRealityDataHandler:
+    """
+    Asynchronous class for uploading to, downloading from, and listing a reality data.
+    Unlike :class:`~reality_capture.service.data_handler.RealityDataHandler`, transfers can not be resumed: there is no
+    ``resume`` option, a failed transfer is started again from the beginning.
+    """
+
+    def __init__(self, token_factory, **kwargs) -> None:
+        """
+        Constructor method
+
+        :param token_factory: An object that implements a ``get_token() -> str`` method.
+        :type token_factory: Object
+        :param \\**kwargs: Internal parameters used only for development purposes.
+        """
+        self._service = RealityCaptureService(token_factory, **kwargs)
+        self._progress_hook = None
+        self._progress_rate = 10.0
+        self._progress_detailed = False
+        self._max_workers = 256
+        self._max_concurrency = 16
+        self._links = _LinkCache()
+
+    def _get_cached_link(self, rd_id: str, itwin_id: Optional[str], read_only: bool) -> Response[ContainerDetails]:
+        if not read_only:
+            return self._links.get((rd_id, itwin_id, read_only),
+                                   lambda: self._service.get_reality_data_write_access(rd_id, itwin_id))
+        return self._links.get((rd_id, itwin_id, read_only),
+                               lambda: self._service.get_reality_data_read_access(rd_id, itwin_id))
+
+    async def _get_link(self, rd_id: str, itwin_id: Optional[str], read_only: bool) -> Response[ContainerDetails]:
+        return await asyncio.to_thread(self._get_cached_link, rd_id, itwin_id, read_only)
+
+    def _get_link_refresh(self, rd_id: str, itwin_id: Optional[str], read_only: bool) -> Callable[[], Optional[str]]:
+        # Called in a worker thread by the credential, about once per SAS lifetime
+        def _refresh():
+            r = self._get_cached_link(rd_id, itwin_id, read_only)
+            return None if r.is_error() else r.value.links.container_url.href
+        return _refresh
+
+    async def _set_authoring(self, rd_id: str, authoring: bool) -> Response[RealityData]:
+        rdu = RealityDataUpdate(authoring=authoring)
+        return await asyncio.to_thread(self._service.update_reality_data, rdu, rd_id)
+
+    async def upload_data(self, reality_data_id: str, src: str,
+                          reality_data_dst: str = "", itwin_id: Optional[str] = None,
+                          sync: bool = False, data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
+        """
+        Upload files to a reality data.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param src: Source path to upload. If directory, all the files in the directory will be uploaded recursively.
+        :param reality_data_dst: Destination of the data inside the Reality Data, default to root.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :param sync: If True, files already present in the Reality Data with the same size and content are skipped.
+        :param data_filter: Optional filter of the files to upload, applied while scanning the source.
+        :return: A Response[TransferResult] containing either the uploaded and skipped files
+         or the error from the service.
+        """
+        session = self.upload_session(reality_data_id, itwin_id)
+        r = await session.open()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        resp = await session.upload_data(src, reality_data_dst, sync, data_filter)
+        r = await session.close()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return resp
+
+    def upload_session(self, reality_data_id: str, itwin_id: Optional[str] = None) -> AsyncUploadSession:
+        """
+        Create a session for uploading files to a reality data in several calls.
+        Write access and authoring are requested once for the whole session instead of once per upload.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :return: An AsyncUploadSession, to use as an asynchronous context manager.
+        """
+        return AsyncUploadSession(self, reality_data_id, itwin_id)
+
+    async def download_data(self, reality_data_id: str, dst: str,
+                            reality_data_src: str = "", itwin_id: Optional[str] = None,
+                            sync: bool = False, mirror: bool = False,
+                            data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
+        """
+        Download files from a reality data.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param dst: Destination path of the downloads.
+        :param reality_data_src: Source folder to download in the Reality Data, default to root.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :param sync: If True, only files missing or changed in the destination are downloaded.
+         Downloaded files are tracked in a manifest stored in the destination.
+        :param mirror: If True, files in the destination that do not exist in the source are removed.
+        :param data_filter: Optional filter of the files to download, applied while listing the source.
+         Local files left out by the filter are never removed by mirror.
+        :return: A Response[TransferResult] containing either the downloaded, skipped and deleted files
+         or the error from the service.
+        """
+        r = await self._get_link(reality_data_id, itwin_id, True)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return await _AsyncDataHandler.download_data(r.value.links.container_url.href, dst, reality_data_src,
+                                                     self._get_progress(), sync, mirror, self._max_workers,
+                                                     self._max_concurrency,
+                                                     self._get_link_refresh(reality_data_id, itwin_id, True),
+                                                     data_filter)
+
+    async def list_data(self, reality_data_id, itwin_id: Optional[str] = None, prefix: str = "",
+                        data_filter: Optional[DataFilter] = None) -> Response[list[str]]:
+        """
+        List all the files inside a reality data.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :param prefix: Only list the files whose name starts with this prefix, default to all files.
+        :param data_filter: Optional filter of the files to list, paths are relative to the prefix.
+        :return: A Response[list[str]] containing either the files in the Reality Data or the error from the service.
+        """
+        r = await self._get_link(reality_data_id, itwin_id, True)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return await _AsyncDataHandler.list_data(r.value.links.container_url.href, prefix,
+                                                 self._get_link_refresh(reality_data_id, itwin_id, True), data_filter)
+
+    async def iter_data(self, reality_data_id, itwin_id: Optional[str] = None,
+                        prefix: str = "") -> Response[AsyncIterator[DataInfo]]:
+        """
+        Iterate over the files inside a reality data.
+        Files are listed page by page while iterating, the whole listing is never kept in memory.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :param prefix: Only list the files whose name starts with this prefix, default to all files.
+        :return: A Response[AsyncIterator[DataInfo]] containing either an asynchronous iterator over the files
+         in the Reality Data or the error from the service.
+        """
+        r = await self._get_link(reality_data_id, itwin_id, True)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return Response(200, None, _AsyncDataHandler.iter_data(r.value.links.container_url.href, prefix,
+                                                               self._get_link_refresh(reality_data_id, itwin_id,
+                                                                                      True)))
+
+    async def delete_data(self, reality_data_id, files_to_delete: Optional[list[str]] = None,
+                          itwin_id: Optional[str] = None, prefix: Optional[str] = None) -> Response[None]:
+        """
+        Delete specified files from a reality data.
+        Files are deleted in batches of 256, several batches running at the same time.
+
+        :param reality_data_id: id of the Reality Data.
+        :param files_to_delete: List of files to delete.
+        :param itwin_id: iTwin id for finding the bucket.
+        :param prefix: If set, all the files whose name starts with the prefix are deleted as well.
+         An empty prefix deletes every file of the Reality Data.
+        :return: A Response[None] containing either the files in the bucket or the error from the service.
+        """
+        r = await self._get_link(reality_data_id, itwin_id, False)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return await _AsyncDataHandler.delete_data(r.value.links.container_url.href, files_to_delete or [],
+                                                   prefix, self._max_workers,
+                                                   self._get_link_refresh(reality_data_id, itwin_id, False))
+
+    def set_progress_hook(self, hook: Optional, max_rate: float = 10.0, detailed: bool = False) -> None:
+        """
+        Set the progress hook.
+
+        :param hook: Function taking a float as an argument and returning a bool.
+         When returning false, the ongoing action will be cancelled. Can be None if no progress hook is needed.
+        :param max_rate: Maximum number of calls to the hook per second, 0 for no limit.
+        :param detailed: If True, the hook is called with a
+         :class:`~reality_capture.service.transfer.TransferProgress` instead of a percentage.
+        """
+        self._progress_hook = hook
+        self._progress_rate = max_rate
+        self._progress_detailed = detailed
+
+    def set_concurrency_limits(self, max_workers: int = 256, max_concurrency: int = 16) -> None:
+        """
+        Set the transfer concurrency.
+
+        :param max_workers: Maximum number of files transferred concurrently.
+        :param max_concurrency: Maximum number of concurrent requests used for a single file.
+        """
+        self._max_workers = max_workers
+        self._max_concurrency = max_concurrency
+
+    def _get_progress(self) -> ProgressTracker:
+        return ProgressTracker(self._progress_hook, self._progress_rate, self._progress_detailed)
+
+
+class AsyncBucketDataHandler:
+    """
+    Asynchronous class for uploading to, downloading from, and listing a bucket.
+    Unlike :class:`~reality_capture.service.data_handler.BucketDataHandler`, transfers can not be resumed: there is no
+    ``resume`` option, a failed transfer is started again from the beginning.
+    """
+
+    def __init__(self, token_factory, **kwargs) -> None:
+        """
+        Constructor method
+
+        :param token_factory: An object that implements a ``get_token() -> str`` method.
+        :type token_factory: Object
+        :param \\**kwargs: Internal parameters used only for development purposes.
+        """
+        self._service = RealityCaptureService(token_factory, **kwargs)
+        self._progress_hook = None
+        self._progress_rate = 10.0
+        self._progress_detailed = False
+        self._max_workers = 256
+        self._max_concurrency = 16
+        self._links = _LinkCache()
+
+    def _get_cached_bucket(self, itwin_id: str) -> Response[BucketResponse]:
+        return self._links.get((itwin_id,), lambda: self._service.get_bucket(itwin_id))
+
+    async def _get_bucket(self, itwin_id: str) -> Response[BucketResponse]:
+        return await asyncio.to_thread(self._get_cached_bucket, itwin_id)
+
+    def _get_bucket_refresh(self, itwin_id: str) -> Callable[[], Optional[str]]:
+        # Called in a worker thread by the credential, about once per SAS lifetime
+        def _refresh():
+            r = self._get_cached_bucket(itwin_id)
+            return None if r.is_error() else r.value.links.container_url.href
+        return _refresh
+
+    async def upload_data(self, itwin_id: str, src: str, bucket_dst: str = "", sync: bool = False,
+                          data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
+        """
+        Upload files to a bucket.
+
+        :param itwin_id: iTwin id for finding the bucket.
+        :param src: Source path to upload. If directory, all the files in the directory will be uploaded recursively.
+        :param bucket_dst: Destination of the data inside the bucket, default to root.
+        :param sync: If True, files already present in the bucket with the same size and content are skipped.
+        :param data_filter: Optional filter of the files to upload, applied while scanning the source.
+        :return: A Response[TransferResult] containing either the uploaded and skipped files
+         or the error from the service.
+        """
+        r = await self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return await _AsyncDataHandler.upload_data(r.value.links.container_url.href, src, bucket_dst,
+                                                   self._get_progress(), sync, self._max_workers,
+                                                   self._max_concurrency, self._get_bucket_refresh(itwin_id),
+                                                   data_filter)
+
+    async def download_data(self, itwin_id: str, dst: str, bucket_src: str = "", sync: bool = False,
+                            mirror: bool = False, data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
+        """
+        Download files from a bucket.
+
+        :param itwin_id: iTwin id for finding the bucket.
+        :param dst: Destination path of the downloads.
+        :param bucket_src: Source folder to download in the bucket, default to root.
+        :param sync: If True, only files missing or changed in the destination are downloaded.
+         Downloaded files are tracked in a manifest stored in the destination.
+        :param mirror: If True, files in the destination that do not exist in the source are removed.
+        :param data_filter: Optional filter of the files to download, applied while listing the source.
+         Local files left out by the filter are never removed by mirror.
+        :return: A Response[TransferResult] containing either the downloaded, skipped and deleted files
+         or the error from the service.
+        """
+        r = await self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return await _AsyncDataHandler.download_data(r.value.links.container_url.href, dst, bucket_src,
+                                                     self._get_progress(), sync, mirror, self._max_workers,
+                                                     self._max_concurrency, self._get_bucket_refresh(itwin_id),
+                                                     data_filter)
+
+    async def list_data(self, itwin_id: str, prefix: str = "",
+                        data_filter: Optional[DataFilter] = None) -> Response[list[str]]:
+        """
+        List all the files inside a bucket.
+
+        :param itwin_id: iTwin id for finding the bucket.
+        :param prefix: Only list the files whose name starts with this prefix, default to all files.
+        :param data_filter: Optional filter of the files to list, paths are relative to the prefix.
+        :return: A Response[list[str]] containing either the files in the bucket or the error from the service.
+        """
+        r = await self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return await _AsyncDataHandler.list_data(r.value.links.container_url.href, prefix,
+                                                 self._get_bucket_refresh(itwin_id), data_filter)
+
+    async def iter_data(self, itwin_id: str, prefix: str = "") -> Response[AsyncIterator[DataInfo]]:
+        """
+        Iterate over the files inside a bucket.
+        Files are listed page by page while iterating, the whole listing is never kept in memory.
+
+        :param itwin_id: iTwin id for finding the bucket.
+        :param prefix: Only list the files whose name starts with this prefix, default to all files.
+        :return: A Response[AsyncIterator[DataInfo]] containing either an asynchronous iterator over the files
+         in the bucket or the error from the service.
+        """
+        r = await self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return Response(200, None, _AsyncDataHandler.iter_data(r.value.links.container_url.href, prefix,
+                                                               self._get_bucket_refresh(itwin_id)))
+
+    async def delete_data(self, itwin_id, files_to_delete: Optional[list[str]] = None,
+                          prefix: Optional[str] = None) -> Response[None]:
+        """
+        Delete specified files from a bucket.
+        Files are deleted in batches of 256, several batches running at the same time.
+
+        :param itwin_id: iTwin id for finding the bucket.
+        :param files_to_delete: List of files to delete.
+        :param prefix: If set, all the files whose name starts with the prefix are deleted as well.
+         An empty prefix deletes every file of the bucket.
+        :return: A Response[None] containing either the files in the bucket or the error from the service.
+        """
+        r = await self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return await _AsyncDataHandler.delete_data(r.value.links.container_url.href, files_to_delete or [],
+                                                   prefix, self._max_workers, self._get_bucket_refresh(itwin_id))
+
+    def set_progress_hook(self, hook: Optional, max_rate: float = 10.0, detailed: bool = False) -> None:
+        """
+        Set the progress hook.
+
+        :param hook: Function taking a float as an argument and returning a bool.
+         When returning false, the ongoing action will be cancelled. Can be None if no progress hook is needed.
+        :param max_rate: Maximum number of calls to the hook per second, 0 for no limit.
+        :param detailed: If True, the hook is called with a
+         :class:`~reality_capture.service.transfer.TransferProgress` instead of a percentage.
+        """
+        self._progress_hook = hook
+        self._progress_rate = max_rate
+        self._progress_detailed = detailed
+
+    def set_concurrency_limits(self, max_workers: int = 256, max_concurrency: int = 16) -> None:
+        """
+        Set the transfer concurrency.
+
+        :param max_workers: Maximum number of files transferred concurrently.
+        :param max_concurrency: Maximum number of concurrent requests used for a single file.
+        """
+        self._max_workers = max_workers
+        self._max_concurrency = max_concurrency
+
+    def _get_progress(self) -> ProgressTracker:
+        return ProgressTracker(self._progress_hook, self._progress_rate, self._progress_detailed)
@@ -1,81 +1,1368 @@
+import base64
+import fnmatch
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import mmap
 import os.path
-from typing import Optional
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timezone
+from typing import Optional, Iterator, Iterable, Callable, Union, BinaryIO, Any
+from urllib.parse import urlsplit, urlunsplit, parse_qs, quote
+from pydantic import BaseModel, Field, PrivateAttr
 from reality_capture.service.error import DetailedErrorResponse, DetailedError, Error
 from reality_capture.service.response import Response
 from reality_capture.service.service import RealityCaptureService
-from reality_capture.service.reality_data import RealityDataUpdate, RealityData, ContainerDetails
+from reality_capture.service.reality_data import RealityDataUpdate, RealityData, ContainerDetails, RealityDataCreate
 from reality_capture.service.bucket import BucketResponse
-from azure.storage.blob import ContainerClient
-from multiprocessing.pool import ThreadPool
+from reality_capture.service.transfer import ConcurrencyController, TransferScheduler, ProgressTracker
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ClientAuthenticationError, HttpResponseError
+from azure.core.credentials import AzureSasCredential
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import ContainerClient, BlobProperties, BlobPrefix, ContentSettings, BlobBlock
+
+
+class TransferResult(BaseModel):
+    transferred: list[str] = Field(default_factory=list, description="Files that were transferred.")
+    skipped: list[str] = Field(default_factory=list, description="Files that were skipped because an identical "
+                                                                 "copy already existed at the destination.")
+    deleted: list[str] = Field(default_factory=list, description="Local files that were removed because they no "
+                                                                 "longer exist in the source.")
+    failed: list[str] = Field(default_factory=list, description="Files that could not be transferred, even after "
+                                                                "retrying them.")
+    _retry: Optional[Callable[[], "Response[TransferResult]"]] = PrivateAttr(default=None)
+
+    def retry_failed(self) -> "Response[TransferResult]":
+        """
+        Transfer again the files that failed, with the same parameters as the transfer that returned this result.
+
+        :return: A Response[TransferResult] containing the result of the new attempt, empty if no file failed.
+        """
+        if not self.failed or self._retry is None:
+            return Response(200, None, TransferResult())
+        return self._retry()
+
+
+class DataInfo(BaseModel):
+    name: str = Field(description="Name of the file.")
+    size: int = Field(description="Size of the file in bytes.")
+    etag: str = Field(description="ETag of the file, changes each time the file is modified.")
+    md5: Optional[str] = Field(default=None, description="Hexadecimal MD5 hash of the content, if known.")
+    last_modified: Optional[datetime] = Field(default=None, description="Date of the last modification.")
+
+
+class DataFilter(BaseModel):
+    include: list[str] = Field(default_factory=list, description="Glob patterns of the files to transfer, all the "
+                                                                 "files if empty. Patterns without a slash match the "
+                                                                 "name of a file, the others match its path relative "
+                                                                 "to the source, folder by folder: '*' does not "
+                                                                 "cross slashes, a '**' folder matches any number "
+                                                                 "of folders, e.g. 'tiles/**/*.b3dm'.")
+    exclude: list[str] = Field(default_factory=list, description="Glob patterns of the files to leave out, matched "
+                                                                 "like include ones.")
+    extensions: list[str] = Field(default_factory=list, description="Extensions of the files to transfer, case "
+                                                                    "insensitive, e.g. ['.las', '.laz']. All the "
+                                                                    "extensions if empty.")
+    min_size: Optional[int] = Field(default=None, description="Minimum size of the files in bytes.")
+    max_size: Optional[int] = Field(default=None, description="Maximum size of the files in bytes.")
+    modified_since: Optional[datetime] = Field(default=None, description="Only transfer the files modified after "
+                                                                         "this date, local time if naive.")
+
+    @staticmethod
+    def _match_parts(parts: list[str], pattern_parts: list[str]) -> bool:
+        if not pattern_parts:
+            return not parts
+        if pattern_parts[0] == "**":
+            return any(DataFilter._match_parts(parts[i:], pattern_parts[1:]) for i in range(len(parts) + 1))
+        return bool(parts) and fnmatch.fnmatchcase(parts[0], pattern_parts[0]) and \
+            DataFilter._match_parts(parts[1:], pattern_parts[1:])
+
+    @staticmethod
+    def _match(path: str, patterns: list[str]) -> bool:
+        # fnmatch alone lets '*' cross slashes, paths are matched one folder at a time instead
+        parts = path.split("/")
+        return any(DataFilter._match_parts(parts, pattern.split("/")) if "/" in pattern
+                   else fnmatch.fnmatchcase(parts[-1], pattern) for pattern in patterns)
+
+    def matches(self, path: str, size: int, last_modified: Optional[datetime]) -> bool:
+        """
+        Check if a file passes the filter.
+
+        :param path: Path of the file relative to the source, with slash separators.
+        :param size: Size of the file in bytes.
+        :param last_modified: Date of the last modification of the file, if known.
+        :return: True if the file passes all the criteria of the filter.
+        """
+        if self.include and not self._match(path, self.include):
+            return False
+        if self.exclude and self._match(path, self.exclude):
+            return False
+        if self.extensions and not path.lower().endswith(tuple("." + e.lower().lstrip(".") for e in self.extensions)):
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.modified_since is not None:
+            since = self.modified_since if self.modified_since.tzinfo is not None else self.modified_since.astimezone()
+            if last_modified is None or last_modified < since:
+                return False
+        return True
+
+
+class UploadTarget(BaseModel):
+    src: str = Field(description="Source path to upload. If directory, all the files in the directory are uploaded "
+                                 "recursively.")
+    reality_data: Union[str, RealityDataCreate] = Field(description="Id of an existing reality data, or the reality "
+                                                                    "data to create.")
+    dst: str = Field(default="", description="Destination of the data inside the reality data, default to root.")
+    itwin_id: Optional[str] = Field(default=None, description="Optional iTwin id for finding the reality data.")
+
+
+class UploadTargetResult(BaseModel):
+    reality_data_id: Optional[str] = Field(default=None, description="Id of the reality data, None if it could not "
+                                                                     "be created.")
+    status_code: int = Field(description="Status code of the upload to this target.")
+    result: Optional[TransferResult] = Field(default=None, description="Uploaded and skipped files, if the upload "
+                                                                       "succeeded.")
+    error: Optional[DetailedErrorResponse] = Field(default=None, description="Error, if the upload failed.")
+
+
+def _get_sas_expiry(container_url: str) -> Optional[float]:
+    # The expiry of a SAS is given by its signed expiry field, e.g. se=2025-01-01T00%3A00%3A00Z
+    values = parse_qs(urlsplit(container_url).query).get("se")
+    if not values:
+        return None
+    try:
+        expiry = datetime.fromisoformat(values[0].replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    return expiry.timestamp()
+
+
+class _LinkCache:
+    """
+    Container links of a handler, kept until shortly before their SAS expires.
+    """
+
+    def __init__(self, margin: float = 300.0) -> None:
+        self._margin = margin
+        self._links = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, fetch: Callable[[], Response]) -> Response:
+        # Fetches are serialized so that concurrent calls for an expired link only renew it once
+        with self._lock:
+            entry = self._links.get(key)
+            if entry is not None and entry[1] - time.time() > self._margin:
+                return Response(200, None, entry[0])
+            r = fetch()
+            if r.is_error():
+                self._links.pop(key, None)
+                return r
+            expiry = _get_sas_expiry(r.value.links.container_url.href)
+            if expiry is not None:
+                self._links[key] = (r.value, expiry)
+            return r
+
+
+class _SasCredential(AzureSasCredential):
+    """
+    SAS of a container, renewed shortly before it expires.
+    The storage pipeline reads the signature before each request, transfers in progress use the renewed one.
+    """
+
+    def __init__(self, container_url: str, refresh: Callable[[], Optional[str]], margin: float = 300.0) -> None:
+        super().__init__(urlsplit(container_url).query)
+        self._expiry = _get_sas_expiry(container_url)
+        self._refresh = refresh
+        self._margin = margin
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def _expires_soon(self) -> bool:
+        return self._expiry is not None and self._expiry - time.time() < self._margin
+
+    def _renew(self) -> None:
+        with self._lock:
+            now = time.time()
+            # Do not ask the service for a new link at every request if it can not provide a longer one
+            if self._expiry - now < self._margin and now - self._last_refresh > 10.0:
+                self._last_refresh = now
+                try:
+                    container_url = self._refresh()
+                except Exception as _:
+                    container_url = None
+                if container_url:
+                    self.update(urlsplit(container_url).query)
+                    self._expiry = _get_sas_expiry(container_url)
+
+    @property
+    def signature(self) -> str:
+        if self._expires_soon():
+            self._renew()
+        return self._signature
+
+
+class _BufferReader(io.RawIOBase):
+    """
+    Read-only stream over a buffer. Reads copy the requested bytes only, never the whole buffer.
+    """
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview]) -> None:
+        super().__init__()
+        view = memoryview(buffer)
+        # A non-contiguous view has no flat layout to read from, it is the only case the buffer is copied
+        self._view = view.cast("B") if view.c_contiguous else memoryview(view.tobytes())
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def readinto(self, b) -> int:
+        data = self._view[self._position:self._position + len(b)]
+        memoryview(b).cast("B")[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._position + size)
+        data = self._view[self._position:end].tobytes()
+        self._position = max(self._position, end)
+        return data
+
+
+class RemoteFile(io.RawIOBase):
+    """
+    Read-only, seekable file object over a file of a reality data or of a bucket.
+    Data is fetched with ranged requests by blocks, the most recently used blocks are kept in memory and the next
+    block is fetched in advance while reading sequentially. Reads fail if the file is modified after opening.
+    Files are opened with :meth:`RealityDataHandler.open_data` and :meth:`BucketDataHandler.open_data`,
+    usually as context managers.
+    """
+
+    def __init__(self, client: ContainerClient, name: str, size: int, etag: str, block_size: int = 1024 * 1024,
+                 cache_blocks: int = 16) -> None:
+        """
+        Constructor method
+
+        :param client: Client of the container, closed with the file.
+        :param name: Name of the file in the container.
+        :param size: Size of the file in bytes.
+        :param etag: ETag of the file when it was opened.
+        :param block_size: Size of the blocks fetched from the service.
+        :param cache_blocks: Maximum number of blocks kept in memory.
+        """
+        super().__init__()
+        self.name = name
+        self.size = size
+        self.etag = etag
+        self._client = client
+        self._block_size = block_size
+        self._cache_blocks = max(2, cache_blocks)
+        self._position = 0
+        self._blocks = OrderedDict()
+        self._pending: dict[int, Future] = {}
+        self._last_block = -1
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def _fetch(self, index: int) -> bytes:
+        start = index * self._block_size
+        downloader = self._client.download_blob(self.name, offset=start,
+                                                length=min(self._block_size, self.size - start),
+                                                etag=self.etag, match_condition=MatchConditions.IfNotModified,
+                                                connection_timeout=60, retry_total=20, retry_connect=10)
+        return downloader.readall()
+
+    def _read_ahead(self, index: int) -> None:
+        # Only sequential reads are worth anticipating, random accesses would waste a request per block
+        sequential = index == self._last_block + 1
+        self._last_block = index
+        following = index + 1
+        if not sequential or following * self._block_size >= self.size:
+            return
+        with self._lock:
+            if following in self._blocks or following in self._pending:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reality_capture_read_ahead")
+            self._pending[following] = self._executor.submit(self._fetch, following)
+
+    def _get_block(self, index: int) -> bytes:
+        with self._lock:
+            block = self._blocks.get(index)
+            if block is not None:
+                self._blocks.move_to_end(index)
+            future = self._pending.pop(index, None)
+        if block is None:
+            block = future.result() if future is not None else self._fetch(index)
+            with self._lock:
+                self._blocks[index] = block
+                while len(self._blocks) > self._cache_blocks:
+                    self._blocks.popitem(last=False)
+        self._read_ahead(index)
+        return block
+
+    def readinto(self, b) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        view = memoryview(b).cast("B")
+        n = 0
+        while n < len(view) and self._position < self.size:
+            index, offset = divmod(self._position, self._block_size)
+            data = memoryview(self._get_block(index))[offset:offset + len(view) - n]
+            view[n:n + len(data)] = data
+            n += len(data)
+            self._position += len(data)
+        return n
+
+    def readall(self) -> bytes:
+        data = bytearray(max(0, self.size - self._position))
+        return bytes(data[:self.readinto(data)])
+
+    def close(self) -> None:
+        if not self.closed:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            self._blocks.clear()
+            self._pending.clear()
+            self._client.close()
+        super().close()
+
+
+class _SplitFile:
+    """
+    File transferred by parts of a block, the parts running on different workers.
+    The first part to run prepares the transfer of the file, the last one to complete finishes it.
+    """
+
+    def __init__(self, item: Any, size: int, part_size: int) -> None:
+        self.item = item
+        self.size = size
+        self.part_size = part_size
+        self.nb_parts = max(1, -(-size // part_size))
+        self.prepared = False
+        self.value = None
+        self.finished = False
+        self.error = None
+        self.handle = None
+        self._done = 0
+        self._remaining = self.nb_parts
+        self._lock = threading.Lock()
+
+    def get_range(self, index: int) -> (int, int):
+        start = index * self.part_size
+        return start, min(self.part_size, self.size - start)
+
+    def prepare(self, fn: Callable[[], Any]) -> Any:
+        # The other parts wait for the preparation, it is run again by the next part if it failed
+        with self._lock:
+            if not self.prepared:
+                self.value = fn()
+                self.prepared = True
+            return self.value
+
+    def complete_part(self, nb_bytes: int) -> (int, bool):
+        with self._lock:
+            self._done += nb_bytes
+            self._remaining -= 1
+            self.finished = self._remaining == 0
+            return self._done, self.finished
+
+    def fail(self, error: Exception) -> (int, bool):
+        # The file fails as a whole, the error is raised by its last part
+        with self._lock:
+            self.error = self.error or error
+        return self.complete_part(0)
+
+
+class _RangeWriter:
+    """
+    File written by ranges from several threads at once, allocated to its final size when opened.
+    Writes give their offset and do not share a file position: they use ``os.pwrite`` where it exists, and are
+    serialized around a seek elsewhere, e.g. on Windows.
+    """
+
+    _PWRITE = hasattr(os, "pwrite")
+
+    def __init__(self, file_path: str, size: int, truncate: bool = True) -> None:
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0) | (os.O_TRUNC if truncate else 0)
+        self._fd = os.open(file_path, flags, 0o666)
+        self._lock = threading.Lock()
+        try:
+            os.ftruncate(self._fd, size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def write_at(self, data: Union[bytes, bytearray, memoryview], offset: int) -> int:
+        view = memoryview(data).cast("B")
+        size = len(view)
+        if self._PWRITE:
+            while view:
+                written = os.pwrite(self._fd, view, offset)
+                view = view[written:]
+                offset += written
+            return size
+        with self._lock:
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            while view:
+                view = view[os.write(self._fd, view):]
+        return size
+
+    def open_at(self, offset: int) -> "_RangeStream":
+        return _RangeStream(self, offset)
+
+    def sync(self) -> None:
+        os.fsync(self._fd)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class _RangeStream(io.RawIOBase):
+    """
+    Writable stream over a _RangeWriter, starting at an offset and with its own position.
+    """
+
+    def __init__(self, writer: _RangeWriter, offset: int) -> None:
+        super().__init__()
+        self._writer = writer
+        self._position = offset
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        written = self._writer.write_at(b, self._position)
+        self._position += written
+        return written
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Range streams can only seek from their start or current position")
+        self._position = offset
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
 
 
 class _DataHandler:
+    _CHUNK_SIZE = 4 * 1024 * 1024  # 4mb
+    _SYNC_MANIFEST = ".reality_capture_sync.json"
+    _BLOCK_SIZE = 8 * 1024 * 1024  # 8mb
+    _JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".reality_capture", "journal")
+    _DELETE_BATCH_SIZE = 256  # maximum number of sub-requests in a blob batch
+    _LIST_DEPTH = 2  # number of folder levels walked to split a listing in concurrent ones
+    _LIST_WORKERS = 16
+    _SMALL_FILE_SIZE = 5 * 1024 * 1024  # 5mb
+    _SPLIT_SIZE = 256 * 1024 * 1024  # 256mb, files above are transferred by blocks spread over all the workers
+    _COPY_POLL_INTERVAL = 0.5  # first delay between two checks of a pending server-side copy, doubled up to 5s
+    _COPY_SOURCE_ERRORS = {"CannotVerifyCopySource"}
+    _FILE_RETRIES = 3  # rounds of retries of the files that failed, once the whole transfer was attempted
+    _RETRY_DELAY = 1.0  # delay before the first round of retries, doubled for each following round
+    _TARGET_BLOCKS = 256  # number of blocks of an upload above which blocks are made larger
+    _MAX_UPLOAD_BLOCK_SIZE = 64 * 1024 * 1024  # 64mb
+    _MAX_BLOCKS = 50000  # maximum number of blocks of a blob
+    _MAP_SIZE = 4 * 1024 * 1024 * 1024  # 4gb, files above are uploaded from a memory map instead of buffers
+
     @staticmethod
-    def _get_files_and_sizes(path: str) -> list[(str, int)]:
-        if os.path.isdir(path):
-            files_tuple = [
-                (
-                    os.path.relpath(os.path.join(dp, f), path),
-                    os.path.getsize(os.path.join(dp, f)),
-                )
-                for dp, dn, filenames in os.walk(path)
-                for f in filenames
-            ]
+    def _get_files_and_sizes(path: str, data_filter: Optional[DataFilter] = None) -> list[(str, int)]:
+        return list(_DataHandler._scan_files(path, data_filter=data_filter))
+
+    @staticmethod
+    def _is_selected(data_filter: Optional[DataFilter], path: str, size: int, mtime: Optional[float]) -> bool:
+        if data_filter is None:
+            return True
+        last_modified = datetime.fromtimestamp(mtime, tz=timezone.utc) if mtime is not None else None
+        return data_filter.matches(path.replace(os.sep, "/"), size, last_modified)
+
+    @staticmethod
+    def _scan_files(path: str, on_file: Optional[Callable[[str, int], None]] = None,
+                    data_filter: Optional[DataFilter] = None) -> Iterator[tuple[str, int]]:
+        # Sub-directories are scanned concurrently and files are yielded as soon as they are found, so that a
+        # transfer starts without waiting for the end of the scan. on_file is called by the scanning threads,
+        # ahead of the consumer.
+        if not os.path.isdir(path):
+            stat = os.stat(path)
+            if not _DataHandler._is_selected(data_filter, os.path.basename(path), stat.st_size, stat.st_mtime):
+                return
+            size = stat.st_size
+            if on_file is not None:
+                on_file(os.path.basename(path), size)
+            yield os.path.basename(path), size
+            return
+
+        def _scan(directory, visit, emit):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        # Like os.walk, links to directories are not followed
+                        if not entry.is_symlink() and not visit(entry.path):
+                            return
+                    elif entry.is_file():
+                        # Directory entries carry the size on Windows, elsewhere this is the only stat of the file
+                        stat = entry.stat()
+                        file = (os.path.relpath(entry.path, path), stat.st_size)
+                        if not _DataHandler._is_selected(data_filter, file[0], stat.st_size, stat.st_mtime):
+                            continue
+                        if on_file is not None:
+                            on_file(*file)
+                        if not emit(file):
+                            return
+
+        yield from _DataHandler._walk_parallel(_scan, path, _DataHandler._LIST_WORKERS)
+
+    @staticmethod
+    def _get_session(pool_size: int) -> requests.Session:
+        # Retries are handled by the azure pipeline, not by the adapter.
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=Retry(total=False, redirect=False, raise_on_status=False))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @staticmethod
+    def _get_container_client(container_url: str, pool_size: int,
+                              refresh_link: Optional[Callable[[], Optional[str]]] = None,
+                              session: Optional[requests.Session] = None, **kwargs) -> ContainerClient:
+        # One client, and one pool of keep-alive connections, shared by all the workers of a transfer.
+        # A session can be given to share its pool between the clients of several containers.
+        if refresh_link is not None:
+            # The SAS is given as a credential so that it can be renewed, the url must not contain it anymore
+            kwargs["credential"] = _SasCredential(container_url, refresh_link)
+            container_url = urlunsplit(urlsplit(container_url)._replace(query=""))
+        if session is None:
+            transport = RequestsTransport(session=_DataHandler._get_session(pool_size))
         else:
-            files_tuple = [(os.path.basename(path), os.path.getsize(path))]
-        return files_tuple
+            transport = RequestsTransport(session=session, session_owner=False)
+        return ContainerClient.from_container_url(container_url, transport=transport, **kwargs)
+
+    @staticmethod
+    def _get_md5(path: str) -> bytes:
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_DataHandler._CHUNK_SIZE), b""):
+                md5.update(chunk)
+        return md5.digest()
+
+    @staticmethod
+    def _walk_parallel(walk: Callable, root, max_workers: int) -> Iterator:
+        # walk(node, visit, emit) lists a node, calls visit(child) for each child node to list concurrently and
+        # emit(item) for each item found; both return False once the consumer stopped. Items are yielded as they
+        # are found, the first error is raised to the consumer.
+        results = queue.Queue(maxsize=10000)
+        stopped = threading.Event()
+        lock = threading.Lock()
+        pending = 1
+        done = object()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        def _put(item):
+            while not stopped.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def _visit(node):
+            nonlocal pending
+            if stopped.is_set():
+                return False
+            with lock:
+                pending += 1
+            executor.submit(_walk, node)
+            return True
+
+        def _walk(node):
+            nonlocal pending
+            try:
+                walk(node, _visit, _put)
+            except BaseException as e:
+                _put(e)
+            finally:
+                with lock:
+                    pending -= 1
+                    if pending == 0:
+                        _put(done)
+
+        try:
+            executor.submit(_walk, root)
+            while True:
+                item = results.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _walk_blobs(client: ContainerClient, prefix: str,
+                    data_filter: Optional[DataFilter] = None) -> Iterator[BlobProperties]:
+        # A listing is a serial chain of pages. The first folder levels are walked with a delimiter,
+        # then each folder found at the last level is listed on its own, all of them concurrently.
+        # Filtered out blobs are dropped by the listing threads, paths are relative to the prefix.
+        def _list(node, visit, emit):
+            name_prefix, depth = node
+            if depth < _DataHandler._LIST_DEPTH:
+                items = client.walk_blobs(name_starts_with=name_prefix or None, delimiter="/")
+            else:
+                items = client.list_blobs(name_starts_with=name_prefix or None)
+            for item in items:
+                if isinstance(item, BlobPrefix):
+                    if not visit((item.name, depth + 1)):
+                        return
+                elif data_filter is not None and not data_filter.matches(
+                        _DataHandler._get_copy_name(item.name, prefix, ""), item.size, item.last_modified):
+                    continue
+                elif not emit(item):
+                    return
+
+        return _DataHandler._walk_parallel(_list, (prefix, 0), _DataHandler._LIST_WORKERS)
+
+    @staticmethod
+    def _list_blobs(client: ContainerClient, prefix: str,
+                    data_filter: Optional[DataFilter] = None) -> dict[str, BlobProperties]:
+        return {blob.name: blob for blob in _DataHandler._walk_blobs(client, prefix, data_filter)}
+
+    @staticmethod
+    def _is_uploaded(file_path: str, size: int, blob: Optional[BlobProperties]) -> bool:
+        if blob is None or blob.size != size:
+            return False
+        content_md5 = blob.content_settings.content_md5 if blob.content_settings is not None else None
+        if content_md5:
+            return bytes(content_md5) == _DataHandler._get_md5(file_path)
+        # Without a hash to compare, consider the blob up-to-date if it was written after the local file
+        return blob.last_modified is not None and blob.last_modified.timestamp() >= os.path.getmtime(file_path)
+
+    @staticmethod
+    def _get_download_path(blob_name: str, src: str, dst: str) -> str:
+        rel_path = blob_name.removeprefix(src) if src != blob_name else os.path.basename(src)
+        rel_path = rel_path.strip('/')
+        return os.path.join(dst, rel_path)
+
+    @staticmethod
+    def _read_manifest(dst: str) -> dict[str, dict]:
+        try:
+            with open(os.path.join(dst, _DataHandler._SYNC_MANIFEST), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_manifest(dst: str, manifest: dict[str, dict]) -> None:
+        manifest_path = os.path.join(dst, _DataHandler._SYNC_MANIFEST)
+        os.makedirs(dst, exist_ok=True)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    @staticmethod
+    def _is_downloaded(file_path: str, blob: BlobProperties, entry: Optional[dict]) -> bool:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if stat.st_size != blob.size:
+            return False
+        if entry is not None and entry.get("etag") == blob.etag and entry.get("mtime") == stat.st_mtime:
+            return True
+        content_md5 = blob.content_settings.content_md5 if blob.content_settings is not None else None
+        if content_md5:
+            return bytes(content_md5) == _DataHandler._get_md5(file_path)
+        # Without a hash to compare, consider the local file up-to-date if it was written after the blob
+        return entry is None and blob.last_modified is not None and stat.st_mtime >= blob.last_modified.timestamp()
+
+    @staticmethod
+    def _remove_extra_files(dst: str, expected: set[str], data_filter: Optional[DataFilter] = None) -> list[str]:
+        deleted = []
+        for dp, dn, filenames in os.walk(dst, topdown=False):
+            for f in filenames:
+                file_path = os.path.join(dp, f)
+                if os.path.normpath(file_path) in expected or f == _DataHandler._SYNC_MANIFEST:
+                    continue
+                # Files left out by the filter are not part of the mirror, they are kept
+                stat = os.stat(file_path)
+                if _DataHandler._is_selected(data_filter, os.path.relpath(file_path, dst), stat.st_size,
+                                             stat.st_mtime):
+                    os.remove(file_path)
+                    deleted.append(os.path.relpath(file_path, dst))
+            if dp != dst and not os.listdir(dp):
+                os.rmdir(dp)
+        return sorted(deleted)
+
+    @staticmethod
+    def _get_block_id(index: int) -> str:
+        # Block ids must all have the same length inside a blob
+        return base64.b64encode(f"{index:08d}".encode()).decode()
+
+    @staticmethod
+    def _get_journal_path(container_url: str, blob_name: str, file_path: str) -> str:
+        # The SAS token changes between calls, only the container location identifies the destination
+        url = urlsplit(container_url)
+        key = f"{url.netloc}{url.path}|{blob_name}|{os.path.abspath(file_path)}"
+        return os.path.join(_DataHandler._JOURNAL_DIR, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    @staticmethod
+    def _upload_blocks(client: ContainerClient, container_url: str, blob_name: str, file_path: str, size: int,
+                       upload_callback, content_settings: Optional[ContentSettings], concurrency: int = 1,
+                       mapped: bool = False) -> None:
+        block_size = _DataHandler._BLOCK_SIZE
+        mtime = os.path.getmtime(file_path)
+        journal_path = _DataHandler._get_journal_path(container_url, blob_name, file_path)
+        journal = {}
+        try:
+            with open(journal_path, "r") as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            pass
+        blob_client = client.get_blob_client(blob_name)
+        staged = set()
+        if (journal.get("size") == size and journal.get("mtime") == mtime and
+                journal.get("block_size") == block_size and journal.get("blocks")):
+            # Only trust blocks the service still holds, uncommitted blocks are discarded after a week
+            try:
+                _, uncommitted = blob_client.get_block_list("uncommitted")
+            except ResourceNotFoundError:
+                # The blob no longer exists with its uncommitted blocks, the upload starts over
+                uncommitted = []
+            available = {block.id for block in uncommitted}
+            staged = {i for i in journal["blocks"] if _DataHandler._get_block_id(i) in available}
+
+        nb_blocks = max(1, -(-size // block_size))
+        uploaded = sum(min(block_size, size - i * block_size) for i in staged)
+        upload_callback(uploaded, size)
+        os.makedirs(_DataHandler._JOURNAL_DIR, exist_ok=True)
+
+        def _on_staged(index):
+            # The journal lists blocks in any order, the missing ones are staged concurrently
+            staged.add(index)
+            with open(journal_path, "w") as f:
+                json.dump({"size": size, "mtime": mtime, "block_size": block_size, "blocks": sorted(staged)}, f)
+
+        _DataHandler._stage_blocks(blob_client, file_path, size, block_size,
+                                   [i for i in range(nb_blocks) if i not in staged], uploaded, upload_callback,
+                                   concurrency, mapped, _on_staged)
+        blob_client.commit_block_list([BlobBlock(block_id=_DataHandler._get_block_id(i)) for i in range(nb_blocks)],
+                                      content_settings=content_settings)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+
+    @staticmethod
+    def _get_block_size(size: int) -> int:
+        # Larger files are staged by larger blocks, fewer requests cost less per byte sent. A file that fits in a
+        # single block is sent with a single request.
+        block_size = _DataHandler._CHUNK_SIZE
+        while (-(-size // block_size) > _DataHandler._TARGET_BLOCKS and
+               block_size < _DataHandler._MAX_UPLOAD_BLOCK_SIZE):
+            block_size *= 2
+        return max(block_size, -(-size // _DataHandler._MAX_BLOCKS))
+
+    @staticmethod
+    def _can_map(file_path: str) -> bool:
+        # Mapping a file only reserves addresses, no data is read
+        try:
+            with open(file_path, "rb") as file:
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ).close()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    @staticmethod
+    def _use_map(file_path: str, size: int) -> bool:
+        # Only very large files are mapped: a mapped file truncated during the upload ends the process, while a
+        # buffered read fails the upload, which can be retried
+        return size > _DataHandler._MAP_SIZE and _DataHandler._can_map(file_path)
+
+    @staticmethod
+    @contextmanager
+    def _read_range(file_path: str, offset: int, length: int) -> Iterator[memoryview]:
+        data = bytearray(length)
+        with open(file_path, "rb") as file:
+            file.seek(offset)
+            if file.readinto(data) < length:
+                raise OSError(f"{file_path} was truncated during the upload")
+        yield memoryview(data)
+
+    @staticmethod
+    @contextmanager
+    def _map_range(file_path: str, offset: int, length: int) -> Iterator[memoryview]:
+        # Blocks are sent from the pages of the mapped file, the transport writes them to the socket without copying
+        # them to a buffer first. A file truncated while it is mapped cannot be read anymore: the system ends the
+        # process instead of raising an error.
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        with open(file_path, "rb") as file:
+            try:
+                mapped = mmap.mmap(file.fileno(), offset + length - start, offset=start, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                mapped = None
+        if mapped is None:
+            # Some files cannot be mapped, e.g. on some network file systems, their range is read instead.
+            # Ranges are single blocks, the caller accounts for them in its budget.
+            with _DataHandler._read_range(file_path, offset, length) as data:
+                yield data
+            return
+        try:
+            with memoryview(mapped) as view:
+                yield view[offset - start:]
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                # A slice of the map is still referenced, the map is released with it
+                pass
+
+    @staticmethod
+    def _stage_blocks(blob_client, file_path: str, size: int, block_size: int, indexes: list[int],
+                      uploaded: int, upload_callback, concurrency: int, mapped: bool,
+                      on_staged: Optional[Callable[[int], None]] = None) -> None:
+        # Blocks are staged concurrently, each one from its own mapped range if mapped, else from its own buffer.
+        # on_staged is called, under a lock, once a block is staged.
+        read_range = _DataHandler._map_range if mapped else _DataHandler._read_range
+        lock = threading.Lock()
+        failed = threading.Event()
+
+        def _stage(index):
+            nonlocal uploaded
+            # The remaining blocks are not sent once one of them failed
+            if failed.is_set():
+                return
+            offset = index * block_size
+            length = min(block_size, size - offset)
+            try:
+                with read_range(file_path, offset, length) as block:
+                    blob_client.stage_block(_DataHandler._get_block_id(index), block, length=length,
+                                            connection_timeout=60, retry_total=20, retry_connect=10)
+                with lock:
+                    if on_staged is not None:
+                        on_staged(index)
+                    uploaded += length
+                    upload_callback(uploaded, size)
+            except BaseException:
+                failed.set()
+                raise
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = [executor.submit(_stage, index) for index in indexes]
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def _upload_mapped(client: ContainerClient, blob_name: str, file_path: str, size: int, upload_callback,
+                       content_settings: Optional[ContentSettings], concurrency: int) -> None:
+        block_size = _DataHandler._get_block_size(size)
+        nb_blocks = -(-size // block_size)
+        blob_client = client.get_blob_client(blob_name)
+        _DataHandler._stage_blocks(blob_client, file_path, size, block_size, list(range(nb_blocks)), 0,
+                                   upload_callback, concurrency, True)
+        blob_client.commit_block_list([BlobBlock(block_id=_DataHandler._get_block_id(i)) for i in range(nb_blocks)],
+                                      content_settings=content_settings)
+
+    @staticmethod
+    def _download_ranges(client: ContainerClient, blob: BlobProperties, file_path: str, download_callback,
+                         max_concurrency: int) -> None:
+        range_size = _DataHandler._BLOCK_SIZE
+        part_path = file_path + ".part"
+        journal_path = part_path + ".json"
+        journal = {}
+        try:
+            with open(journal_path, "r") as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            pass
+        ranges = []
+        if (os.path.exists(part_path) and journal.get("etag") == blob.etag and journal.get("size") == blob.size and
+                journal.get("range_size") == range_size):
+            ranges = journal.get("ranges", [])
+        completed = {start for start, _ in ranges}
+
+        downloaded = sum(end - start for start, end in ranges)
+        download_callback(downloaded, blob.size)
+        # Ranges are downloaded concurrently, each one by a single connection, and written in place in the file
+        lock = threading.Lock()
+        failed = threading.Event()
+        progress = {}
+
+        def _download_range(part, start):
+            nonlocal downloaded
+            # The remaining ranges are not downloaded once one of them failed
+            if failed.is_set():
+                return
+            length = min(range_size, blob.size - start)
+
+            def _range_callback(current, _):
+                with lock:
+                    progress[start] = current
+                    download_callback(downloaded + sum(progress.values()), blob.size)
+
+            try:
+                # Fail rather than mix two versions of the blob if it is modified during the download
+                downloader = client.download_blob(
+                    blob.name,
+                    offset=start,
+                    length=length,
+                    etag=blob.etag,
+                    match_condition=MatchConditions.IfNotModified,
+                    connection_timeout=60,
+                    max_concurrency=1,
+                    retry_total=20,
+                    retry_connect=10,
+                    progress_hook=_range_callback,
+                )
+                downloader.readinto(part.open_at(start))
+                # Data must be on disk before the range is recorded as completed
+                part.sync()
+                with lock:
+                    ranges.append([start, start + length])
+                    with open(journal_path, "w") as f:
+                        json.dump({"etag": blob.etag, "size": blob.size, "range_size": range_size,
+                                   "ranges": sorted(ranges)}, f)
+                    progress.pop(start, None)
+                    downloaded += length
+                    download_callback(downloaded + sum(progress.values()), blob.size)
+            except BaseException:
+                failed.set()
+                raise
+
+        part = _RangeWriter(part_path, blob.size, not ranges)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+                futures = [executor.submit(_download_range, part, start) for start in range(0, blob.size, range_size)
+                           if start not in completed]
+                for future in futures:
+                    future.result()
+        finally:
+            part.close()
+        os.replace(part_path, file_path)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+
+    @staticmethod
+    def _get_budget(size: int, concurrency: int) -> (int, int):
+        # A transfer opens at most one connection per chunk and buffers at most one chunk per connection
+        connections = max(1, min(concurrency, -(-size // _DataHandler._CHUNK_SIZE)))
+        return min(size, connections * _DataHandler._CHUNK_SIZE), connections
 
     @staticmethod
     def _get_nb_threads(files: list[(str, int)]) -> int:
-        size_threshold = 5 * 1024 * 1024  # 5mb
-        nb_small_files = sum(size <= size_threshold for _, size in files)
+        nb_small_files = sum(size <= _DataHandler._SMALL_FILE_SIZE for _, size in files)
+        return _DataHandler._get_nb_threads_for(nb_small_files)
+
+    @staticmethod
+    def _get_nb_threads_for(nb_small_files: int) -> int:
         return min(32, 4 + nb_small_files // 100)  # control number of threads considering quantity of files
 
     @staticmethod
-    def download_data(container_url: str, dst: str, src: str, progress_hook):
-        sas_uri = container_url
-        client = ContainerClient.from_container_url(sas_uri)
-        blobs_tuple = [(blob.name, blob.size) for blob in client.list_blobs()
-                       if blob.name.startswith(src)]
+    def _order_by_size(items: Iterable, size_of: Callable[[Any], int]) -> Iterator:
+        # Longest processing time first: the largest files start first so that none of them is left running alone at
+        # the end of the transfer, and small files are interleaved with them to keep the workers busy meanwhile.
+        # Items still produced by a scan are ordered among the ones found so far.
+        cond = threading.Condition()
+        large = []
+        small = deque()
+        order = itertools.count()
+        stopped = threading.Event()
+        finished = False
+        errors = []
+
+        def _add(item):
+            size = size_of(item)
+            if size > _DataHandler._SMALL_FILE_SIZE:
+                heapq.heappush(large, (-size, next(order), item))
+            else:
+                small.append(item)
+
+        def _feed():
+            nonlocal finished
+            try:
+                for item in items:
+                    if stopped.is_set():
+                        break
+                    with cond:
+                        _add(item)
+                        cond.notify()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                if hasattr(items, "close"):
+                    items.close()
+                with cond:
+                    finished = True
+                    cond.notify()
+
+        if isinstance(items, (list, tuple)):
+            for item in items:
+                _add(item)
+            finished = True
+        else:
+            threading.Thread(target=_feed, daemon=True, name="reality_capture_order").start()
+        take_small = False
+        try:
+            while True:
+                with cond:
+                    cond.wait_for(lambda: large or small or finished or errors)
+                    if errors:
+                        raise errors[0]
+                    if not large and not small:
+                        return
+                    if small and (take_small or not large):
+                        item = small.popleft()
+                    else:
+                        item = heapq.heappop(large)[2]
+                    take_small = not take_small
+                yield item
+        finally:
+            stopped.set()
+
+    @staticmethod
+    def _split_large(items: Iterable, size_of: Callable[[Any], int], splits: list[_SplitFile],
+                     split: bool = True, part_size: Optional[Callable[[int], int]] = None
+                     ) -> Iterator[tuple[Any, Optional[_SplitFile], int]]:
+        # A very large file is transferred by blocks so that all the workers share it, instead of it being the last
+        # one running with the concurrency of a single file. part_size gives the size of the blocks of a file,
+        # by default _BLOCK_SIZE.
+        for item in items:
+            size = size_of(item)
+            if not split or size <= _DataHandler._SPLIT_SIZE:
+                yield item, None, 0
+                continue
+            split_file = _SplitFile(item, size, part_size(size) if part_size else _DataHandler._BLOCK_SIZE)
+            splits.append(split_file)
+            for index in range(split_file.nb_parts):
+                yield item, split_file, index
+
+    @staticmethod
+    def _upload_part(client: ContainerClient, file_path: str, blob_name: str, key: str, split: _SplitFile,
+                     index: int, progress: ProgressTracker, remote_blob: Optional[BlobProperties], sync: bool,
+                     controller: ConcurrencyController, scheduler: TransferScheduler) -> Optional[bool]:
+        # Returns None while other parts of the file are running, then False if the file was skipped, True if uploaded
+        def _prepare():
+            if not sync:
+                return False, None
+            if _DataHandler._is_uploaded(file_path, split.size, remote_blob):
+                return True, None
+            return False, ContentSettings(content_md5=bytearray(_DataHandler._get_md5(file_path)))
+
+        skipped = False
+        try:
+            # Once a part failed the file is failed, its other parts do not transfer anything
+            if split.error is not None:
+                raise split.error
+            skipped, content_settings = split.prepare(_prepare)
+            offset, length = split.get_range(index)
+            if not skipped:
+                # The block of a very large file is sent from the mapped file, the others are buffered
+                mapped = _DataHandler._use_map(file_path, split.size)
+                read_range = _DataHandler._map_range if mapped else _DataHandler._read_range
+                with scheduler.reserve(0 if mapped else length, 1):
+                    start = time.monotonic()
+                    with read_range(file_path, offset, length) as block:
+                        client.get_blob_client(blob_name).stage_block(_DataHandler._get_block_id(index), block,
+                                                                      length=length, connection_timeout=60,
+                                                                      retry_total=20, retry_connect=10)
+                    controller.record(length, time.monotonic() - start)
+        except InterruptedError:
+            raise
+        except Exception as e:
+            done, last = split.fail(e)
+        else:
+            done, last = split.complete_part(0 if skipped else length)
+        if not last:
+            if not skipped and split.error is None:
+                progress.update(key, done)
+            return None
+        if split.error is not None:
+            raise split.error
+        if skipped:
+            progress.skip(key, split.size)
+            return False
+        client.get_blob_client(blob_name).commit_block_list(
+            [BlobBlock(block_id=_DataHandler._get_block_id(i)) for i in range(split.nb_parts)],
+            content_settings=content_settings)
+        progress.complete(key, split.size)
+        return True
+
+    @staticmethod
+    def _download_part(client: ContainerClient, blob: BlobProperties, file_path: str, split: _SplitFile, index: int,
+                       progress: ProgressTracker, entry: Optional[dict], sync: bool,
+                       controller: ConcurrencyController, scheduler: TransferScheduler) -> Optional[bool]:
+        # Returns None while other parts of the file are running, then False if the file was skipped, True if
+        # downloaded. Parts are written in place in a ``.part`` file allocated to the size of the blob, moved to the
+        # destination once all of them completed: a stopped download never leaves a file of the right size behind.
+        part_path = file_path + ".part"
+
+        def _prepare():
+            if sync and _DataHandler._is_downloaded(file_path, blob, entry):
+                return True
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            split.handle = _RangeWriter(part_path, blob.size)
+            return False
+
+        skipped = False
+        try:
+            # Once a part failed the file is failed, its other parts do not transfer anything
+            if split.error is not None:
+                raise split.error
+            skipped = split.prepare(_prepare)
+            offset, length = split.get_range(index)
+            if not skipped:
+                # The part is streamed to the file chunk by chunk, at most a chunk is buffered
+                with scheduler.reserve(min(length, _DataHandler._CHUNK_SIZE), 1):
+                    start = time.monotonic()
+                    # Fail rather than mix two versions of the blob if it is modified during the download
+                    downloader = client.download_blob(blob.name, offset=offset, length=length, etag=blob.etag,
+                                                      match_condition=MatchConditions.IfNotModified,
+                                                      connection_timeout=60, retry_total=20, retry_connect=10)
+                    downloader.readinto(split.handle.open_at(offset))
+                    controller.record(length, time.monotonic() - start)
+        except InterruptedError:
+            raise
+        except Exception as e:
+            done, last = split.fail(e)
+        else:
+            done, last = split.complete_part(0 if skipped else length)
+        if not last:
+            if not skipped and split.error is None:
+                progress.update(blob.name, done)
+            return None
+        if split.handle is not None:
+            split.handle.close()
+        if split.error is not None:
+            # Do not leave a partially written file behind
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise split.error
+        if skipped:
+            progress.skip(blob.name, split.size)
+            return False
+        os.replace(part_path, file_path)
+        progress.complete(blob.name, split.size)
+        return True
+
+    @staticmethod
+    def _retry_failures(failures: dict[str, tuple], run: Callable[[list], None]) -> None:
+        # Files that failed during the main pass are transferred again once it completed, a few times with an
+        # exponential backoff, so that the transient failure of a few files does not fail the whole transfer
+        for attempt in range(_DataHandler._FILE_RETRIES):
+            if not failures:
+                return
+            time.sleep(_DataHandler._RETRY_DELAY * 2 ** attempt)
+            items = [item for item, _ in failures.values()]
+            failures.clear()
+            run(items)
+
+    @staticmethod
+    def _get_partial_response(result: TransferResult, failures: dict[str, tuple], code: str,
+                              action: str) -> Response[TransferResult]:
+        result.transferred.sort()
+        result.skipped.sort()
+        result.failed = sorted(failures)
+        details = [Error(code=code, message=f"{action} failed: {error}.", target=name)
+                   for name, (_, error) in sorted(failures.items())]
+        detailed_error = DetailedError(code=code, message=f"{action} failed for one or multiple files",
+                                       details=details)
+        # Nothing got through, the transfer failed as a whole but can still be retried from its result
+        status = 207 if result.transferred or result.skipped else 500
+        return Response(status, DetailedErrorResponse(error=detailed_error), result)
+
+    @staticmethod
+    def download_data(container_url: str, dst: str, src: str, progress: Optional[ProgressTracker],
+                      sync: bool = False, mirror: bool = False, resume: bool = False,
+                      controller: Optional[ConcurrencyController] = None,
+                      scheduler: Optional[TransferScheduler] = None,
+                      refresh_link: Optional[Callable[[], Optional[str]]] = None,
+                      data_filter: Optional[DataFilter] = None,
+                      files: Optional[list[BlobProperties]] = None) -> Response[TransferResult]:
+        # If files is given, only these blobs are downloaded instead of the listing of src
+        controller = controller or ConcurrencyController()
+        scheduler = scheduler or TransferScheduler.get_default()
+        progress = progress or ProgressTracker()
+        # Bound the size of the first ranged GET and of every following chunk: downloaded data is streamed to disk
+        # chunk by chunk, so peak memory is chunk size x concurrency instead of the size of the blob.
+        client = _DataHandler._get_container_client(container_url, controller.max_workers * controller.max_concurrency,
+                                                    refresh_link,
+                                                    max_single_get_size=_DataHandler._CHUNK_SIZE,
+                                                    max_chunk_get_size=_DataHandler._CHUNK_SIZE,
+                                                    raw_response_hook=controller.on_response)
+        try:
+            # Only the failed files are downloaded again, a partial download must not remove the others
+            return _DataHandler._download_data(client, dst, src, progress, sync, mirror, resume, controller,
+                                               scheduler, data_filter, files,
+                                               lambda failed: _DataHandler.download_data(
+                                                   container_url, dst, src, progress, sync, False, resume,
+                                                   controller, scheduler, refresh_link, data_filter, failed))
+        finally:
+            client.close()
+
+    @staticmethod
+    def _download_data(client: ContainerClient, dst: str, src: str, progress: ProgressTracker,
+                       sync: bool, mirror: bool, resume: bool, controller: ConcurrencyController,
+                       scheduler: TransferScheduler, data_filter: Optional[DataFilter] = None,
+                       files: Optional[list[BlobProperties]] = None,
+                       retry: Optional[Callable[[list[BlobProperties]], Response[TransferResult]]] = None
+                       ) -> Response[TransferResult]:
+        if files is None:
+            blobs = _DataHandler._list_blobs(client, src, data_filter)
+        else:
+            blobs = {blob.name: blob for blob in files}
+        blobs_tuple = [(blob.name, blob.size) for blob in blobs.values()]
+        # The usual heuristic is only the starting point, the controller adapts it to the measured throughput
         nb_threads = _DataHandler._get_nb_threads(blobs_tuple)
+        if not resume and any(size > _DataHandler._SPLIT_SIZE for _, size in blobs_tuple):
+            # The ranges of a very large blob run on the workers, they start with the connections a blob would use
+            nb_threads = max(nb_threads, controller.max_concurrency)
+        controller.start(nb_threads)
 
-        total_size = sum(n for _, n in blobs_tuple)
-        proceed = True
-        downloaded_values = {}
+        progress.start(sum(n for _, n in blobs_tuple), len(blobs_tuple))
+        result = TransferResult()
+        manifest = _DataHandler._read_manifest(dst) if sync else {}
+        splits = []
+        failures = {}
 
-        def _download_blob(blob_tuple):
+        def _download_file(blob_tuple, split, index):
             def _download_callback(current, _):
-                nonlocal downloaded_values
-                downloaded_values[blob_tuple[0]] = current
-                percentage = (sum(downloaded_values.values()) / total_size) * 100
-                nonlocal proceed
-                if progress_hook is not None:
-                    proceed = proceed and progress_hook(percentage)
-                if not proceed:
-                    raise InterruptedError("Download interrupted by callback function")
-
-            data = client.download_blob(
-                blob_tuple[0],
-                connection_timeout=60,
-                max_concurrency=16,
-                retry_total=20,
-                retry_connect=10,
-                progress_hook=_download_callback,
-            ).readall()
+                progress.update(blob_tuple[0], current)
 
-            rel_path = blob_tuple[0].removeprefix(src) if src != blob_tuple[0] else os.path.basename(src)
-            rel_path = rel_path.strip('/')
-            download_file_path = os.path.join(dst, rel_path)
-            os.makedirs(os.path.dirname(download_file_path), exist_ok=True)
+            download_file_path = _DataHandler._get_download_path(blob_tuple[0], src, dst)
+            if split is not None:
+                downloaded = _DataHandler._download_part(client, blobs[blob_tuple[0]], download_file_path, split,
+                                                         index, progress, manifest.get(blob_tuple[0]), sync,
+                                                         controller, scheduler)
+                if downloaded is False:
+                    result.skipped.append(blob_tuple[0])
+                elif downloaded:
+                    result.transferred.append(blob_tuple[0])
+                    if sync:
+                        manifest[blob_tuple[0]] = {"etag": blobs[blob_tuple[0]].etag,
+                                                   "mtime": os.stat(download_file_path).st_mtime}
+                return
+            if sync and _DataHandler._is_downloaded(download_file_path, blobs[blob_tuple[0]],
+                                                    manifest.get(blob_tuple[0])):
+                result.skipped.append(blob_tuple[0])
+                progress.skip(blob_tuple[0], blob_tuple[1])
+                return
+
+            nb_bytes, concurrency = _DataHandler._get_budget(blob_tuple[1], controller.concurrency)
+            with scheduler.reserve(nb_bytes, concurrency):
+                start = time.monotonic()
+                if resume and blob_tuple[1] > _DataHandler._BLOCK_SIZE:
+                    os.makedirs(os.path.dirname(download_file_path), exist_ok=True)
+                    _DataHandler._download_ranges(client, blobs[blob_tuple[0]], download_file_path,
+                                                  _download_callback, concurrency)
+                else:
+                    downloader = client.download_blob(
+                        blob_tuple[0],
+                        connection_timeout=60,
+                        max_concurrency=concurrency,
+                        retry_total=20,
+                        retry_connect=10,
+                        progress_hook=_download_callback,
+                    )
+                    os.makedirs(os.path.dirname(download_file_path), exist_ok=True)
+
+                    try:
+                        with open(download_file_path, "wb") as file:
+                            downloader.readinto(file)
+                    except BaseException:
+                        # Do not leave a truncated file behind if the download failed or was interrupted
+                        if os.path.exists(download_file_path):
+                            os.remove(download_file_path)
+                        raise
+                controller.record(blob_tuple[1], time.monotonic() - start, blob_tuple[1] <= _DataHandler._CHUNK_SIZE)
+            progress.complete(blob_tuple[0], blob_tuple[1])
+            result.transferred.append(blob_tuple[0])
+            if sync:
+                manifest[blob_tuple[0]] = {"etag": blobs[blob_tuple[0]].etag,
+                                           "mtime": os.stat(download_file_path).st_mtime}
+
+        def _download_blob(work):
+            try:
+                _download_file(*work)
+            except (InterruptedError, ClientAuthenticationError):
+                # Authorization failures concern every file, they stop the transfer
+                raise
+            except Exception as e:
+                failures[work[0][0]] = (work[0], e)
 
-            with open(download_file_path, "wb") as file:
-                file.write(data)
-            nonlocal downloaded_values
-            downloaded_values[blob_tuple[0]] = blob_tuple[1]
+        def _run(items):
+            work = _DataHandler._split_large(_DataHandler._order_by_size(items, lambda b: b[1]),
+                                             lambda b: b[1], splits, not resume)
+            scheduler.run(_download_blob, work, controller)
 
         try:
-            with ThreadPool(processes=nb_threads) as pool:
-                pool.map(_download_blob, blobs_tuple)
+            try:
+                _run(blobs_tuple)
+                _DataHandler._retry_failures(failures, _run)
+                progress.flush()
+            finally:
+                # Do not leave a partially written file behind if the download of its blocks did not complete
+                for split in splits:
+                    if split.handle is not None:
+                        split.handle.close()
+                    if split.prepared and not split.value and not split.finished:
+                        part_path = _DataHandler._get_download_path(split.item[0], src, dst) + ".part"
+                        if os.path.exists(part_path):
+                            os.remove(part_path)
+                # Keep track of what was downloaded even if the transfer stopped, the next sync will resume from it
+                if sync:
+                    _DataHandler._write_manifest(dst, {name: entry for name, entry in manifest.items()
+                                                       if name in blobs or files is not None})
+            if mirror:
+                expected = {os.path.normpath(_DataHandler._get_download_path(name, src, dst)) for name in blobs}
+                result.deleted = _DataHandler._remove_extra_files(dst, expected, data_filter)
         except InterruptedError as _:
             de = DetailedErrorResponse(error={"code": "DownloadInterrupted",
                                               "message": "Download was interrupted by user."})
@@ -84,47 +1371,263 @@ class _DataHandler:
             de = DetailedErrorResponse(error={"code": "DownloadFailure",
                                               "message": f"Download failed: {e}."})
             return Response(500, de, None)
-        return Response(200, None, None)
+        if failures:
+            failed = [blobs[name] for name in failures]
+            r = _DataHandler._get_partial_response(result, failures, "DownloadFailure", "Download")
+            if retry is not None:
+                r.value._retry = lambda: retry(failed)
+            return r
+        result.transferred.sort()
+        result.skipped.sort()
+        return Response(200, None, result)
+
+    @staticmethod
+    def upload_data(container_url, src: str, reality_data_dst: str, progress: Optional[ProgressTracker],
+                    sync: bool = False, resume: bool = False,
+                    controller: Optional[ConcurrencyController] = None,
+                    scheduler: Optional[TransferScheduler] = None,
+                    refresh_link: Optional[Callable[[], Optional[str]]] = None,
+                    data_filter: Optional[DataFilter] = None,
+                    files: Optional[list[tuple[str, int]]] = None) -> Response[TransferResult]:
+        # If files is given, only these files of src are uploaded instead of scanning it
+        controller = controller or ConcurrencyController()
+        scheduler = scheduler or TransferScheduler.get_default()
+        progress = progress or ProgressTracker()
+        # Like downloads, upload files larger than a chunk by blocks of a chunk so that memory stays bounded
+        client = _DataHandler._get_container_client(container_url, controller.max_workers * controller.max_concurrency,
+                                                    refresh_link,
+                                                    max_single_put_size=_DataHandler._CHUNK_SIZE,
+                                                    max_block_size=_DataHandler._CHUNK_SIZE,
+                                                    raw_response_hook=controller.on_response)
+        try:
+            return _DataHandler._upload_data(client, container_url, src, reality_data_dst, progress, sync, resume,
+                                             controller, scheduler, data_filter, files,
+                                             lambda failed: _DataHandler.upload_data(
+                                                 container_url, src, reality_data_dst, progress, sync, resume,
+                                                 controller, scheduler, refresh_link, data_filter, failed))
+        finally:
+            client.close()
+
+    @staticmethod
+    def _upload_file(client: ContainerClient, container_url: str, file_path: str, blob_name: str, size: int,
+                     key: str, progress: ProgressTracker, remote_blob: Optional[BlobProperties], sync: bool,
+                     resume: bool, controller: ConcurrencyController, scheduler: TransferScheduler) -> bool:
+        # Returns False if the file was skipped because the blob is already up-to-date
+        def _upload_callback(current, _):
+            progress.update(key, current)
+
+        content_settings = None
+        if sync:
+            if _DataHandler._is_uploaded(file_path, size, remote_blob):
+                progress.skip(key, size)
+                return False
+            # Store the hash on the blob so that the next synchronization can compare contents
+            content_settings = ContentSettings(content_md5=bytearray(_DataHandler._get_md5(file_path)))
+        nb_bytes, concurrency = _DataHandler._get_budget(size, controller.concurrency)
+        resumable = resume and size > _DataHandler._BLOCK_SIZE
+        # Only very large files are mapped, the others go through the buffered upload, with its budget
+        mapped = _DataHandler._use_map(file_path, size)
+        if mapped and not resume:
+            # Blocks are sent from the mapped file, nothing is buffered
+            nb_bytes = 0
+            concurrency = max(1, min(controller.concurrency, -(-size // _DataHandler._get_block_size(size))))
+        elif resumable:
+            # One connection per block staged at the same time, blocks are only buffered if the file is not mapped
+            concurrency = max(1, min(controller.concurrency, -(-size // _DataHandler._BLOCK_SIZE)))
+            nb_bytes = 0 if mapped else concurrency * _DataHandler._BLOCK_SIZE
+        with scheduler.reserve(nb_bytes, concurrency):
+            start = time.monotonic()
+            if resumable:
+                _DataHandler._upload_blocks(client, container_url, blob_name, file_path, size,
+                                            _upload_callback, content_settings, concurrency, mapped)
+            elif mapped:
+                _DataHandler._upload_mapped(client, blob_name, file_path, size, _upload_callback, content_settings,
+                                            concurrency)
+            else:
+                with open(file_path, "rb") as data:
+                    client.upload_blob(
+                        blob_name,
+                        data,
+                        connection_timeout=60,
+                        max_concurrency=concurrency,
+                        retry_total=20,
+                        retry_connect=10,
+                        progress_hook=_upload_callback,
+                        overwrite=True,
+                        content_settings=content_settings,
+                    )
+            controller.record(size, time.monotonic() - start, size <= _DataHandler._CHUNK_SIZE)
+        progress.complete(key, size)
+        return True
+
+    @staticmethod
+    def _upload_data(client: ContainerClient, container_url: str, src: str, reality_data_dst: str,
+                     progress: ProgressTracker, sync: bool, resume: bool, controller: ConcurrencyController,
+                     scheduler: TransferScheduler, data_filter: Optional[DataFilter] = None,
+                     files: Optional[list[tuple[str, int]]] = None,
+                     retry: Optional[Callable[[list[tuple[str, int]]], Response[TransferResult]]] = None
+                     ) -> Response[TransferResult]:
+        result = TransferResult()
+        remote_blobs = {}
+        if sync:
+            try:
+                remote_blobs = _DataHandler._list_blobs(client, reality_data_dst)
+            except Exception as e:
+                de = DetailedErrorResponse(error={"code": "UploadFailure",
+                                                  "message": f"Failed to list destination: {e}."})
+                return Response(500, de, None)
+
+        is_dir = os.path.isdir(src)
+        failures = {}
+
+        def _upload_file(work):
+            file_tuple, split, index = work
+            file_path = os.path.join(src, file_tuple[0]) if is_dir else src
+            blob_name = os.path.join(reality_data_dst, file_tuple[0])
+            try:
+                if split is not None:
+                    uploaded = _DataHandler._upload_part(client, file_path, blob_name, file_tuple[0], split, index,
+                                                         progress, remote_blobs.get(blob_name), sync, controller,
+                                                         scheduler)
+                    if uploaded is None:
+                        return
+                else:
+                    uploaded = _DataHandler._upload_file(client, container_url, file_path, blob_name, file_tuple[1],
+                                                         file_tuple[0], progress, remote_blobs.get(blob_name), sync,
+                                                         resume, controller, scheduler)
+            except (InterruptedError, ClientAuthenticationError):
+                # Authorization failures concern every file, they stop the transfer
+                raise
+            except Exception as e:
+                failures[blob_name] = (file_tuple, e)
+                return
+            (result.transferred if uploaded else result.skipped).append(blob_name)
+
+        def _run(items):
+            ordered = _DataHandler._order_by_size(items, lambda f: f[1])
+            try:
+                scheduler.run(_upload_file, _DataHandler._split_large(ordered, lambda f: f[1], [], not resume,
+                                                                      _DataHandler._get_block_size), controller)
+            finally:
+                # Stop the scan if the upload stopped before its end
+                ordered.close()
+
+        lock = threading.Lock()
+        nb_small_files = 0
+
+        def _on_file(name, size):
+            # The totals and the usual heuristic for the number of parallel files are refined as the scan goes on
+            nonlocal nb_small_files
+            progress.add_total(size)
+            if size <= _DataHandler._SMALL_FILE_SIZE:
+                with lock:
+                    nb_small_files += 1
+                    if nb_small_files % 100 == 0:
+                        controller.grow(_DataHandler._get_nb_threads_for(nb_small_files))
+
+        try:
+            if files is None:
+                progress.start(0, 0)
+                controller.start(_DataHandler._get_nb_threads_for(0))
+                _run(_DataHandler._scan_files(src, _on_file, data_filter))
+            else:
+                progress.start(sum(size for _, size in files), len(files))
+                controller.start(_DataHandler._get_nb_threads(files))
+                _run(files)
+            _DataHandler._retry_failures(failures, _run)
+            progress.flush()
+        except InterruptedError as _:
+            de = DetailedErrorResponse(error={"code": "UploadInterrupted",
+                                              "message": "Upload was interrupted by user."})
+            return Response(499, de, None)
+        except Exception as e:
+            de = DetailedErrorResponse(error={"code": "UploadFailure",
+                                              "message": f"Upload failed: {e}."})
+            return Response(500, de, None)
+        if failures:
+            failed = [file_tuple for file_tuple, _ in failures.values()]
+            r = _DataHandler._get_partial_response(result, failures, "UploadFailure", "Upload")
+            if retry is not None:
+                r.value._retry = lambda: retry(failed)
+            return r
+        result.transferred.sort()
+        result.skipped.sort()
+        return Response(200, None, result)
 
     @staticmethod
-    def upload_data(container_url, src: str, reality_data_dst: str, progress_hook):
-        files = _DataHandler._get_files_and_sizes(src)
-        nb_threads = _DataHandler._get_nb_threads(files)
-        total_size = sum(size for _, size in files)
-        proceed = True
-        uploaded_values = {}
-        sas_uri = container_url
+    def _get_stream_size(data: Union[bytes, bytearray, memoryview, BinaryIO]) -> Optional[int]:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return memoryview(data).nbytes
+        # Remaining size of a seekable stream, unknown for the other ones
+        try:
+            position = data.tell()
+            end = data.seek(0, io.SEEK_END)
+            data.seek(position)
+        except (AttributeError, OSError, ValueError):
+            return None
+        return end - position
+
+    @staticmethod
+    def upload_streams(container_url: str,
+                       items: Iterable[tuple[str, Union[bytes, bytearray, memoryview, BinaryIO]]], dst: str,
+                       progress: Optional[ProgressTracker],
+                       controller: Optional[ConcurrencyController] = None,
+                       scheduler: Optional[TransferScheduler] = None,
+                       refresh_link: Optional[Callable[[], Optional[str]]] = None) -> Response[TransferResult]:
+        controller = controller or ConcurrencyController()
+        scheduler = scheduler or TransferScheduler.get_default()
+        progress = progress or ProgressTracker()
+        # Items are only known while they are uploaded, start with the minimum of the usual heuristic
+        controller.start(_DataHandler._get_nb_threads_for(0))
+        client = _DataHandler._get_container_client(container_url, controller.max_workers * controller.max_concurrency,
+                                                    refresh_link,
+                                                    max_single_put_size=_DataHandler._CHUNK_SIZE,
+                                                    max_block_size=_DataHandler._CHUNK_SIZE,
+                                                    raw_response_hook=controller.on_response)
+        result = TransferResult()
+        progress.start(0, 0)
+
+        def _upload_stream(item):
+            name, data = item
+            blob_name = "/".join(part for part in (dst.strip("/"), name.strip("/")) if part)
+            size = _DataHandler._get_stream_size(data)
+            progress.add_total(size or 0)
+            uploaded = 0
 
-        def _upload_file(file_tuple):
             def _upload_callback(current, _):
-                nonlocal uploaded_values
-                uploaded_values[file_tuple[0]] = current
-                percentage = (sum(uploaded_values.values()) / total_size) * 100
-                nonlocal proceed
-                if progress_hook is not None:
-                    proceed = proceed and progress_hook(percentage)
-                if not proceed:
-                    raise InterruptedError("Upload interrupted by callback function")
-
-            client = ContainerClient.from_container_url(sas_uri)
-            file_path = os.path.join(src, file_tuple[0]) if os.path.isdir(src) else src
-            with open(file_path, "rb") as data:
+                nonlocal uploaded
+                uploaded = current
+                progress.update(blob_name, current)
+
+            if isinstance(data, (bytearray, memoryview)):
+                # Bytes are sent as they are, other buffers are read in place
+                data = _BufferReader(data)
+            nb_bytes, concurrency = _DataHandler._get_budget(
+                size if size is not None else controller.concurrency * _DataHandler._CHUNK_SIZE,
+                controller.concurrency)
+            with scheduler.reserve(nb_bytes, concurrency):
+                start = time.monotonic()
                 client.upload_blob(
-                    os.path.join(reality_data_dst, file_tuple[0]),
+                    blob_name,
                     data,
+                    length=size,
                     connection_timeout=60,
-                    max_concurrency=16,
+                    max_concurrency=concurrency,
                     retry_total=20,
                     retry_connect=10,
                     progress_hook=_upload_callback,
                     overwrite=True,
                 )
-            nonlocal uploaded_values
-            uploaded_values[file_tuple[0]] = file_tuple[1]
+                if size is None:
+                    size = uploaded
+                    progress.add_total(size, 0)
+                controller.record(size, time.monotonic() - start, size <= _DataHandler._CHUNK_SIZE)
+            progress.complete(blob_name, size)
+            result.transferred.append(blob_name)
 
         try:
-            with ThreadPool(processes=nb_threads) as pool:
-                pool.map(_upload_file, files)
+            scheduler.run(_upload_stream, items, controller)
+            progress.flush()
         except InterruptedError as _:
             de = DetailedErrorResponse(error={"code": "UploadInterrupted",
                                               "message": "Upload was interrupted by user."})
@@ -133,31 +1636,492 @@ class _DataHandler:
             de = DetailedErrorResponse(error={"code": "UploadFailure",
                                               "message": f"Upload failed: {e}."})
             return Response(500, de, None)
-        return Response(200, None, None)
+        finally:
+            client.close()
+        result.transferred.sort()
+        return Response(200, None, result)
+
+    @staticmethod
+    def upload_batch(targets: list[tuple[str, Optional[Callable[[], Optional[str]]], str, str]],
+                     progress: Optional[ProgressTracker], sync: bool = False, resume: bool = False,
+                     controller: Optional[ConcurrencyController] = None,
+                     scheduler: Optional[TransferScheduler] = None) -> list[Response[TransferResult]]:
+        # Each target is (container url, link refresh, source, destination). The files of all the targets go through
+        # the same run so that the workers stay busy from the first file of the batch to the last one.
+        controller = controller or ConcurrencyController()
+        scheduler = scheduler or TransferScheduler.get_default()
+        progress = progress or ProgressTracker()
+        session = _DataHandler._get_session(controller.max_workers * controller.max_concurrency)
+        clients = [_DataHandler._get_container_client(container_url, 0, refresh_link, session,
+                                                      max_single_put_size=_DataHandler._CHUNK_SIZE,
+                                                      max_block_size=_DataHandler._CHUNK_SIZE,
+                                                      raw_response_hook=controller.on_response)
+                   for container_url, refresh_link, _, _ in targets]
+        results = [TransferResult() for _ in targets]
+        errors = [None for _ in targets]
+        remote_blobs = [{} for _ in targets]
+        items = []
+
+        def _upload_file(work):
+            (index, name, size), split, part = work
+            key = f"{index}/{name}"
+            if errors[index] is not None:
+                # Another file of this target failed, the target is given up but the others continue
+                if split is None or part == 0:
+                    progress.skip(key, size)
+                return
+            container_url, _, src, dst = targets[index]
+            file_path = os.path.join(src, name) if os.path.isdir(src) else src
+            blob_name = os.path.join(dst, name)
+            try:
+                if split is not None:
+                    uploaded = _DataHandler._upload_part(clients[index], file_path, blob_name, key, split, part,
+                                                         progress, remote_blobs[index].get(blob_name), sync,
+                                                         controller, scheduler)
+                    if uploaded is None:
+                        return
+                else:
+                    uploaded = _DataHandler._upload_file(clients[index], container_url, file_path, blob_name, size,
+                                                         key, progress, remote_blobs[index].get(blob_name), sync,
+                                                         resume, controller, scheduler)
+            except InterruptedError:
+                raise
+            except Exception as e:
+                errors[index] = Response(500, DetailedErrorResponse(error={"code": "UploadFailure",
+                                                                           "message": f"Upload failed: {e}."}), None)
+                return
+            (results[index].transferred if uploaded else results[index].skipped).append(blob_name)
+
+        try:
+            for index, (_, _, src, dst) in enumerate(targets):
+                try:
+                    files = _DataHandler._get_files_and_sizes(src)
+                    if sync:
+                        remote_blobs[index] = _DataHandler._list_blobs(clients[index], dst)
+                except Exception as e:
+                    de = DetailedErrorResponse(error={"code": "UploadFailure",
+                                                      "message": f"Failed to prepare upload: {e}."})
+                    errors[index] = Response(500, de, None)
+                    continue
+                items.extend((index, name, size) for name, size in files)
+            controller.start(_DataHandler._get_nb_threads([(name, size) for _, name, size in items]))
+            progress.start(sum(size for _, _, size in items), len(items))
+            work = _DataHandler._split_large(_DataHandler._order_by_size(items, lambda item: item[2]),
+                                             lambda item: item[2], [], not resume, _DataHandler._get_block_size)
+            scheduler.run(_upload_file, work, controller)
+            progress.flush()
+        except InterruptedError as _:
+            de = DetailedErrorResponse(error={"code": "UploadInterrupted",
+                                              "message": "Upload was interrupted by user."})
+            return [Response(499, de, None) for _ in targets]
+        except Exception as e:
+            de = DetailedErrorResponse(error={"code": "UploadFailure",
+                                              "message": f"Upload failed: {e}."})
+            return [Response(500, de, None) for _ in targets]
+        finally:
+            for client in clients:
+                client.close()
+            session.close()
+        responses = []
+        for result, error in zip(results, errors):
+            result.transferred.sort()
+            result.skipped.sort()
+            responses.append(error if error is not None else Response(200, None, result))
+        return responses
+
+    @staticmethod
+    def _get_copy_name(blob_name: str, src: str, dst: str) -> str:
+        rel_name = blob_name.removeprefix(src) if src != blob_name else blob_name.rsplit("/", 1)[-1]
+        return "/".join(part for part in (dst.strip("/"), rel_name.strip("/")) if part)
+
+    @staticmethod
+    def _copy_blob(src_client: ContainerClient, dst_client: ContainerClient, source_url: str, blob: BlobProperties,
+                   dst_name: str, progress: ProgressTracker, scheduler: TransferScheduler) -> None:
+        dst_blob = dst_client.get_blob_client(dst_name)
+        try:
+            with scheduler.reserve(0, 1):
+                status = dst_blob.start_copy_from_url(source_url)["copy_status"]
+        except HttpResponseError as e:
+            # Only the failures of the service to read the source are worked around, the others are the same
+            # through this machine
+            if not _DataHandler._is_copy_source_error(e):
+                raise
+            status = None
+        delay = _DataHandler._COPY_POLL_INTERVAL
+        description = None
+        while status == "pending":
+            time.sleep(delay)
+            delay = min(2 * delay, 5.0)
+            copy = dst_blob.get_blob_properties().copy
+            status, description = copy.status, copy.status_description
+        if status == "success":
+            return
+        if status is not None:
+            raise RuntimeError(f"Copy of {blob.name} ended with status {status}: {description}")
+        # The storage service could not read the source, e.g. because of the network rules of its account.
+        # Relay the data through this machine instead, a single chunk in memory at a time. A copy still pending
+        # on the destination, e.g. from a previous run, would conflict with the relay.
+        try:
+            properties = dst_blob.get_blob_properties()
+            if properties.copy.status == "pending":
+                dst_blob.abort_copy(properties.copy.id)
+        except ResourceNotFoundError:
+            pass
+        with scheduler.reserve(min(blob.size, 2 * _DataHandler._CHUNK_SIZE), 2):
+            downloader = src_client.download_blob(blob.name, connection_timeout=60, max_concurrency=1,
+                                                  retry_total=20, retry_connect=10)
+            dst_blob.upload_blob(
+                downloader.chunks(),
+                length=blob.size,
+                connection_timeout=60,
+                max_concurrency=1,
+                retry_total=20,
+                retry_connect=10,
+                progress_hook=lambda current, _: progress.update(blob.name, current),
+                overwrite=True,
+                content_settings=blob.content_settings,
+            )
+
+    @staticmethod
+    def _is_copy_source_error(error: HttpResponseError) -> bool:
+        headers = error.response.headers if error.response is not None else {}
+        return (getattr(error, "error_code", None) in _DataHandler._COPY_SOURCE_ERRORS or
+                "x-ms-copy-source-error-code" in headers or "x-ms-copy-source-status-code" in headers)
 
     @staticmethod
-    def list_data(container_url: str) -> Response[list[str]]:
-        client = ContainerClient.from_container_url(container_url)
-        blob_names = [name for name in client.list_blob_names()]
+    def copy_data(src_container_url: str, dst_container_url: str, src: str, dst: str,
+                  progress: Optional[ProgressTracker],
+                  controller: Optional[ConcurrencyController] = None,
+                  scheduler: Optional[TransferScheduler] = None,
+                  src_refresh_link: Optional[Callable[[], Optional[str]]] = None,
+                  dst_refresh_link: Optional[Callable[[], Optional[str]]] = None) -> Response[TransferResult]:
+        controller = controller or ConcurrencyController()
+        scheduler = scheduler or TransferScheduler.get_default()
+        progress = progress or ProgressTracker()
+        # The destination account reads the source itself, through a url carrying the SAS of the source container
+        source_sas = _SasCredential(src_container_url, src_refresh_link or (lambda: None))
+        source_root = urlunsplit(urlsplit(src_container_url)._replace(query=""))
+        session = _DataHandler._get_session(controller.max_workers * 2)
+        src_client = _DataHandler._get_container_client(src_container_url, 0, src_refresh_link, session,
+                                                        max_single_get_size=_DataHandler._CHUNK_SIZE,
+                                                        max_chunk_get_size=_DataHandler._CHUNK_SIZE)
+        dst_client = _DataHandler._get_container_client(dst_container_url, 0, dst_refresh_link, session,
+                                                        max_single_put_size=_DataHandler._CHUNK_SIZE,
+                                                        max_block_size=_DataHandler._CHUNK_SIZE,
+                                                        raw_response_hook=controller.on_response)
+        result = TransferResult()
+
+        def _copy_blob(blob):
+            dst_name = _DataHandler._get_copy_name(blob.name, src, dst)
+            source_url = f"{source_root}/{quote(blob.name)}?{source_sas.signature}"
+            _DataHandler._copy_blob(src_client, dst_client, source_url, blob, dst_name, progress, scheduler)
+            progress.complete(blob.name, blob.size)
+            result.transferred.append(dst_name)
+
+        try:
+            blobs = list(_DataHandler._walk_blobs(src_client, src))
+            # Server-side copies only wait on the service, as many of them as allowed run at the same time
+            controller.start(controller.max_workers)
+            progress.start(sum(blob.size for blob in blobs), len(blobs))
+            scheduler.run(_copy_blob, blobs, controller)
+            progress.flush()
+        except InterruptedError as _:
+            de = DetailedErrorResponse(error={"code": "CopyInterrupted",
+                                              "message": "Copy was interrupted by user."})
+            return Response(499, de, None)
+        except Exception as e:
+            de = DetailedErrorResponse(error={"code": "CopyFailure",
+                                              "message": f"Copy failed: {e}."})
+            return Response(500, de, None)
+        finally:
+            src_client.close()
+            dst_client.close()
+            session.close()
+        result.transferred.sort()
+        return Response(200, None, result)
+
+    @staticmethod
+    def list_data(container_url: str, prefix: str = "",
+                  refresh_link: Optional[Callable[[], Optional[str]]] = None,
+                  data_filter: Optional[DataFilter] = None) -> Response[list[str]]:
+        client = _DataHandler._get_container_client(container_url, _DataHandler._LIST_WORKERS, refresh_link)
+        try:
+            blob_names = sorted(blob.name for blob in _DataHandler._walk_blobs(client, prefix, data_filter))
+        finally:
+            client.close()
         return Response(200, None, blob_names)
 
     @staticmethod
-    def delete_data(container_url: str, files_to_delete: list[str]) -> Response[None]:
-        client = ContainerClient.from_container_url(container_url)
+    def open_data(container_url: str, name: str,
+                  refresh_link: Optional[Callable[[], Optional[str]]] = None) -> Response[RemoteFile]:
+        client = _DataHandler._get_container_client(container_url, 2, refresh_link)
+        try:
+            properties = client.get_blob_client(name).get_blob_properties()
+        except ResourceNotFoundError as _:
+            client.close()
+            de = DetailedErrorResponse(error={"code": "FileNotFound",
+                                              "message": f"File {name} does not exist."})
+            return Response(404, de, None)
+        except Exception as e:
+            client.close()
+            de = DetailedErrorResponse(error={"code": "DownloadFailure",
+                                              "message": f"Failed to open {name}: {e}."})
+            return Response(500, de, None)
+        return Response(200, None, RemoteFile(client, name, properties.size, properties.etag))
+
+    @staticmethod
+    def read_data(container_url: str, name: str,
+                  refresh_link: Optional[Callable[[], Optional[str]]] = None) -> Response[bytes]:
+        client = _DataHandler._get_container_client(container_url, 4, refresh_link,
+                                                    max_single_get_size=_DataHandler._CHUNK_SIZE,
+                                                    max_chunk_get_size=_DataHandler._CHUNK_SIZE)
+        try:
+            data = client.download_blob(name, connection_timeout=60, max_concurrency=4, retry_total=20,
+                                        retry_connect=10).readall()
+        except ResourceNotFoundError as _:
+            de = DetailedErrorResponse(error={"code": "FileNotFound",
+                                              "message": f"File {name} does not exist."})
+            return Response(404, de, None)
+        except Exception as e:
+            de = DetailedErrorResponse(error={"code": "DownloadFailure",
+                                              "message": f"Download failed: {e}."})
+            return Response(500, de, None)
+        finally:
+            client.close()
+        return Response(200, None, data)
+
+    @staticmethod
+    def _get_data_info(blob: BlobProperties) -> DataInfo:
+        content_md5 = blob.content_settings.content_md5 if blob.content_settings is not None else None
+        return DataInfo(name=blob.name, size=blob.size, etag=blob.etag,
+                        md5=bytes(content_md5).hex() if content_md5 else None, last_modified=blob.last_modified)
+
+    @staticmethod
+    def iter_data(container_url: str, prefix: str = "",
+                  refresh_link: Optional[Callable[[], Optional[str]]] = None) -> Iterator[DataInfo]:
+        # Pages are requested from the service only when the previous one has been consumed
+        client = _DataHandler._get_container_client(container_url, 1, refresh_link)
+        try:
+            for blob in client.list_blobs(name_starts_with=prefix or None):
+                yield _DataHandler._get_data_info(blob)
+        finally:
+            client.close()
+
+    @staticmethod
+    def delete_data(container_url: str, files_to_delete: list[str], prefix: Optional[str] = None,
+                    controller: Optional[ConcurrencyController] = None,
+                    scheduler: Optional[TransferScheduler] = None,
+                    refresh_link: Optional[Callable[[], Optional[str]]] = None) -> Response[None]:
+        controller = controller or ConcurrencyController()
+        scheduler = scheduler or TransferScheduler.get_default()
+        client = _DataHandler._get_container_client(container_url, controller.max_workers, refresh_link,
+                                                    raw_response_hook=controller.on_response)
         failed = []
-        for file in files_to_delete:
+
+        def _delete_batch(batch):
             try:
-                client.delete_blob(file)
+                responses = client.delete_blobs(*batch, raise_on_any_failure=False)
+                failed.extend(file for file, response in zip(batch, responses)
+                              if response.status_code not in (200, 202))
             except Exception as _:
-                failed.append(file)
+                # The whole batch was rejected, delete its files one by one to know which ones failed
+                for file in batch:
+                    try:
+                        client.delete_blob(file)
+                    except Exception as _:
+                        failed.append(file)
+
+        try:
+            files = list(dict.fromkeys(files_to_delete))
+            if prefix is not None:
+                listed = set(files)
+                files.extend(blob.name for blob in _DataHandler._walk_blobs(client, prefix)
+                             if blob.name not in listed)
+            batches = [files[i:i + _DataHandler._DELETE_BATCH_SIZE]
+                       for i in range(0, len(files), _DataHandler._DELETE_BATCH_SIZE)]
+            scheduler.run(_delete_batch, batches, controller)
+        except Exception as e:
+            de = DetailedErrorResponse(error={"code": "DeletionFailed",
+                                              "message": f"Deletion failed: {e}."})
+            return Response(500, de, None)
+        finally:
+            client.close()
         if not failed:
             return Response(204, None, None)
         detailed_error = DetailedError(code="DeletionFailed", message="Failed to delete one or multiple files",
                                        details=[Error(code="DeletionFailed", message="Failed to delete a file",
-                                                      target=fail) for fail in failed])
+                                                      target=fail) for fail in sorted(failed)])
         return Response(400, DetailedErrorResponse(error=detailed_error), None)
 
 
+class UploadSession:
+    """
+    Uploads to a reality data sharing a single write access and a single authoring period.
+    Authoring is enabled when the session opens and disabled when it closes, whatever the number of uploads.
+    Uploads can run concurrently from several threads.
+    Sessions are created with :meth:`RealityDataHandler.upload_session` and are usually used as context managers,
+    :attr:`close_result` then tells whether authoring could be disabled.
+    """
+
+    def __init__(self, handler: "RealityDataHandler", reality_data_id: str, itwin_id: Optional[str] = None) -> None:
+        """
+        Constructor method
+
+        :param handler: Handler the session uploads with.
+        :param reality_data_id: Id of the Reality Data.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        """
+        self._handler = handler
+        self._reality_data_id = reality_data_id
+        self._itwin_id = itwin_id
+        self._cond = threading.Condition()
+        self._opened = None
+        self._closed = None
+        self._uploads = 0
+        self._container_url = None
+
+    @property
+    def close_result(self) -> Optional[Response[None]]:
+        """
+        Result of closing the session, None while the session is not closed.
+        """
+        return self._closed
+
+    def open(self) -> Response[None]:
+        """
+        Get write access to the reality data and enable authoring. Does nothing if the session is already open.
+        A closed session can not be opened again.
+
+        :return: A Response[None] containing the error from the service if the session could not be opened,
+         or a SessionClosed error if the session is closed.
+        """
+        with self._cond:
+            if self._closed is not None:
+                de = DetailedErrorResponse(error={"code": "SessionClosed",
+                                                  "message": "Upload session is closed."})
+                return Response(400, de, None)
+            if self._opened is None or self._opened.is_error():
+                r = self._handler._get_link(self._reality_data_id, self._itwin_id, False)
+                if not r.is_error():
+                    self._container_url = r.value.links.container_url.href
+                    r = self._handler._set_authoring(self._reality_data_id, True)
+                self._opened = Response(r.status_code, r.error, None)
+            return self._opened
+
+    def upload_data(self, src: str, reality_data_dst: str = "", sync: bool = False,
+                    resume: bool = False, data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
+        """
+        Upload files to the reality data of the session. Opens the session if needed.
+
+        :param src: Source path to upload. If directory, all the files in the directory will be uploaded recursively.
+         Files must not be truncated while they upload: files above 4 GB are read through a memory map, and reading
+         a truncated map ends the process.
+        :param reality_data_dst: Destination of the data inside the Reality Data, default to root.
+        :param sync: If True, files already present in the Reality Data with the same size and content are skipped.
+        :param resume: If True, large files are uploaded block by block and the staged blocks are recorded in a
+         local journal. Calling again with the same parameters after a failure resumes from the last staged block.
+        :param data_filter: Optional filter of the files to upload, applied while scanning the source.
+        :return: A Response[TransferResult] containing either the uploaded and skipped files
+         or the error from the service. Files that still fail after being retried are listed in the result, with
+         a 207 status if other files were uploaded, and can be uploaded again with
+         :meth:`TransferResult.retry_failed`.
+        """
+        # The link is renewed by the transfer itself when its SAS is about to expire
+        return self._run(lambda: _DataHandler.upload_data(self._container_url, src, reality_data_dst,
+                                                          self._handler._get_progress(), sync, resume,
+                                                          self._handler._get_controller(),
+                                                          refresh_link=self._handler._get_link_refresh(
+                                                              self._reality_data_id, self._itwin_id, False),
+                                                          data_filter=data_filter))
+
+    def upload_streams(self, items: Iterable[tuple[str, Union[bytes, bytearray, memoryview, BinaryIO]]],
+                       reality_data_dst: str = "") -> Response[TransferResult]:
+        """
+        Upload in-memory data and streams to the reality data of the session. Opens the session if needed.
+
+        :param items: Pairs of file name and content. Contents can be bytes-like objects, read in place,
+         or binary file-like objects, read from their current position. Items are consumed while uploading,
+         a generator can produce them as they are needed.
+        :param reality_data_dst: Destination of the data inside the Reality Data, default to root.
+        :return: A Response[TransferResult] containing either the uploaded files or the error from the service.
+        """
+        r = self._begin_upload()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        try:
+            return _DataHandler.upload_streams(self._container_url, items, reality_data_dst,
+                                               self._handler._get_progress(), self._handler._get_controller(),
+                                               refresh_link=self._handler._get_link_refresh(self._reality_data_id,
+                                                                                           self._itwin_id, False))
+        finally:
+            self._end_upload()
+
+    def _run(self, upload: Callable[[], Response[TransferResult]]) -> Response[TransferResult]:
+        r = self._begin_upload()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        try:
+            resp = upload()
+        finally:
+            self._end_upload()
+        if resp.value is not None and resp.value._retry is not None:
+            retry = resp.value._retry
+            resp.value._retry = lambda: self._retry(retry)
+        return resp
+
+    def _retry(self, retry: Callable[[], Response[TransferResult]]) -> Response[TransferResult]:
+        with self._cond:
+            closed = self._closed is not None
+        if not closed:
+            return self._run(retry)
+        # Authoring was disabled since the upload, it is enabled again for the duration of the retry only
+        session = UploadSession(self._handler, self._reality_data_id, self._itwin_id)
+        r = session.open()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        resp = session._run(retry)
+        r = session.close()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return resp
+
+    def _begin_upload(self) -> Response[None]:
+        with self._cond:
+            r = self.open()
+            if not r.is_error():
+                self._uploads += 1
+            return r
+
+    def _end_upload(self) -> None:
+        with self._cond:
+            self._uploads -= 1
+            self._cond.notify_all()
+
+    def close(self) -> Response[None]:
+        """
+        Wait for the running uploads and disable authoring. Authoring is only disabled if the session was opened,
+        closing the session again returns the result of the first close.
+
+        :return: A Response[None] containing the error from the service if authoring could not be disabled.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._uploads == 0)
+            if self._closed is None:
+                if self._opened is None or self._opened.is_error():
+                    self._closed = Response(200, None, None)
+                else:
+                    r = self._handler._set_authoring(self._reality_data_id, False)
+                    self._closed = Response(r.status_code, r.error, None)
+            return self._closed
+
+    def __enter__(self) -> "UploadSession":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
 class RealityDataHandler:
     """
     Class for uploading to, downloading from, and listing a reality data
@@ -173,43 +2137,154 @@ class RealityDataHandler:
         """
         self._service = RealityCaptureService(token_factory, **kwargs)
         self._progress_hook = None
+        self._progress_rate = 10.0
+        self._progress_detailed = False
+        self._max_workers = 32
+        self._max_concurrency = 16
+        self._links = _LinkCache()
 
     def _get_link(self, rd_id: str, itwin_id: Optional[str], read_only: bool) -> Response[ContainerDetails]:
         if not read_only:
-            return self._service.get_reality_data_write_access(rd_id, itwin_id)
-        return self._service.get_reality_data_read_access(rd_id, itwin_id)
+            return self._links.get((rd_id, itwin_id, read_only),
+                                   lambda: self._service.get_reality_data_write_access(rd_id, itwin_id))
+        return self._links.get((rd_id, itwin_id, read_only),
+                               lambda: self._service.get_reality_data_read_access(rd_id, itwin_id))
+
+    def _get_link_refresh(self, rd_id: str, itwin_id: Optional[str], read_only: bool) -> Callable[[], Optional[str]]:
+        def _refresh():
+            r = self._get_link(rd_id, itwin_id, read_only)
+            return None if r.is_error() else r.value.links.container_url.href
+        return _refresh
 
     def _set_authoring(self, rd_id: str, authoring: bool) -> Response[RealityData]:
         rdu = RealityDataUpdate(authoring=authoring)
         return self._service.update_reality_data(rdu, rd_id)
 
     def upload_data(self, reality_data_id: str, src: str,
-                    reality_data_dst: str = "", itwin_id: Optional[str] = None) -> Response[None]:
+                    reality_data_dst: str = "", itwin_id: Optional[str] = None,
+                    sync: bool = False, resume: bool = False,
+                    data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
         """
         Upload files to a reality data.
 
         :param reality_data_id: Id of the Reality Data.
         :param src: Source path to upload. If directory, all the files in the directory will be uploaded recursively.
+         Files must not be truncated while they upload: files above 4 GB are read through a memory map, and reading
+         a truncated map ends the process.
         :param reality_data_dst: Destination of the data inside the Reality Data, default to root.
         :param itwin_id: Optional iTwin id for finding the reality data.
-        :return: A Response[None] containing the error from the service if any.
+        :param sync: If True, files already present in the Reality Data with the same size and content are skipped.
+        :param resume: If True, large files are uploaded block by block and the staged blocks are recorded in a
+         local journal. Calling again with the same parameters after a failure resumes from the last staged block.
+        :param data_filter: Optional filter of the files to upload, applied while scanning the source.
+        :return: A Response[TransferResult] containing either the uploaded and skipped files
+         or the error from the service. Files that still fail after being retried are listed in the result, with
+         a 207 status if other files were uploaded, and can be uploaded again with
+         :meth:`TransferResult.retry_failed`.
         """
+        session = self.upload_session(reality_data_id, itwin_id)
+        r = session.open()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        resp = session.upload_data(src, reality_data_dst, sync, resume, data_filter)
+        r = session.close()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return resp
 
-        rlink = self._get_link(reality_data_id, itwin_id, False)
-        if rlink.is_error():
-            return Response(rlink.status_code, rlink.error, None)
-        r = self._set_authoring(reality_data_id, True)
+    def upload_streams(self, reality_data_id: str,
+                       items: Iterable[tuple[str, Union[bytes, bytearray, memoryview, BinaryIO]]],
+                       reality_data_dst: str = "", itwin_id: Optional[str] = None) -> Response[TransferResult]:
+        """
+        Upload in-memory data and streams to a reality data, without writing them to files first.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param items: Pairs of file name and content. Contents can be bytes-like objects, read in place,
+         or binary file-like objects, read from their current position. Items are consumed while uploading,
+         a generator can produce them as they are needed.
+        :param reality_data_dst: Destination of the data inside the Reality Data, default to root.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :return: A Response[TransferResult] containing either the uploaded files or the error from the service.
+        """
+        session = self.upload_session(reality_data_id, itwin_id)
+        r = session.open()
         if r.is_error():
             return Response(r.status_code, r.error, None)
-        resp = _DataHandler.upload_data(rlink.value.links.container_url.href,
-                                        src, reality_data_dst, self._progress_hook)
-        r = self._set_authoring(reality_data_id, False)
+        resp = session.upload_streams(items, reality_data_dst)
+        r = session.close()
         if r.is_error():
             return Response(r.status_code, r.error, None)
         return resp
 
+    def upload_batch(self, targets: list[UploadTarget], sync: bool = False,
+                     resume: bool = False) -> Response[list[UploadTargetResult]]:
+        """
+        Upload files to several reality data at once, creating the ones that do not exist yet.
+        The files of all the targets are uploaded by the same workers, largest first, so that the transfer does not
+        slow down between two targets. A target failing does not stop the others.
+
+        :param targets: Sources and destinations of the uploads.
+         Targets creating the same RealityDataCreate instance upload to the same new reality data.
+        :param sync: If True, files already present in the Reality Data with the same size and content are skipped.
+        :param resume: If True, large files are uploaded block by block and the staged blocks are recorded in a
+         local journal. Calling again with the same parameters after a failure resumes from the last staged block.
+        :return: A Response[list[UploadTargetResult]] containing the result of each target, in the order of the
+         targets.
+        """
+        # Reality data creations, and sessions opening and closing, are independent service calls
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            creations = {id(t.reality_data): t.reality_data for t in targets
+                         if isinstance(t.reality_data, RealityDataCreate)}
+            created = dict(zip(creations, executor.map(self._service.create_reality_data, creations.values())))
+            keys = []
+            errors = {}
+            for index, target in enumerate(targets):
+                if not isinstance(target.reality_data, RealityDataCreate):
+                    keys.append((target.reality_data, target.itwin_id))
+                    continue
+                r = created[id(target.reality_data)]
+                if r.is_error():
+                    keys.append(None)
+                    errors[index] = r
+                else:
+                    keys.append((r.value.id, target.itwin_id or target.reality_data.itwin_id))
+
+            sessions = {key: self.upload_session(*key) for key in keys if key is not None}
+            opened = dict(zip(sessions, executor.map(UploadSession.open, sessions.values())))
+            for index, key in enumerate(keys):
+                if key is not None and opened[key].is_error():
+                    errors[index] = opened[key]
+            indexes = [index for index in range(len(targets)) if index not in errors]
+            responses = _DataHandler.upload_batch(
+                [(sessions[keys[index]]._container_url, self._get_link_refresh(*keys[index], False),
+                  targets[index].src, targets[index].dst) for index in indexes],
+                self._get_progress(), sync, resume, self._get_controller())
+            results = dict(zip(indexes, responses))
+            closed = dict(zip(sessions, executor.map(UploadSession.close, sessions.values())))
+        target_results = []
+        for index, key in enumerate(keys):
+            r = errors.get(index) or results[index]
+            if not r.is_error() and closed[key].is_error():
+                r = closed[key]
+            target_results.append(UploadTargetResult(reality_data_id=key[0] if key is not None else None,
+                                                     status_code=r.status_code, result=r.value, error=r.error))
+        return Response(200, None, target_results)
+
+    def upload_session(self, reality_data_id: str, itwin_id: Optional[str] = None) -> UploadSession:
+        """
+        Create a session for uploading files to a reality data in several calls.
+        Write access and authoring are requested once for the whole session instead of once per upload.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :return: An UploadSession, to use as a context manager.
+        """
+        return UploadSession(self, reality_data_id, itwin_id)
+
     def download_data(self, reality_data_id: str, dst: str,
-                      reality_data_src: str = "", itwin_id: Optional[str] = None) -> Response[None]:
+                      reality_data_src: str = "", itwin_id: Optional[str] = None,
+                      sync: bool = False, mirror: bool = False, resume: bool = False,
+                      data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
         """
         Download files from a reality data.
 
@@ -217,49 +2292,208 @@ class RealityDataHandler:
         :param dst: Destination path of the downloads.
         :param reality_data_src: Source folder to download in the Reality Data, default to root.
         :param itwin_id: Optional iTwin id for finding the reality data.
-        :return: A Response[None] containing the error from the service if any.
+        :param sync: If True, only files missing or changed in the destination are downloaded.
+         Downloaded files are tracked in a manifest stored in the destination.
+        :param mirror: If True, files in the destination that do not exist in the source are removed.
+        :param resume: If True, large files are downloaded by ranges into a ``.part`` file and the completed ranges
+         are recorded next to it. Calling again with the same parameters after a failure only downloads the missing
+         ranges.
+        :param data_filter: Optional filter of the files to download, applied while listing the source.
+         Local files left out by the filter are never removed by mirror.
+        :return: A Response[TransferResult] containing either the downloaded, skipped and deleted files
+         or the error from the service. Files that still fail after being retried are listed in the result, with
+         a 207 status if other files were downloaded, and can be downloaded again with
+         :meth:`TransferResult.retry_failed`.
         """
         r = self._get_link(reality_data_id, itwin_id, True)
         if r.is_error():
             return Response(r.status_code, r.error, None)
-        return _DataHandler.download_data(r.value.links.container_url.href, dst, reality_data_src, self._progress_hook)
+        return _DataHandler.download_data(r.value.links.container_url.href, dst, reality_data_src,
+                                          self._get_progress(), sync, mirror, resume, self._get_controller(),
+                                          refresh_link=self._get_link_refresh(reality_data_id, itwin_id, True),
+                                          data_filter=data_filter)
+
+    def _get_bucket(self, itwin_id: str) -> Response[BucketResponse]:
+        return self._links.get((itwin_id,), lambda: self._service.get_bucket(itwin_id))
+
+    def _get_bucket_refresh(self, itwin_id: str) -> Callable[[], Optional[str]]:
+        def _refresh():
+            r = self._get_bucket(itwin_id)
+            return None if r.is_error() else r.value.links.container_url.href
+        return _refresh
+
+    def _copy_to(self, src_container_url: str, src_refresh_link: Callable[[], Optional[str]], src: str,
+                 reality_data_id: str, reality_data_dst: str, itwin_id: Optional[str]) -> Response[TransferResult]:
+        session = self.upload_session(reality_data_id, itwin_id)
+        r = session.open()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        resp = _DataHandler.copy_data(src_container_url, session._container_url, src, reality_data_dst,
+                                      self._get_progress(), self._get_controller(),
+                                      src_refresh_link=src_refresh_link,
+                                      dst_refresh_link=self._get_link_refresh(reality_data_id, itwin_id, False))
+        r = session.close()
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return resp
+
+    def copy_data(self, src_reality_data_id: str, dst_reality_data_id: str, reality_data_src: str = "",
+                  reality_data_dst: str = "", itwin_id: Optional[str] = None) -> Response[TransferResult]:
+        """
+        Copy files from a reality data to another one.
+        Files are copied by the storage service itself, they are only relayed through this machine when the
+        service can not read the source.
+
+        :param src_reality_data_id: Id of the Reality Data to copy from.
+        :param dst_reality_data_id: Id of the Reality Data to copy to.
+        :param reality_data_src: Source folder to copy in the source Reality Data, default to root.
+        :param reality_data_dst: Destination of the data inside the destination Reality Data, default to root.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :return: A Response[TransferResult] containing either the copied files or the error from the service.
+        """
+        r = self._get_link(src_reality_data_id, itwin_id, True)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return self._copy_to(r.value.links.container_url.href,
+                             self._get_link_refresh(src_reality_data_id, itwin_id, True), reality_data_src,
+                             dst_reality_data_id, reality_data_dst, itwin_id)
 
-    def list_data(self, reality_data_id, itwin_id: Optional[str] = None) -> Response[list[str]]:
+    def copy_from_bucket(self, itwin_id: str, reality_data_id: str, bucket_src: str = "",
+                         reality_data_dst: str = "") -> Response[TransferResult]:
+        """
+        Copy files from the bucket of an iTwin to a reality data.
+        Files are copied by the storage service itself, they are only relayed through this machine when the
+        service can not read the source.
+
+        :param itwin_id: iTwin id for finding the bucket and the reality data.
+        :param reality_data_id: Id of the Reality Data.
+        :param bucket_src: Source folder to copy in the bucket, default to root.
+        :param reality_data_dst: Destination of the data inside the Reality Data, default to root.
+        :return: A Response[TransferResult] containing either the copied files or the error from the service.
+        """
+        r = self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return self._copy_to(r.value.links.container_url.href, self._get_bucket_refresh(itwin_id), bucket_src,
+                             reality_data_id, reality_data_dst, itwin_id)
+
+    def open_data(self, reality_data_id: str, name: str, itwin_id: Optional[str] = None) -> Response[RemoteFile]:
+        """
+        Open a file of a reality data for reading, without downloading it.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param name: Name of the file in the Reality Data.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :return: A Response[RemoteFile] containing either a seekable file object, to close after use,
+         or the error from the service.
+        """
+        r = self._get_link(reality_data_id, itwin_id, True)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return _DataHandler.open_data(r.value.links.container_url.href, name,
+                                      self._get_link_refresh(reality_data_id, itwin_id, True))
+
+    def read_data(self, reality_data_id: str, name: str, itwin_id: Optional[str] = None) -> Response[bytes]:
+        """
+        Read a whole file of a reality data into memory. Meant for small files.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param name: Name of the file in the Reality Data.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :return: A Response[bytes] containing either the content of the file or the error from the service.
+        """
+        r = self._get_link(reality_data_id, itwin_id, True)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return _DataHandler.read_data(r.value.links.container_url.href, name,
+                                      self._get_link_refresh(reality_data_id, itwin_id, True))
+
+    def list_data(self, reality_data_id, itwin_id: Optional[str] = None, prefix: str = "",
+                  data_filter: Optional[DataFilter] = None) -> Response[list[str]]:
         """
         List all the files inside a reality data.
 
         :param reality_data_id: Id of the Reality Data.
         :param itwin_id: Optional iTwin id for finding the reality data.
+        :param prefix: Only list the files whose name starts with this prefix, default to all files.
+        :param data_filter: Optional filter of the files to list, paths are relative to the prefix.
         :return: A Response[list[str]] containing either the files in the Reality Data or the error from the service.
         """
         r = self._get_link(reality_data_id, itwin_id, True)
         if r.is_error():
             return Response(r.status_code, r.error, None)
-        return _DataHandler.list_data(r.value.links.container_url.href)
+        return _DataHandler.list_data(r.value.links.container_url.href, prefix,
+                                      self._get_link_refresh(reality_data_id, itwin_id, True), data_filter)
 
-    def delete_data(self, reality_data_id, files_to_delete: list[str],
-                    itwin_id: Optional[str] = None) -> Response[None]:
+    def iter_data(self, reality_data_id, itwin_id: Optional[str] = None,
+                  prefix: str = "") -> Response[Iterator[DataInfo]]:
+        """
+        Iterate over the files inside a reality data.
+        Files are listed page by page while iterating, the whole listing is never kept in memory.
+
+        :param reality_data_id: Id of the Reality Data.
+        :param itwin_id: Optional iTwin id for finding the reality data.
+        :param prefix: Only list the files whose name starts with this prefix, default to all files.
+        :return: A Response[Iterator[DataInfo]] containing either an iterator over the files in the Reality Data
+         or the error from the service.
+        """
+        r = self._get_link(reality_data_id, itwin_id, True)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return Response(200, None, _DataHandler.iter_data(r.value.links.container_url.href, prefix,
+                                                          self._get_link_refresh(reality_data_id, itwin_id, True)))
+
+    def delete_data(self, reality_data_id, files_to_delete: Optional[list[str]] = None,
+                    itwin_id: Optional[str] = None, prefix: Optional[str] = None) -> Response[None]:
         """
         Delete specified files from a reality data.
+        Files are deleted in batches of 256, several batches running at the same time.
 
         :param reality_data_id: id of the Reality Data.
         :param files_to_delete: List of files to delete.
         :param itwin_id: iTwin id for finding the bucket.
+        :param prefix: If set, all the files whose name starts with the prefix are deleted as well.
+         An empty prefix deletes every file of the Reality Data.
         :return: A Response[None] containing either the files in the bucket or the error from the service.
         """
         r = self._get_link(reality_data_id, itwin_id, False)
         if r.is_error():
             return Response(r.status_code, r.error, None)
-        return _DataHandler.delete_data(r.value.links.container_url.href, files_to_delete)
+        return _DataHandler.delete_data(r.value.links.container_url.href, files_to_delete or [], prefix,
+                                        self._get_controller(),
+                                        refresh_link=self._get_link_refresh(reality_data_id, itwin_id, False))
 
-    def set_progress_hook(self, hook: Optional) -> None:
+    def set_progress_hook(self, hook: Optional, max_rate: float = 10.0, detailed: bool = False) -> None:
         """
         Set the progress hook.
 
         :param hook: Function taking a float as an argument and returning a bool.
          When returning false, the ongoing action will be cancelled. Can be None if no progress hook is needed.
+        :param max_rate: Maximum number of calls to the hook per second, 0 for no limit.
+        :param detailed: If True, the hook is called with a
+         :class:`~reality_capture.service.transfer.TransferProgress` instead of a percentage.
         """
         self._progress_hook = hook
+        self._progress_rate = max_rate
+        self._progress_detailed = detailed
+
+    def _get_progress(self) -> ProgressTracker:
+        return ProgressTracker(self._progress_hook, self._progress_rate, self._progress_detailed)
+
+    def _get_controller(self) -> ConcurrencyController:
+        return ConcurrencyController(self._max_workers, self._max_concurrency)
+
+    def set_concurrency_limits(self, max_workers: int = 32, max_concurrency: int = 16) -> None:
+        """
+        Set the upper bounds of the transfer concurrency.
+        Transfers start with a number of parallel files depending on the files to transfer, and adapt both values
+        to the measured throughput and to the throttling of the service, without exceeding these limits.
+
+        :param max_workers: Maximum number of files transferred in parallel.
+        :param max_concurrency: Maximum number of concurrent requests used for a single file.
+        """
+        self._max_workers = max_workers
+        self._max_concurrency = max_concurrency
 
 
 class BucketDataHandler:
@@ -277,70 +2511,237 @@ class BucketDataHandler:
         """
         self._service = RealityCaptureService(token_factory, **kwargs)
         self._progress_hook = None
+        self._progress_rate = 10.0
+        self._progress_detailed = False
+        self._max_workers = 32
+        self._max_concurrency = 16
+        self._links = _LinkCache()
 
     def _get_bucket(self, itwin_id: str) -> Response[BucketResponse]:
-        return self._service.get_bucket(itwin_id)
+        return self._links.get((itwin_id,), lambda: self._service.get_bucket(itwin_id))
+
+    def _get_bucket_refresh(self, itwin_id: str) -> Callable[[], Optional[str]]:
+        def _refresh():
+            r = self._get_bucket(itwin_id)
+            return None if r.is_error() else r.value.links.container_url.href
+        return _refresh
 
-    def upload_data(self, itwin_id: str, src: str, bucket_dst: str = "", ) -> Response[None]:
+    def upload_data(self, itwin_id: str, src: str, bucket_dst: str = "",
+                    sync: bool = False, resume: bool = False,
+                    data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
         """
         Upload files to a bucket.
 
         :param itwin_id: iTwin id for finding the bucket.
         :param src: Source path to upload. If directory, all the files in the directory will be uploaded recursively.
+         Files must not be truncated while they upload: files above 4 GB are read through a memory map, and reading
+         a truncated map ends the process.
         :param bucket_dst: Destination of the data inside the bucket, default to root.
-        :return: A Response[None] containing the error from the service if any.
+        :param sync: If True, files already present in the bucket with the same size and content are skipped.
+        :param resume: If True, large files are uploaded block by block and the staged blocks are recorded in a
+         local journal. Calling again with the same parameters after a failure resumes from the last staged block.
+        :param data_filter: Optional filter of the files to upload, applied while scanning the source.
+        :return: A Response[TransferResult] containing either the uploaded and skipped files
+         or the error from the service. Files that still fail after being retried are listed in the result, with
+         a 207 status if other files were uploaded, and can be uploaded again with
+         :meth:`TransferResult.retry_failed`.
         """
 
         r = self._get_bucket(itwin_id)
         if r.is_error():
             return Response(r.status_code, r.error, None)
-        return _DataHandler.upload_data(r.value.links.container_url.href, src, bucket_dst, self._progress_hook)
+        return _DataHandler.upload_data(r.value.links.container_url.href, src, bucket_dst, self._get_progress(),
+                                        sync, resume, self._get_controller(),
+                                        refresh_link=self._get_bucket_refresh(itwin_id), data_filter=data_filter)
+
+    def upload_streams(self, itwin_id: str,
+                       items: Iterable[tuple[str, Union[bytes, bytearray, memoryview, BinaryIO]]],
+                       bucket_dst: str = "") -> Response[TransferResult]:
+        """
+        Upload in-memory data and streams to a bucket, without writing them to files first.
+
+        :param itwin_id: iTwin id for finding the bucket.
+        :param items: Pairs of file name and content. Contents can be bytes-like objects, read in place,
+         or binary file-like objects, read from their current position. Items are consumed while uploading,
+         a generator can produce them as they are needed.
+        :param bucket_dst: Destination of the data inside the bucket, default to root.
+        :return: A Response[TransferResult] containing either the uploaded files or the error from the service.
+        """
+        r = self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return _DataHandler.upload_streams(r.value.links.container_url.href, items, bucket_dst, self._get_progress(),
+                                           self._get_controller(), refresh_link=self._get_bucket_refresh(itwin_id))
 
     def download_data(self, itwin_id: str, dst: str,
-                      bucket_src: str = "") -> Response[None]:
+                      bucket_src: str = "", sync: bool = False, mirror: bool = False,
+                      resume: bool = False, data_filter: Optional[DataFilter] = None) -> Response[TransferResult]:
         """
         Download files from a bucket.
 
         :param itwin_id: iTwin id for finding the bucket.
         :param dst: Destination path of the downloads.
         :param bucket_src: Source folder to download in the bucket, default to root.
-        :return: A Response[None] containing the error from the service if any.
+        :param sync: If True, only files missing or changed in the destination are downloaded.
+         Downloaded files are tracked in a manifest stored in the destination.
+        :param mirror: If True, files in the destination that do not exist in the source are removed.
+        :param resume: If True, large files are downloaded by ranges into a ``.part`` file and the completed ranges
+         are recorded next to it. Calling again with the same parameters after a failure only downloads the missing
+         ranges.
+        :param data_filter: Optional filter of the files to download, applied while listing the source.
+         Local files left out by the filter are never removed by mirror.
+        :return: A Response[TransferResult] containing either the downloaded, skipped and deleted files
+         or the error from the service. Files that still fail after being retried are listed in the result, with
+         a 207 status if other files were downloaded, and can be downloaded again with
+         :meth:`TransferResult.retry_failed`.
+        """
+        r = self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return _DataHandler.download_data(r.value.links.container_url.href, dst, bucket_src, self._get_progress(),
+                                          sync, mirror, resume, self._get_controller(),
+                                          refresh_link=self._get_bucket_refresh(itwin_id), data_filter=data_filter)
+
+    def _get_link(self, rd_id: str, itwin_id: Optional[str]) -> Response[ContainerDetails]:
+        return self._links.get((rd_id, itwin_id, True),
+                               lambda: self._service.get_reality_data_read_access(rd_id, itwin_id))
+
+    def _get_link_refresh(self, rd_id: str, itwin_id: Optional[str]) -> Callable[[], Optional[str]]:
+        def _refresh():
+            r = self._get_link(rd_id, itwin_id)
+            return None if r.is_error() else r.value.links.container_url.href
+        return _refresh
+
+    def copy_from_reality_data(self, itwin_id: str, reality_data_id: str, reality_data_src: str = "",
+                               bucket_dst: str = "") -> Response[TransferResult]:
+        """
+        Copy files from a reality data to the bucket of an iTwin.
+        Files are copied by the storage service itself, they are only relayed through this machine when the
+        service can not read the source.
+
+        :param itwin_id: iTwin id for finding the bucket and the reality data.
+        :param reality_data_id: Id of the Reality Data.
+        :param reality_data_src: Source folder to copy in the Reality Data, default to root.
+        :param bucket_dst: Destination of the data inside the bucket, default to root.
+        :return: A Response[TransferResult] containing either the copied files or the error from the service.
+        """
+        r = self._get_link(reality_data_id, itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        src_container_url = r.value.links.container_url.href
+        r = self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return _DataHandler.copy_data(src_container_url, r.value.links.container_url.href, reality_data_src,
+                                      bucket_dst, self._get_progress(), self._get_controller(),
+                                      src_refresh_link=self._get_link_refresh(reality_data_id, itwin_id),
+                                      dst_refresh_link=self._get_bucket_refresh(itwin_id))
+
+    def open_data(self, itwin_id: str, name: str) -> Response[RemoteFile]:
+        """
+        Open a file of a bucket for reading, without downloading it.
+
+        :param itwin_id: iTwin id for finding the bucket.
+        :param name: Name of the file in the bucket.
+        :return: A Response[RemoteFile] containing either a seekable file object, to close after use,
+         or the error from the service.
         """
         r = self._get_bucket(itwin_id)
         if r.is_error():
             return Response(r.status_code, r.error, None)
-        return _DataHandler.download_data(r.value.links.container_url.href, dst, bucket_src, self._progress_hook)
+        return _DataHandler.open_data(r.value.links.container_url.href, name, self._get_bucket_refresh(itwin_id))
+
+    def read_data(self, itwin_id: str, name: str) -> Response[bytes]:
+        """
+        Read a whole file of a bucket into memory. Meant for small files.
 
-    def list_data(self, itwin_id: str) -> Response[list[str]]:
+        :param itwin_id: iTwin id for finding the bucket.
+        :param name: Name of the file in the bucket.
+        :return: A Response[bytes] containing either the content of the file or the error from the service.
+        """
+        r = self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return _DataHandler.read_data(r.value.links.container_url.href, name, self._get_bucket_refresh(itwin_id))
+
+    def list_data(self, itwin_id: str, prefix: str = "",
+                  data_filter: Optional[DataFilter] = None) -> Response[list[str]]:
         """
         List all the files inside a bucket.
 
         :param itwin_id: iTwin id for finding the bucket.
+        :param prefix: Only list the files whose name starts with this prefix, default to all files.
+        :param data_filter: Optional filter of the files to list, paths are relative to the prefix.
         :return: A Response[list[str]] containing either the files in the bucket or the error from the service.
         """
         r = self._get_bucket(itwin_id)
         if r.is_error():
             return Response(r.status_code, r.error, None)
-        return _DataHandler.list_data(r.value.links.container_url.href)
+        return _DataHandler.list_data(r.value.links.container_url.href, prefix, self._get_bucket_refresh(itwin_id),
+                                      data_filter)
+
+    def iter_data(self, itwin_id: str, prefix: str = "") -> Response[Iterator[DataInfo]]:
+        """
+        Iterate over the files inside a bucket.
+        Files are listed page by page while iterating, the whole listing is never kept in memory.
 
-    def delete_data(self, itwin_id, files_to_delete: list[str]) -> Response[None]:
+        :param itwin_id: iTwin id for finding the bucket.
+        :param prefix: Only list the files whose name starts with this prefix, default to all files.
+        :return: A Response[Iterator[DataInfo]] containing either an iterator over the files in the bucket
+         or the error from the service.
+        """
+        r = self._get_bucket(itwin_id)
+        if r.is_error():
+            return Response(r.status_code, r.error, None)
+        return Response(200, None, _DataHandler.iter_data(r.value.links.container_url.href, prefix,
+                                                          self._get_bucket_refresh(itwin_id)))
+
+    def delete_data(self, itwin_id, files_to_delete: Optional[list[str]] = None,
+                    prefix: Optional[str] = None) -> Response[None]:
         """
         Delete specified files from a bucket.
+        Files are deleted in batches of 256, several batches running at the same time.
 
         :param itwin_id: iTwin id for finding the bucket.
         :param files_to_delete: List of files to delete.
+        :param prefix: If set, all the files whose name starts with the prefix are deleted as well.
+         An empty prefix deletes every file of the bucket.
         :return: A Response[None] containing either the files in the bucket or the error from the service.
         """
         r = self._get_bucket(itwin_id)
         if r.is_error():
             return Response(r.status_code, r.error, None)
-        return _DataHandler.delete_data(r.value.links.container_url.href, files_to_delete)
+        return _DataHandler.delete_data(r.value.links.container_url.href, files_to_delete or [], prefix,
+                                        self._get_controller(), refresh_link=self._get_bucket_refresh(itwin_id))
 
-    def set_progress_hook(self, hook: Optional) -> None:
+    def set_progress_hook(self, hook: Optional, max_rate: float = 10.0, detailed: bool = False) -> None:
         """
         Set the progress hook.
 
         :param hook: Function taking a float as an argument and returning a bool.
          When returning false, the ongoing action will be cancelled. Can be None if no progress hook is needed.
+        :param max_rate: Maximum number of calls to the hook per second, 0 for no limit.
+        :param detailed: If True, the hook is called with a
+         :class:`~reality_capture.service.transfer.TransferProgress` instead of a percentage.
         """
         self._progress_hook = hook
+        self._progress_rate = max_rate
+        self._progress_detailed = detailed
+
+    def _get_progress(self) -> ProgressTracker:
+        return ProgressTracker(self._progress_hook, self._progress_rate, self._progress_detailed)
+
+    def _get_controller(self) -> ConcurrencyController:
+        return ConcurrencyController(self._max_workers, self._max_concurrency)
+
+    def set_concurrency_limits(self, max_workers: int = 32, max_concurrency: int = 16) -> None:
+        """
+        Set the upper bounds of the transfer concurrency.
+        Transfers start with a number of parallel files depending on the files to transfer, and adapt both values
+        to the measured throughput and to the throttling of the service, without exceeding these limits.
+
+        :param max_workers: Maximum number of files transferred in parallel.
+        :param max_concurrency: Maximum number of concurrent requests used for a single file.
+        """
+        self._max_workers = max_workers
+        self._max_concurrency = max_concurrency
@@ -0,0 +1,479 @@
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+from pydantic import BaseModel, Field
+
+
+class TransferProgress(BaseModel):
+    bytes_done: int = Field(description="Number of bytes transferred or skipped.")
+    bytes_total: int = Field(description="Number of bytes to transfer.")
+    files_done: int = Field(description="Number of files transferred or skipped.")
+    files_total: int = Field(description="Number of files to transfer.")
+    rate: float = Field(description="Current transfer rate in bytes per second.")
+    eta: Optional[float] = Field(None, description="Estimated remaining time in seconds, None if unknown.")
+
+    @property
+    def percentage(self) -> float:
+        """Percentage of bytes done."""
+        return (self.bytes_done / self.bytes_total) * 100 if self.bytes_total > 0 else 100.0
+
+
+class ProgressTracker:
+    """
+    Thread-safe aggregation of the progress of all the files of a transfer.
+
+    Each update only adjusts a running total. The progress hook is called at most ``max_rate`` times per second,
+    from one thread at a time. Once the hook returned False, every following update raises an ``InterruptedError``.
+    """
+
+    _RATE_SMOOTHING = 0.3
+
+    def __init__(self, hook=None, max_rate: float = 10.0, detailed: bool = False) -> None:
+        """
+        Constructor method
+
+        :param hook: Function returning a bool, called with the percentage of bytes done, or with a
+         :class:`TransferProgress` if ``detailed`` is True. Can be None if no progress hook is needed.
+        :param max_rate: Maximum number of calls to the hook per second, 0 for no limit.
+        :param detailed: Whether the hook is called with a :class:`TransferProgress` instead of a percentage.
+        """
+        self._hook = hook
+        self._min_interval = 1 / max_rate if max_rate > 0 else 0.0
+        self._detailed = detailed
+        self._lock = threading.Lock()
+        self._dispatch_lock = threading.Lock()
+        self._values = {}
+        self._bytes_done = 0
+        self._bytes_skipped = 0
+        self._bytes_total = 0
+        self._files_done = 0
+        self._files_total = 0
+        self._rate = 0.0
+        self._last_time = time.monotonic()
+        self._last_bytes = 0
+        self._last_dispatch = float("-inf")
+        self._proceed = True
+
+    def start(self, bytes_total: int, files_total: int) -> None:
+        """
+        Set the amount of data to transfer. The progress of a previous transfer tracked by this instance is reset.
+
+        :param bytes_total: Number of bytes to transfer.
+        :param files_total: Number of files to transfer.
+        """
+        with self._lock:
+            self._values = {}
+            self._bytes_done = 0
+            self._bytes_skipped = 0
+            self._files_done = 0
+            self._rate = 0.0
+            self._last_bytes = 0
+            self._bytes_total = bytes_total
+            self._files_total = files_total
+            self._last_time = time.monotonic()
+
+    def add_total(self, nb_bytes: int, nb_files: int = 1) -> None:
+        """
+        Add data to transfer, for transfers whose total is discovered while they run.
+
+        :param nb_bytes: Number of bytes to add.
+        :param nb_files: Number of files to add.
+        """
+        with self._lock:
+            self._bytes_total += nb_bytes
+            self._files_total += nb_files
+
+    def update(self, key: str, current: int) -> None:
+        """
+        Record the number of bytes transferred so far for a file.
+
+        :param key: Name of the file.
+        :param current: Number of bytes of the file transferred so far.
+        """
+        with self._lock:
+            self._bytes_done += current - self._values.get(key, 0)
+            self._values[key] = current
+        self._dispatch(False)
+
+    def complete(self, key: str, size: int) -> None:
+        """
+        Record a file as transferred.
+
+        :param key: Name of the file.
+        :param size: Size of the file.
+        """
+        with self._lock:
+            self._bytes_done += size - self._values.pop(key, 0)
+            self._files_done += 1
+        self._dispatch(False)
+
+    def skip(self, key: str, size: int) -> None:
+        """
+        Record a file as skipped, its bytes are not accounted in the transfer rate.
+
+        :param key: Name of the file.
+        :param size: Size of the file.
+        """
+        with self._lock:
+            self._bytes_done += size - self._values.pop(key, 0)
+            self._bytes_skipped += size
+            self._files_done += 1
+        self._dispatch(False)
+
+    def flush(self) -> None:
+        """
+        Call the hook with the current progress, whatever the time elapsed since the last call.
+        """
+        self._dispatch(True)
+
+    def get(self) -> TransferProgress:
+        """
+        Get the current progress.
+
+        :return: The current progress.
+        """
+        with self._lock:
+            return self._snapshot(time.monotonic())
+
+    def _snapshot(self, now: float) -> TransferProgress:
+        transferred = self._bytes_done - self._bytes_skipped
+        elapsed = now - self._last_time
+        if elapsed > 0:
+            instant = max(0, transferred - self._last_bytes) / elapsed
+            self._rate = instant if self._rate == 0 else (self._RATE_SMOOTHING * instant +
+                                                          (1 - self._RATE_SMOOTHING) * self._rate)
+            self._last_time = now
+            self._last_bytes = transferred
+        remaining = max(0, self._bytes_total - self._bytes_done)
+        eta = remaining / self._rate if self._rate > 0 else (0.0 if remaining == 0 else None)
+        return TransferProgress(bytes_done=self._bytes_done, bytes_total=self._bytes_total,
+                                files_done=self._files_done, files_total=self._files_total, rate=self._rate, eta=eta)
+
+    def _dispatch(self, force: bool) -> None:
+        if self._hook is not None:
+            now = time.monotonic()
+            if force or now - self._last_dispatch >= self._min_interval:
+                # Never block a transfer thread because another one is calling the hook
+                if self._dispatch_lock.acquire(blocking=force):
+                    try:
+                        self._last_dispatch = now
+                        with self._lock:
+                            progress = self._snapshot(now)
+                        proceed = self._hook(progress if self._detailed else progress.percentage)
+                        self._proceed = self._proceed and proceed
+                    finally:
+                        self._dispatch_lock.release()
+        if not self._proceed and not force:
+            raise InterruptedError("Transfer interrupted by callback function")
+
+
+class ConcurrencyController:
+    """
+    Controller adjusting, while a transfer runs, the number of files transferred in parallel and the number of
+    concurrent requests used for each blob.
+
+    It follows an additive increase, multiplicative decrease (AIMD) scheme: both values grow by one every measurement
+    window as long as the throughput does not degrade, and are halved when the service throttles requests.
+    A sharp rise of the latency of small files is considered as a congestion signal and slowly reduces the number
+    of parallel files.
+    """
+
+    _THROTTLING_STATUS = {429, 503}
+    _THROTTLING_CODES = {"ServerBusy", "OperationTimedOut", "IngressOverAccountLimit", "EgressOverAccountLimit",
+                         "TpsOverAccountLimit"}
+
+    def __init__(self, max_workers: int = 32, max_concurrency: int = 16, window: float = 2.0) -> None:
+        """
+        Constructor method
+
+        :param max_workers: Maximum number of files transferred in parallel.
+        :param max_concurrency: Maximum number of concurrent requests for a single blob.
+        :param window: Duration in seconds of a measurement window.
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_concurrency = max(1, max_concurrency)
+        self._window = window
+        self._cond = threading.Condition()
+        self._workers = float(self.max_workers)
+        self._concurrency = self.max_concurrency
+        self._active = 0
+        self._last_throttle = float("-inf")
+        self._throughput = 0.0
+        self._baseline_latency = None
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_latencies = []
+
+    @property
+    def workers(self) -> int:
+        """Number of files that can currently be transferred in parallel."""
+        return max(1, int(self._workers))
+
+    @property
+    def concurrency(self) -> int:
+        """Number of concurrent requests that can currently be used for a single blob."""
+        return self._concurrency
+
+    def start(self, workers: int) -> None:
+        """
+        Reset the measurements and set the initial number of parallel files.
+
+        :param workers: Initial number of files transferred in parallel, bounded by ``max_workers``.
+        """
+        with self._cond:
+            self._workers = float(min(max(1, workers), self.max_workers))
+            self._concurrency = self.max_concurrency
+            self._throughput = 0.0
+            self._baseline_latency = None
+            self._reset_window(time.monotonic())
+            self._cond.notify_all()
+
+    def grow(self, workers: int) -> None:
+        """
+        Raise the number of parallel files, for transfers whose files are discovered while they run.
+        Does nothing if the controller already allows more files.
+
+        :param workers: Number of files to transfer in parallel, bounded by ``max_workers``.
+        """
+        with self._cond:
+            self._workers = max(self._workers, float(min(workers, self.max_workers)))
+            self._cond.notify_all()
+
+    def try_acquire(self) -> bool:
+        """
+        Take a slot for a new file if one is available, without waiting.
+
+        :return: True if a slot was taken.
+        """
+        with self._cond:
+            if self._active >= self.workers:
+                return False
+            self._active += 1
+            return True
+
+    def release(self) -> None:
+        """
+        Release a slot taken with :meth:`try_acquire`.
+        """
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def record(self, size: int, elapsed: float, small: bool = False) -> None:
+        """
+        Record a completed transfer.
+
+        :param size: Number of bytes transferred.
+        :param elapsed: Duration of the transfer in seconds.
+        :param small: Whether the transfer was a single request, its duration is then used as a latency sample.
+        """
+        with self._cond:
+            self._window_bytes += size
+            if small and elapsed > 0:
+                self._window_latencies.append(elapsed)
+            self._update(time.monotonic())
+            self._cond.notify_all()
+
+    def on_response(self, response) -> None:
+        """
+        Hook called by the storage pipeline for every response received, retried ones included.
+
+        :param response: Pipeline response.
+        """
+        http_response = response.http_response
+        code = http_response.headers.get("x-ms-error-code")
+        if http_response.status_code in self._THROTTLING_STATUS or code in self._THROTTLING_CODES:
+            self.throttle()
+
+    def throttle(self) -> None:
+        """
+        Halve the number of parallel files and the concurrency per blob.
+        """
+        with self._cond:
+            now = time.monotonic()
+            # Throttled requests come in bursts, only react once per window
+            if now - self._last_throttle < self._window:
+                return
+            self._last_throttle = now
+            self._workers = max(1.0, self._workers / 2)
+            self._concurrency = max(1, self._concurrency // 2)
+            self._reset_window(now)
+
+    def _reset_window(self, now: float) -> None:
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_latencies = []
+
+    def _update(self, now: float) -> None:
+        elapsed = now - self._window_start
+        if elapsed < self._window:
+            return
+        throughput = self._window_bytes / elapsed
+        latency = statistics.median(self._window_latencies) if self._window_latencies else None
+        if latency is not None and self._baseline_latency is not None and latency > 2 * self._baseline_latency:
+            self._workers = max(1.0, self._workers - 1)
+        elif throughput >= 0.95 * self._throughput and now - self._last_throttle >= 2 * self._window:
+            self._workers = min(float(self.max_workers), self._workers + 1)
+            self._concurrency = min(self.max_concurrency, self._concurrency + 1)
+        if latency is not None:
+            self._baseline_latency = latency if self._baseline_latency is None else min(self._baseline_latency,
+                                                                                       latency)
+        self._throughput = throughput
+        self._reset_window(now)
+
+
+class TransferScheduler:
+    """
+    Process-wide scheduler running the transfers of all the data handlers.
+
+    Files are transferred on a persistent pool of threads, reused from one transfer to the next. Each transfer only
+    queues a new file when the previous one of its files completes, so concurrent transfers take turns on the pool.
+    The number of bytes buffered and the number of connections opened by all the transfers together are bounded.
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, max_threads: int = 64, max_connections: int = 256,
+                 max_bytes: int = 512 * 1024 * 1024) -> None:
+        """
+        Constructor method
+
+        :param max_threads: Number of threads of the pool running the transfers.
+        :param max_connections: Maximum number of connections in flight across all the transfers.
+        :param max_bytes: Maximum number of bytes in flight across all the transfers.
+        """
+        self.max_threads = max(1, max_threads)
+        self.max_connections = max(1, max_connections)
+        self.max_bytes = max(1, max_bytes)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._waiters = deque()
+        self._connections = 0
+        self._bytes = 0
+
+    @classmethod
+    def get_default(cls) -> "TransferScheduler":
+        """
+        Get the scheduler shared by all the data handlers of the process.
+
+        :return: The default scheduler, created on first use.
+        """
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = TransferScheduler()
+            return cls._default
+
+    @classmethod
+    def set_default(cls, scheduler: "TransferScheduler") -> None:
+        """
+        Replace the scheduler shared by all the data handlers of the process.
+        Transfers already running keep using the previous scheduler.
+
+        :param scheduler: New default scheduler.
+        """
+        with cls._default_lock:
+            cls._default = scheduler
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_threads,
+                                                    thread_name_prefix="reality_capture_transfer")
+            return self._executor
+
+    @contextmanager
+    def reserve(self, nb_bytes: int, connections: int = 1):
+        """
+        Wait until the budget allows a new request, then hold it until the end of the block.
+        Reservations are granted in order, a large one is never starved by smaller ones.
+
+        :param nb_bytes: Number of bytes the request will buffer, bounded by ``max_bytes``.
+        :param connections: Number of connections the request will open, bounded by ``max_connections``.
+        """
+        nb_bytes = min(max(0, nb_bytes), self.max_bytes)
+        connections = min(max(1, connections), self.max_connections)
+        ticket = object()
+        with self._cond:
+            self._waiters.append(ticket)
+            while (self._waiters[0] is not ticket or self._bytes + nb_bytes > self.max_bytes or
+                   self._connections + connections > self.max_connections):
+                self._cond.wait()
+            self._waiters.popleft()
+            self._bytes += nb_bytes
+            self._connections += connections
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._bytes -= nb_bytes
+                self._connections -= connections
+                self._cond.notify_all()
+
+    def run(self, fn, items, controller: Optional[ConcurrencyController] = None) -> None:
+        """
+        Call a function on every item, on the pool of threads.
+        The number of calls running at the same time for this transfer is given by the controller.
+        When a call fails, no new call is started and the first error is raised once the running ones completed.
+
+        :param fn: Function to call with each item.
+        :param items: Items to process.
+        :param controller: Controller giving the number of parallel calls, one at a time if None.
+        """
+        controller = controller or ConcurrencyController(max_workers=1)
+        executor = self._get_executor()
+        items = iter(items)
+        lock = threading.Lock()
+        done = threading.Event()
+        running = 0
+        exhausted = False
+        errors = []
+
+        def _fill():
+            nonlocal running, exhausted
+            while True:
+                with lock:
+                    if exhausted or errors or not controller.try_acquire():
+                        if running == 0 and (exhausted or errors):
+                            done.set()
+                        return
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        controller.release()
+                        if running == 0:
+                            done.set()
+                        return
+                    except BaseException as e:
+                        errors.append(e)
+                        controller.release()
+                        if running == 0:
+                            done.set()
+                        return
+                    running += 1
+                executor.submit(_run, item)
+
+        def _run(item):
+            nonlocal running
+            try:
+                fn(item)
+            except BaseException as e:
+                with lock:
+                    errors.append(e)
+            finally:
+                controller.release()
+                with lock:
+                    running -= 1
+                _fill()
+
+        _fill()
+        done.wait()
+        if errors:
+            raise errors[0]
@@ -0,0 +1,497 @@
+import asyncio
+import json
+import os
+from collections import namedtuple
+
+import responses
+from reality_capture.service.async_data_handler import AsyncRealityDataHandler, AsyncBucketDataHandler
+from reality_capture.service.data_handler import _DataHandler, DataFilter
+from unittest.mock import patch, MagicMock, AsyncMock
+import pytest
+import tempfile
+
+
+class FakeTokenFactory:
+    @staticmethod
+    def get_token() -> str:
+        return "Bearer invalid"
+
+
+async def mock_blob(*args, **kwargs):
+    if "progress_hook" in kwargs:
+        await kwargs["progress_hook"](50, None)  # Simulate progress update
+
+
+async def mock_blob_except(*args, **kwargs):
+    raise Exception("this is a test")
+
+
+def mock_list(items):
+    async def _list(*args, name_starts_with=None, **kwargs):
+        for item in items:
+            if not name_starts_with or getattr(item, "name", item).startswith(name_starts_with):
+                yield item
+    return _list
+
+
+def mock_delete_blobs(failing):
+    MyResponse = namedtuple("MyResponse", ["status_code"])
+
+    async def _delete_blobs(*names, **kwargs):
+        return mock_list([MyResponse(404 if name in failing else 202) for name in names])()
+    return _delete_blobs
+
+
+def mock_stream(content):
+    stream = MagicMock()
+    stream.readall = AsyncMock(return_value=content)
+    return stream
+
+
+@pytest.fixture
+def mock_container_client_default():
+    with patch("azure.storage.blob.aio.ContainerClient.from_container_url") as mock_client:
+        mock_instance = MagicMock()
+        mock_instance.close = AsyncMock()
+        mock_instance.upload_blob = AsyncMock()
+        mock_instance.download_blob = AsyncMock()
+        mock_instance.delete_blob = AsyncMock()
+        # Listings are walked folder by folder, by default every blob is at the root of the container
+        mock_instance.walk_blobs.side_effect = lambda **kwargs: mock_instance.list_blobs(**kwargs)
+        mock_instance.delete_blobs = AsyncMock(side_effect=mock_delete_blobs(set()))
+        mock_client.return_value = mock_instance
+        yield mock_client, mock_instance
+
+
+class TestAsyncRealityDataHandler:
+    def setup_method(self, _):
+        self.ftf = FakeTokenFactory()
+        self.rdh = AsyncRealityDataHandler(self.ftf)
+        cf = os.path.dirname(os.path.abspath(__file__))
+        self.data_folder = os.path.join(cf, "data")
+        self.rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+
+    def _add_access(self, access):
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{self.rd_id}/{access}',
+                      json=payload, status=200)
+
+    def _add_authoring(self):
+        with open(f"{self.data_folder}/reality_data_get_200.json", 'r') as payload_data:
+            pl_author = json.load(payload_data)
+        responses.add(responses.PATCH,
+                      f'https://api.bentley.com/reality-management/reality-data/{self.rd_id}',
+                      json=pl_author, status=200)
+
+    @responses.activate
+    def test_list_data_link_error(self):
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{self.rd_id}/readaccess',
+                      json={"error": {"code": "HeaderNotFound",
+                                      "message": "Header Authorization was not found in the request. Access denied."}},
+                      status=401)
+
+        r = asyncio.run(self.rdh.list_data(self.rd_id))
+        assert r.is_error()
+        assert r.get_response_status_code() == 401
+        assert r.error.error.code == "HeaderNotFound"
+
+    @responses.activate
+    def test_list_data_ok(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size"])
+        mock_client_instance.list_blobs.side_effect = mock_list([MyBlob("file2.txt", 1), MyBlob("file1.txt", 1)])
+        self._add_access("readaccess")
+
+        r = asyncio.run(self.rdh.list_data(self.rd_id))
+        assert not r.is_error()
+        assert r.value == ["file1.txt", "file2.txt"]
+        mock_client_instance.close.assert_awaited_once()
+
+    @responses.activate
+    def test_iter_data_ok(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag", "content_settings", "last_modified"])
+        mock_client_instance.list_blobs.side_effect = mock_list([MyBlob("tiles/a.b3dm", 7, "0x1", None, None),
+                                                                 MyBlob("other.txt", 7, "0x2", None, None)])
+        self._add_access("readaccess")
+
+        async def _collect():
+            r = await self.rdh.iter_data(self.rd_id, prefix="tiles/")
+            return [f async for f in r.value]
+
+        files = asyncio.run(_collect())
+        assert [f.name for f in files] == ["tiles/a.b3dm"]
+        mock_client_instance.close.assert_awaited_once()
+
+    @responses.activate
+    def test_upload_data_ok(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+        self._add_access("writeaccess")
+        self._add_authoring()
+
+        progress = []
+        self.rdh.set_progress_hook(lambda x: progress.append(x) or True, max_rate=0)
+        r = asyncio.run(self.rdh.upload_data(self.rd_id, self.data_folder, "dst"))
+        assert not r.is_error()
+        assert r.get_response_status_code() == 200
+        assert len(r.value.transferred) == len(os.listdir(self.data_folder))
+        assert mock_client_instance.upload_blob.await_count == len(os.listdir(self.data_folder))
+        assert progress[-1] == 100
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_upload_data_reader(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        uploaded = {}
+
+        async def _upload_blob(name, data, length=None, **kwargs):
+            # The file is read in a worker thread, the client awaits its reads
+            assert not data.seekable()
+            uploaded[name] = (await data.read(length), length)
+
+        mock_client_instance.upload_blob.side_effect = _upload_blob
+        self._add_access("writeaccess")
+        self._add_authoring()
+
+        path = f"{self.data_folder}/reality_data_read_access_200.json"
+        r = asyncio.run(self.rdh.upload_data(self.rd_id, path))
+        assert not r.is_error()
+        with open(path, "rb") as f:
+            content = f.read()
+        assert uploaded == {"reality_data_read_access_200.json": (content, len(content))}
+
+    @responses.activate
+    def test_upload_data_filter(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+        self._add_access("writeaccess")
+        self._add_authoring()
+
+        data_filter = DataFilter(include=["reality_data_get_*"])
+        r = asyncio.run(self.rdh.upload_data(self.rd_id, self.data_folder, "dst", data_filter=data_filter))
+        assert not r.is_error()
+        expected = sorted(f"dst/{name}" for name in os.listdir(self.data_folder)
+                          if name.startswith("reality_data_get_"))
+        assert expected
+        assert r.value.transferred == expected
+
+    @responses.activate
+    def test_upload_data_interrupted(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+        self._add_access("writeaccess")
+        self._add_authoring()
+
+        self.rdh.set_progress_hook(lambda x: False)
+        r = asyncio.run(self.rdh.upload_data(self.rd_id, f"{self.data_folder}/reality_data_read_access_200.json"))
+        assert r.is_error()
+        assert r.get_response_status_code() == 499
+        assert r.error.error.code == "UploadInterrupted"
+
+    @responses.activate
+    def test_upload_data_exception(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob_except
+        self._add_access("writeaccess")
+        self._add_authoring()
+
+        r = asyncio.run(self.rdh.upload_data(self.rd_id, self.data_folder))
+        assert r.is_error()
+        assert r.get_response_status_code() == 500
+        assert r.error.error.code == "UploadFailure"
+
+    @responses.activate
+    def test_download_data_ok(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag"], defaults=["0x1"])
+        blobs = [MyBlob(f"folder/{i}.txt", 7) for i in range(50)] + [MyBlob("other.txt", 7)]
+        mock_client_instance.list_blobs.side_effect = mock_list(blobs)
+        mock_client_instance.download_blob.return_value = mock_stream(b"content")
+        self._add_access("readaccess")
+
+        self.rdh.set_concurrency_limits(max_workers=8)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            r = asyncio.run(self.rdh.download_data(self.rd_id, tmp_dir, "folder"))
+            assert not r.is_error()
+            assert len(r.value.transferred) == 50
+            assert sorted(os.listdir(tmp_dir)) == sorted(f"{i}.txt" for i in range(50))
+            with open(os.path.join(tmp_dir, "0.txt"), "rb") as f:
+                assert f.read() == b"content"
+
+    @responses.activate
+    def test_download_data_ranges(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag"])
+        content = b"0123456789"
+        mock_client_instance.list_blobs.side_effect = mock_list([MyBlob("a.txt", len(content), "0x1")])
+        mock_client_instance.download_blob.side_effect = \
+            lambda name, offset=None, length=None, **kwargs: mock_stream(content[offset:offset + length])
+        self._add_access("readaccess")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with patch.object(_DataHandler, "_CHUNK_SIZE", 4):
+                r = asyncio.run(self.rdh.download_data(self.rd_id, tmp_dir))
+            assert not r.is_error()
+            with open(os.path.join(tmp_dir, "a.txt"), "rb") as f:
+                assert f.read() == content
+        calls = mock_client_instance.download_blob.call_args_list
+        assert sorted(c.kwargs["offset"] for c in calls) == [0, 4, 8]
+        assert all(c.kwargs["etag"] == "0x1" for c in calls)
+
+    @responses.activate
+    def test_download_data_filter(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag", "last_modified"], defaults=["0x1", None])
+        mock_client_instance.list_blobs.side_effect = mock_list([MyBlob("out/cloud.las", 7),
+                                                                 MyBlob("out/logs/run.las", 7),
+                                                                 MyBlob("out/notes.txt", 7)])
+        mock_client_instance.download_blob.return_value = mock_stream(b"content")
+        self._add_access("readaccess")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ["notes.txt", "old.las"]:
+                with open(os.path.join(tmp_dir, name), "wb") as f:
+                    f.write(b"local")
+            data_filter = DataFilter(extensions=["LAS"], exclude=["logs/*"])
+            r = asyncio.run(self.rdh.download_data(self.rd_id, tmp_dir, "out", mirror=True, data_filter=data_filter))
+            assert not r.is_error()
+            assert r.value.transferred == ["out/cloud.las"]
+            # Only the files the filter selects are mirrored
+            assert r.value.deleted == ["old.las"]
+            assert os.path.exists(os.path.join(tmp_dir, "notes.txt"))
+
+    @responses.activate
+    def test_download_data_exception(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag"], defaults=["0x1"])
+        mock_client_instance.list_blobs.side_effect = mock_list([MyBlob("a.txt", 100)])
+        stream = MagicMock()
+        stream.readall = AsyncMock(side_effect=Exception("this is a test"))
+        mock_client_instance.download_blob.return_value = stream
+        self._add_access("readaccess")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            r = asyncio.run(self.rdh.download_data(self.rd_id, tmp_dir))
+            assert r.is_error()
+            assert r.get_response_status_code() == 500
+            assert r.error.error.code == "DownloadFailure"
+            assert not os.path.exists(os.path.join(tmp_dir, "a.txt"))
+
+    @responses.activate
+    def test_delete_data(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+
+        MyBlob = namedtuple("MyBlob", ["name", "size"])
+        mock_client_instance.list_blobs.side_effect = mock_list([MyBlob(f"tiles/{i}.b3dm", 1) for i in range(300)])
+        mock_client_instance.delete_blobs.side_effect = mock_delete_blobs({"b.txt"})
+        self._add_access("writeaccess")
+
+        r = asyncio.run(self.rdh.delete_data(self.rd_id, ["a.txt", "b.txt"], prefix="tiles/"))
+        assert r.is_error()
+        assert r.get_response_status_code() == 400
+        assert [d.target for d in r.error.error.details] == ["b.txt"]
+        assert mock_client_instance.delete_blobs.await_count == 2
+
+
+class TestAsyncBucketDataHandler:
+    def setup_method(self, _):
+        self.ftf = FakeTokenFactory()
+        self.bdh = AsyncBucketDataHandler(self.ftf)
+        cf = os.path.dirname(os.path.abspath(__file__))
+        self.data_folder = os.path.join(cf, "data")
+        self.itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+
+    def _add_bucket(self):
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{self.itwin_id}/bucket',
+                      json=payload, status=200)
+
+    @responses.activate
+    def test_upload_bucket_ok(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+        self._add_bucket()
+
+        r = asyncio.run(self.bdh.upload_data(self.itwin_id, self.data_folder))
+        assert not r.is_error()
+        assert r.get_response_status_code() == 200
+        assert mock_client_class.call_count == 1
+
+    @responses.activate
+    def test_download_bucket_ok(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag"], defaults=["0x1"])
+        mock_client_instance.list_blobs.side_effect = mock_list([MyBlob("a.txt", 100)])
+        mock_client_instance.download_blob.return_value = mock_stream(b"mocked file content")
+        self._add_bucket()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            r = asyncio.run(self.bdh.download_data(self.itwin_id, tmp_dir))
+            assert not r.is_error()
+            assert os.path.exists(os.path.join(tmp_dir, "a.txt"))
+
+    @responses.activate
+    def test_delete_bucket_ok(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        self._add_bucket()
+
+        r = asyncio.run(self.bdh.delete_data(self.itwin_id, ["a.txt"]))
+        assert not r.is_error()
+        assert r.get_response_status_code() == 204
+
+
+class TestAsyncWalkBlobs:
+    def test_walk_blobs(self):
+        from azure.storage.blob.aio import BlobPrefix
+        from reality_capture.service.async_data_handler import _AsyncDataHandler
+        MyBlob = namedtuple("MyBlob", ["name", "size"])
+        names = ["root.json"] + [f"tiles/{i}/{j}/{k}.b3dm" for i in range(4) for j in range(3) for k in range(5)]
+
+        def _walk_blobs(name_starts_with=None, delimiter="/"):
+            prefix = name_starts_with or ""
+            children = {}
+            for name in names:
+                if name.startswith(prefix):
+                    rest = name[len(prefix):]
+                    if delimiter in rest:
+                        sub = prefix + rest.split(delimiter)[0] + delimiter
+                        children[sub] = BlobPrefix(None, prefix=sub)
+                    else:
+                        children[name] = MyBlob(name, 1)
+            return mock_list(list(children.values()))()
+
+        client = MagicMock()
+        client.walk_blobs.side_effect = _walk_blobs
+        client.list_blobs.side_effect = mock_list([MyBlob(name, 1) for name in names])
+
+        async def _collect():
+            return [blob.name async for blob in _AsyncDataHandler._walk_blobs(client, "")]
+
+        assert sorted(asyncio.run(_collect())) == sorted(names)
+        assert client.walk_blobs.call_count == 2
+        assert client.list_blobs.call_count == 4
+
+
+class TestAsyncTransport:
+    def test_pooled_transport(self):
+        pytest.importorskip("aiohttp")
+        from reality_capture.service.async_data_handler import _AsyncDataHandler, _PooledAioHttpTransport
+
+        async def _open_close():
+            client = _AsyncDataHandler._get_container_client("https://account.blob.core.windows.net/container", 7)
+            transport = client._pipeline._transport
+            # Nothing to close until the client is used
+            assert isinstance(transport, _PooledAioHttpTransport)
+            assert transport.session is None
+            async with client:
+                limit = transport.session.connector.limit
+            return limit, transport.session
+
+        limit, session = asyncio.run(_open_close())
+        assert limit == 7
+        assert session is None
+
+
+class TestAsyncSasCredential:
+    @staticmethod
+    def _get_url(expiry: float) -> str:
+        from datetime import datetime, timezone
+        from urllib.parse import quote
+        se = quote(datetime.fromtimestamp(expiry, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"))
+        return f"https://account.blob.core.windows.net/container?sv=2020-08-04&se={se}&sr=c&sp=rl&sig=abc"
+
+    def test_sas_credential_refresh(self):
+        import threading
+        import time
+        from reality_capture.service.async_data_handler import _AsyncSasCredential
+        url = self._get_url(time.time() + 60)
+        renewed = self._get_url(time.time() + 3600).replace("sig=abc", "sig=def")
+        loop_thread = None
+        refresh_thread = None
+        release = threading.Event()
+
+        def _refresh():
+            nonlocal refresh_thread
+            refresh_thread = threading.current_thread()
+            release.wait(5)
+            return renewed
+
+        async def _read():
+            nonlocal loop_thread
+            loop_thread = threading.current_thread()
+            credential = _AsyncSasCredential(url, _refresh)
+            # The renewal runs in the background, the current SAS is returned meanwhile
+            first = credential.signature
+            second = credential.signature
+            release.set()
+            await credential._renewal
+            return first, second, credential.signature
+
+        first, second, third = asyncio.run(_read())
+        assert first == second == url.split("?")[1]
+        assert third == renewed.split("?")[1]
+        assert refresh_thread is not loop_thread
+
+
+class TestAsyncUploadSession:
+    def setup_method(self, _):
+        self.rdh = AsyncRealityDataHandler(FakeTokenFactory())
+        cf = os.path.dirname(os.path.abspath(__file__))
+        self.data_folder = os.path.join(cf, "data")
+        self.rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+
+    @responses.activate
+    def test_upload_session(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_get_200.json", 'r') as payload_data:
+            pl_author = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{self.rd_id}/writeaccess',
+                      json=payload, status=200)
+        responses.add(responses.PATCH,
+                      f'https://api.bentley.com/reality-management/reality-data/{self.rd_id}',
+                      json=pl_author, status=200)
+
+        async def _upload():
+            async with self.rdh.upload_session(self.rd_id) as session:
+                return await asyncio.gather(*[session.upload_data(self.data_folder, f"batch{i}") for i in range(4)])
+
+        results = asyncio.run(_upload())
+        assert all(not r.is_error() for r in results)
+        assert [call.request.method for call in responses.calls] == ["GET", "PATCH", "PATCH"]
+
+    @responses.activate
+    def test_upload_session_close_error(self):
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_get_200.json", 'r') as payload_data:
+            pl_author = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{self.rd_id}/writeaccess',
+                      json=payload, status=200)
+        responses.add(responses.PATCH,
+                      f'https://api.bentley.com/reality-management/reality-data/{self.rd_id}',
+                      json=pl_author, status=200)
+        responses.add(responses.PATCH,
+                      f'https://api.bentley.com/reality-management/reality-data/{self.rd_id}',
+                      json={"error": {"code": "InternalError", "message": "this is a test"}}, status=500)
+
+        async def _open_close():
+            async with self.rdh.upload_session(self.rd_id) as session:
+                assert session.close_result is None
+            return session, await session.open(), await session.close()
+
+        session, opened, closed = asyncio.run(_open_close())
+        assert session.close_result.get_response_status_code() == 500
+        assert opened.error.error.code == "SessionClosed"
+        assert closed is session.close_result
+        assert [call.request.method for call in responses.calls] == ["GET", "PATCH", "PATCH"]
@@ -1,10 +1,22 @@
+import hashlib
+import io
 import json
+import mmap
 import os
+import threading
+import time
 from collections import namedtuple
+from datetime import datetime, timezone
 
 import responses
-from reality_capture.service.data_handler import RealityDataHandler, BucketDataHandler
+from azure.core.exceptions import ResourceNotFoundError, ClientAuthenticationError, HttpResponseError
+from reality_capture.service.bucket import BucketResponse
+from reality_capture.service.reality_data import RealityDataCreate, Type
+from reality_capture.service.response import Response
+from reality_capture.service.data_handler import RealityDataHandler, BucketDataHandler, _DataHandler, _LinkCache, \
+    _SasCredential, _get_sas_expiry, UploadTarget, _BufferReader, RemoteFile, DataFilter, _RangeWriter
 from unittest.mock import patch, MagicMock
+from reality_capture.service.transfer import ConcurrencyController, ProgressTracker, TransferScheduler
 import pytest
 import tempfile
 
@@ -15,6 +27,9 @@ class FakeTokenFactory:
         return "Bearer invalid"
 
 
+MyBlob = namedtuple("MyBlob", ["name", "size"])
+
+
 def mock_blob(*args, **kwargs):
     if "progress_hook" in kwargs:
         kwargs["progress_hook"](50, None)  # Simulate progress update
@@ -24,10 +39,23 @@ def mock_blob_except(*args, **kwargs):
     raise Exception("this is a test")
 
 
+def mock_delete_blobs(failing):
+    MyResponse = namedtuple("MyResponse", ["status_code"])
+
+    def _delete_blobs(*names, **kwargs):
+        return iter([MyResponse(404 if name in failing else 202) for name in names])
+    return _delete_blobs
+
+
 @pytest.fixture
 def mock_container_client_default():
-    with patch("azure.storage.blob.ContainerClient.from_container_url") as mock_client:
+    # Files that failed are retried without waiting
+    with patch("azure.storage.blob.ContainerClient.from_container_url") as mock_client, \
+            patch.object(_DataHandler, "_RETRY_DELAY", 0):
         mock_instance = MagicMock()
+        # Listings are walked folder by folder, by default every blob is at the root of the container
+        mock_instance.walk_blobs.side_effect = \
+            lambda name_starts_with=None, delimiter=None: mock_instance.list_blobs(name_starts_with=name_starts_with)
         mock_client.return_value = mock_instance
         yield mock_client, mock_instance
 
@@ -60,7 +88,7 @@ class TestRealityDataHandler:
     @responses.activate
     def test_list_data_ok(self, mock_container_client_default):
         mock_client_class, mock_client_instance = mock_container_client_default
-        mock_client_instance.list_blob_names.return_value = ["file1.txt", "file2.txt"]
+        mock_client_instance.list_blobs.return_value = [MyBlob("file2.txt", 1), MyBlob("file1.txt", 1)]
         
         rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
         with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
@@ -74,6 +102,33 @@ class TestRealityDataHandler:
         assert r.get_response_status_code() == 200
         assert r.value == ['file1.txt', 'file2.txt']
 
+    @responses.activate
+    def test_iter_data_ok(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyContentSettings = namedtuple("MyContentSettings", ["content_md5"])
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag", "content_settings", "last_modified"])
+        mock_client_instance.list_blobs.return_value = iter([
+            MyBlob("tiles/a.b3dm", 7, "0x1", MyContentSettings(bytearray(hashlib.md5(b"content").digest())), None),
+            MyBlob("tiles/b.b3dm", 19, "0x2", MyContentSettings(None), None),
+        ])
+
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/readaccess',
+                      json=payload, status=200)
+
+        r = self.rdh.iter_data(rd_id, prefix="tiles/")
+        assert not r.is_error()
+        mock_client_instance.list_blobs.assert_not_called()
+        files = list(r.value)
+        assert [f.name for f in files] == ["tiles/a.b3dm", "tiles/b.b3dm"]
+        assert files[0].md5 == hashlib.md5(b"content").hexdigest()
+        assert files[1].md5 is None
+        mock_client_instance.list_blobs.assert_called_once_with(name_starts_with="tiles/")
+        mock_client_instance.close.assert_called_once()
+
     @responses.activate
     def test_upload_data_link_error(self):
         rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
@@ -172,6 +227,75 @@ class TestRealityDataHandler:
         assert not r.is_error()
         assert r.get_response_status_code() == 200
 
+    @responses.activate
+    def test_upload_data_retry_failed(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect, _ = mock_blob_failing({"b.txt"})
+
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_get_200.json", 'r') as payload_data:
+            pl_author = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/writeaccess',
+                      json=payload, status=200)
+        patch_author = responses.add(responses.PATCH,
+                                     f'https://api.bentley.com/reality-management/reality-data/{rd_id}',
+                                     json=pl_author, status=200)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ["a.txt", "b.txt"]:
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write(name)
+            r = self.rdh.upload_data(rd_id, tmp)
+            assert r.get_response_status_code() == 207
+            assert r.value.failed == ["b.txt"]
+            assert patch_author.call_count == 2
+
+            # Authoring is enabled again for the retry
+            mock_client_instance.upload_blob.side_effect = mock_blob
+            r = r.value.retry_failed()
+        assert r.get_response_status_code() == 200
+        assert r.value.transferred == ["b.txt"]
+        assert patch_author.call_count == 4
+
+    @responses.activate
+    def test_upload_data_sync(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+        with open(f"{self.data_folder}/bucket_get_200.json", 'rb') as f:
+            content = f.read()
+        MyContentSettings = namedtuple("MyContentSettings", ["content_md5"])
+        MyBlob = namedtuple("MyBlob", ["name", "size", "content_settings", "last_modified"])
+        mock_client_instance.list_blobs.return_value = [
+            MyBlob("bucket_get_200.json", len(content), MyContentSettings(hashlib.md5(content).digest()), None),
+            MyBlob("detector_get_200.json", 1, MyContentSettings(None), None),
+        ]
+
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_get_200.json", 'r') as payload_data:
+            pl_author = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/writeaccess',
+                      json=payload, status=200)
+        responses.add(responses.PATCH,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}',
+                      json=pl_author, status=200)
+
+        r = self.rdh.upload_data(rd_id, self.data_folder, sync=True)
+        assert not r.is_error()
+        assert r.value.skipped == ["bucket_get_200.json"]
+        assert "detector_get_200.json" in r.value.transferred
+        assert "bucket_get_200.json" not in r.value.transferred
+        uploaded = [c.args[0] for c in mock_client_instance.upload_blob.call_args_list]
+        assert "bucket_get_200.json" not in uploaded
+        assert len(uploaded) == len(os.listdir(self.data_folder)) - 1
+        for c in mock_client_instance.upload_blob.call_args_list:
+            assert c.kwargs["content_settings"].content_md5 is not None
+
     @responses.activate
     def test_upload_data_authoring_error_end(self, mock_container_client_default):
         mock_client_class, mock_client_instance = mock_container_client_default
@@ -199,6 +323,173 @@ class TestRealityDataHandler:
         assert r.is_error()
         assert r.get_response_status_code() == 422
 
+    @responses.activate
+    def test_upload_session(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_get_200.json", 'r') as payload_data:
+            pl_author = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/writeaccess',
+                      json=payload, status=200)
+        responses.add(responses.PATCH,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}',
+                      json=pl_author, status=200)
+
+        results = []
+        with self.rdh.upload_session(rd_id) as session:
+            threads = [threading.Thread(target=lambda i=i: results.append(
+                session.upload_data(f"{self.data_folder}/reality_data_get_200.json", f"batch{i}")))
+                for i in range(4)]
+            for thread in threads:
+                thread.start()
+            results.append(session.upload_data(self.data_folder, "all"))
+            for thread in threads:
+                thread.join()
+        assert len(results) == 5
+        assert all(not r.is_error() for r in results)
+        assert [call.request.method for call in responses.calls] == ["GET", "PATCH", "PATCH"]
+        assert json.loads(responses.calls[1].request.body)["authoring"] is True
+        assert json.loads(responses.calls[2].request.body)["authoring"] is False
+
+        r = session.upload_data(self.data_folder)
+        assert r.is_error()
+        assert r.error.error.code == "SessionClosed"
+
+    @responses.activate
+    def test_upload_session_link_error(self):
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/writeaccess',
+                      json={"error": {"code": "HeaderNotFound",
+                                      "message": "Header Authorization was not found in the request. Access denied."}},
+                      status=401)
+
+        with self.rdh.upload_session(rd_id) as session:
+            r = session.upload_data(self.data_folder)
+            assert r.is_error()
+            assert r.get_response_status_code() == 401
+        # Authoring was never enabled, so it is not disabled either
+        assert all(call.request.method == "GET" for call in responses.calls)
+
+    @responses.activate
+    def test_upload_session_close_error(self):
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_get_200.json", 'r') as payload_data:
+            pl_author = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/writeaccess',
+                      json=payload, status=200)
+        responses.add(responses.PATCH,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}',
+                      json=pl_author, status=200)
+        responses.add(responses.PATCH,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}',
+                      json={"error": {"code": "InternalError", "message": "this is a test"}}, status=500)
+
+        with self.rdh.upload_session(rd_id) as session:
+            assert session.close_result is None
+        assert session.close_result.is_error()
+        assert session.close_result.get_response_status_code() == 500
+        # A closed session is not opened again, closing it again does not disable authoring twice
+        r = session.open()
+        assert r.is_error()
+        assert r.error.error.code == "SessionClosed"
+        assert session.close() is session.close_result
+        assert [call.request.method for call in responses.calls] == ["GET", "PATCH", "PATCH"]
+
+    @responses.activate
+    def test_upload_batch(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+
+        def _upload_blob(name, *args, **kwargs):
+            if name.startswith("bad/"):
+                raise Exception("this is a test")
+
+        mock_client_instance.upload_blob.side_effect = _upload_blob
+
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        new_id = "95d8dccd-d89e-4287-bb5f-3219acbc71ae"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_get_200.json", 'r') as payload_data:
+            pl_author = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_create_201.json", 'r') as payload_data:
+            pl_create = json.load(payload_data)
+        responses.add(responses.POST, 'https://api.bentley.com/reality-management/reality-data/',
+                      json=pl_create, status=201)
+        for target_id in [rd_id, new_id]:
+            responses.add(responses.GET,
+                          f'https://api.bentley.com/reality-management/reality-data/{target_id}/writeaccess',
+                          json=payload, status=200)
+            responses.add(responses.PATCH,
+                          f'https://api.bentley.com/reality-management/reality-data/{target_id}',
+                          json=pl_author, status=200)
+
+        rdc = RealityDataCreate(iTwinId="1b21484b-8d97-4610-9001-b0b67cd83fbd", displayName="My Data", type=Type.OPC)
+        targets = [UploadTarget(src=self.data_folder, reality_data=rd_id, dst="existing"),
+                   UploadTarget(src=self.data_folder, reality_data=rdc, dst="new"),
+                   UploadTarget(src=f"{self.data_folder}/bucket_get_200.json", reality_data=rdc, dst="bad")]
+        r = self.rdh.upload_batch(targets)
+        assert not r.is_error()
+        assert [t.reality_data_id for t in r.value] == [rd_id, new_id, new_id]
+        assert [t.status_code for t in r.value] == [200, 200, 500]
+        assert len(r.value[0].result.transferred) == len(os.listdir(self.data_folder))
+        assert r.value[2].error.error.code == "UploadFailure"
+        # One creation, then one write access and two authoring updates per reality data
+        methods = [call.request.method for call in responses.calls]
+        assert methods.count("POST") == 1
+        assert methods.count("GET") == 2
+        assert methods.count("PATCH") == 4
+        # All the targets shared the same pool of connections
+        sessions = {id(c.kwargs["transport"].session) for c in mock_client_class.call_args_list}
+        assert len(sessions) == 1
+
+    @responses.activate
+    def test_copy_from_bucket(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.list_blobs.return_value = [MyBlob("export/a.txt", 1), MyBlob("export/b/c.txt", 2)]
+        mock_client_instance.get_blob_client.return_value.start_copy_from_url.return_value = {"copy_status": "success"}
+
+        itwin_id = "1b21484b-8d97-4610-9001-b0b67cd83fbd"
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            pl_bucket = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        with open(f"{self.data_folder}/reality_data_get_200.json", 'r') as payload_data:
+            pl_author = json.load(payload_data)
+        responses.add(responses.GET, f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=pl_bucket, status=200)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/writeaccess',
+                      json=payload, status=200)
+        responses.add(responses.PATCH, f'https://api.bentley.com/reality-management/reality-data/{rd_id}',
+                      json=pl_author, status=200)
+
+        r = self.rdh.copy_from_bucket(itwin_id, rd_id, "export", "calibration")
+        assert not r.is_error()
+        assert r.value.transferred == ["calibration/a.txt", "calibration/b/c.txt"]
+        # Authoring is enabled for the copy and disabled afterwards
+        assert [call.request.method for call in responses.calls].count("PATCH") == 2
+        mock_client_instance.upload_blob.assert_not_called()
+
+    @responses.activate
+    def test_copy_data_link_error(self):
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/readaccess',
+                      json={"error": {"code": "RealityDataNotFound", "message": "Not found"}}, status=404)
+        r = self.rdh.copy_data(rd_id, "95d8dccd-d89e-4287-bb5f-3219acbc71ae")
+        assert r.is_error()
+        assert r.get_response_status_code() == 404
+
     @responses.activate
     def test_download_data_link_error(self):
         rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
@@ -260,7 +551,7 @@ class TestRealityDataHandler:
         MyBlob = namedtuple("MyBlob", ["name", "size"])
         mock_client_instance.list_blobs.return_value = [MyBlob("a.txt", 100)]
         mock_stream = MagicMock()
-        mock_stream.readall.return_value = b"mocked file content"
+        mock_stream.readinto.side_effect = lambda stream: stream.write(b"mocked file content")
         mock_client_instance.download_blob.return_value = mock_stream
 
         rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
@@ -275,6 +566,136 @@ class TestRealityDataHandler:
             assert not r.is_error()
             assert r.get_response_status_code() == 200
             assert os.path.exists(os.path.join(tmp_dir, "a.txt"))
+            with open(os.path.join(tmp_dir, "a.txt"), "rb") as f:
+                assert f.read() == b"mocked file content"
+        mock_stream.readall.assert_not_called()
+        _, kwargs = mock_client_class.call_args
+        assert kwargs["max_chunk_get_size"] == 4 * 1024 * 1024
+
+    @responses.activate
+    def test_download_data_sync_mirror(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyContentSettings = namedtuple("MyContentSettings", ["content_md5"])
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag", "content_settings", "last_modified"])
+        mock_client_instance.list_blobs.return_value = [
+            MyBlob("folder/a.txt", 7, "0x1", MyContentSettings(hashlib.md5(b"content").digest()), None),
+            MyBlob("folder/b.txt", 19, "0x2", MyContentSettings(None), None),
+        ]
+        mock_stream = MagicMock()
+        mock_stream.readinto.side_effect = lambda stream: stream.write(b"mocked file content")
+        mock_client_instance.download_blob.return_value = mock_stream
+
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/readaccess',
+                      json=payload, status=200)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, "a.txt"), "wb") as f:
+                f.write(b"content")
+            os.makedirs(os.path.join(tmp_dir, "old"))
+            with open(os.path.join(tmp_dir, "old", "c.txt"), "wb") as f:
+                f.write(b"removed remotely")
+
+            r = self.rdh.download_data(rd_id, tmp_dir, "folder", sync=True, mirror=True)
+            assert not r.is_error()
+            assert r.value.skipped == ["folder/a.txt"]
+            assert r.value.transferred == ["folder/b.txt"]
+            assert r.value.deleted == [os.path.join("old", "c.txt")]
+            assert not os.path.exists(os.path.join(tmp_dir, "old"))
+            assert mock_client_instance.download_blob.call_count == 1
+            mock_client_instance.list_blobs.assert_called_with(name_starts_with="folder")
+
+            # Second run: b.txt is known from the manifest and is not downloaded again
+            r = self.rdh.download_data(rd_id, tmp_dir, "folder", sync=True)
+            assert not r.is_error()
+            assert r.value.skipped == ["folder/a.txt", "folder/b.txt"]
+            assert mock_client_instance.download_blob.call_count == 1
+
+    @responses.activate
+    def test_download_data_filter_mirror(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag", "content_settings", "last_modified"])
+        mock_client_instance.list_blobs.return_value = [
+            MyBlob("out/cloud.las", 19, "0x1", None, None),
+            MyBlob("out/texture.jpg", 19, "0x2", None, None),
+            MyBlob("out/logs/run.las", 19, "0x3", None, None),
+        ]
+        mock_stream = MagicMock()
+        mock_stream.readinto.side_effect = lambda stream: stream.write(b"mocked file content")
+        mock_client_instance.download_blob.return_value = mock_stream
+
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/readaccess',
+                      json=payload, status=200)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ["notes.txt", "old.las"]:
+                with open(os.path.join(tmp_dir, name), "wb") as f:
+                    f.write(b"local")
+            data_filter = DataFilter(extensions=["LAS"], exclude=["logs/*"])
+            r = self.rdh.download_data(rd_id, tmp_dir, "out", mirror=True, data_filter=data_filter)
+            assert not r.is_error()
+            assert r.value.transferred == ["out/cloud.las"]
+            # Only the files the filter selects are mirrored
+            assert r.value.deleted == ["old.las"]
+            assert os.path.exists(os.path.join(tmp_dir, "notes.txt"))
+
+    @responses.activate
+    def test_download_data_detailed_progress(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size"])
+        mock_client_instance.list_blobs.return_value = [MyBlob("a.txt", 19), MyBlob("b.txt", 19)]
+        mock_stream = MagicMock()
+        mock_stream.readinto.side_effect = lambda stream: stream.write(b"mocked file content")
+        mock_client_instance.download_blob.return_value = mock_stream
+
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/readaccess',
+                      json=payload, status=200)
+
+        events = []
+        self.rdh.set_progress_hook(lambda p: events.append(p) or True, max_rate=0, detailed=True)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            r = self.rdh.download_data(rd_id, tmp_dir)
+        assert not r.is_error()
+        assert events[-1].bytes_done == events[-1].bytes_total == 38
+        assert events[-1].files_done == events[-1].files_total == 2
+
+    @responses.activate
+    def test_download_data_stream_failure_cleanup(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size"])
+        mock_client_instance.list_blobs.return_value = [MyBlob("a.txt", 100)]
+
+        def partial_write(stream):
+            stream.write(b"partial")
+            raise Exception("connection reset")
+
+        mock_stream = MagicMock()
+        mock_stream.readinto.side_effect = partial_write
+        mock_client_instance.download_blob.return_value = mock_stream
+
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/readaccess',
+                      json=payload, status=200)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            r = self.rdh.download_data(rd_id, tmp_dir)
+            assert r.is_error()
+            assert r.error.error.code == "DownloadFailure"
+            assert not os.path.exists(os.path.join(tmp_dir, "a.txt"))
 
     @responses.activate
     def test_delete_data_link_error(self):
@@ -293,7 +714,7 @@ class TestRealityDataHandler:
     @responses.activate
     def test_delete_bucket_fail(self, mock_container_client_default):
         mock_client_class, mock_client_instance = mock_container_client_default
-        mock_client_instance.delete_blob.side_effect = mock_blob_except
+        mock_client_instance.delete_blobs.side_effect = mock_delete_blobs({"a.txt"})
 
         rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
         with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
@@ -309,7 +730,7 @@ class TestRealityDataHandler:
     @responses.activate
     def test_delete_bucket_ok(self, mock_container_client_default):
         mock_client_class, mock_client_instance = mock_container_client_default
-        mock_client_instance.delete_blob = mock_blob
+        mock_client_instance.delete_blobs.side_effect = mock_delete_blobs(set())
 
         rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
         with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
@@ -351,7 +772,7 @@ class TestBucketDataHandler:
     @responses.activate
     def test_list_bucket_ok(self, mock_container_client_default):
         mock_client_class, mock_client_instance = mock_container_client_default
-        mock_client_instance.list_blob_names.return_value = ["file1.txt", "file2.txt"]
+        mock_client_instance.list_blobs.return_value = [MyBlob("file2.txt", 1), MyBlob("file1.txt", 1)]
 
         itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
         with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
@@ -365,6 +786,57 @@ class TestBucketDataHandler:
         assert r.get_response_status_code() == 200
         assert r.value == ['file1.txt', 'file2.txt']
 
+    @responses.activate
+    def test_list_bucket_prefix(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.list_blobs.return_value = [MyBlob("tiles/a.b3dm", 1)]
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+
+        r = self.bdh.list_data(itwin_id, prefix="tiles/")
+        assert r.value == ["tiles/a.b3dm"]
+        mock_client_instance.walk_blobs.assert_called_once_with(name_starts_with="tiles/", delimiter="/")
+
+    @responses.activate
+    def test_list_bucket_filter(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MySizedBlob = namedtuple("MySizedBlob", ["name", "size", "last_modified"])
+        recent = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        old = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        mock_client_instance.list_blobs.return_value = [MySizedBlob("images/a.jpg", 10, recent),
+                                                        MySizedBlob("images/b.JPG", 1000, recent),
+                                                        MySizedBlob("images/c.jpg", 10, old),
+                                                        MySizedBlob("images/d.raw", 10, recent)]
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+        data_filter = DataFilter(extensions=[".jpg"], max_size=100, modified_since=datetime(2025, 1, 1))
+        r = self.bdh.list_data(itwin_id, "images", data_filter)
+        assert not r.is_error()
+        assert r.value == ["images/a.jpg"]
+
+    @responses.activate
+    def test_iter_bucket_link_error(self):
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json={"error": {"code": "HeaderNotFound",
+                                      "message": "Header Authorization was not found in the request. Access denied."}},
+                      status=401)
+
+        r = self.bdh.iter_data(itwin_id)
+        assert r.is_error()
+        assert r.get_response_status_code() == 401
+
     @responses.activate
     def test_upload_bucket_link_error(self):
         itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
@@ -430,6 +902,247 @@ class TestBucketDataHandler:
         assert not r.is_error()
         assert r.get_response_status_code() == 200
 
+    @responses.activate
+    def test_upload_bucket_shared_client(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+
+        r = self.bdh.upload_data(itwin_id, self.data_folder)
+        assert not r.is_error()
+        assert mock_client_instance.upload_blob.call_count == len(os.listdir(self.data_folder))
+        assert mock_client_class.call_count == 1
+        transport = mock_client_class.call_args.kwargs["transport"]
+        assert transport.session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"] >= 4
+        mock_client_instance.close.assert_called_once()
+
+    @responses.activate
+    def test_upload_bucket_concurrency_limits(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+
+        self.bdh.set_concurrency_limits(max_workers=2, max_concurrency=3)
+        r = self.bdh.upload_data(itwin_id, self.data_folder)
+        assert not r.is_error()
+        for c in mock_client_instance.upload_blob.call_args_list:
+            assert c.kwargs["max_concurrency"] <= 3
+        kwargs = mock_client_class.call_args.kwargs
+        assert kwargs["transport"].session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"] == 6
+        assert callable(kwargs["raw_response_hook"])
+
+    @responses.activate
+    def test_upload_bucket_resume(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_blob_client = MagicMock()
+        mock_client_instance.get_blob_client.return_value = mock_blob_client
+        MyBlock = namedtuple("MyBlock", ["id", "size"])
+        mock_blob_client.get_block_list.return_value = ([], [MyBlock(_DataHandler._get_block_id(0), 4)])
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "cloud.las")
+            with open(file_path, "wb") as f:
+                f.write(b"0123456789")
+            journal_dir = os.path.join(tmp_dir, "journal")
+            with patch.object(_DataHandler, "_BLOCK_SIZE", 4), patch.object(_DataHandler, "_JOURNAL_DIR", journal_dir):
+                # Simulate a previous run that staged the first block before failing
+                journal_path = _DataHandler._get_journal_path(payload["_links"]["containerUrl"]["href"],
+                                                              "cloud.las", file_path)
+                os.makedirs(journal_dir)
+                with open(journal_path, "w") as f:
+                    json.dump({"size": 10, "mtime": os.path.getmtime(file_path), "block_size": 4, "blocks": [0]}, f)
+
+                r = self.bdh.upload_data(itwin_id, file_path, resume=True)
+            assert not r.is_error()
+            assert r.value.transferred == ["cloud.las"]
+            staged = [c.args for c in mock_blob_client.stage_block.call_args_list]
+            assert staged == [(_DataHandler._get_block_id(1), b"4567"), (_DataHandler._get_block_id(2), b"89")]
+            committed = mock_blob_client.commit_block_list.call_args.args[0]
+            assert [b.id for b in committed] == [_DataHandler._get_block_id(i) for i in range(3)]
+            mock_client_instance.upload_blob.assert_not_called()
+            assert not os.path.exists(journal_path)
+
+    def test_upload_blocks_parallel(self):
+        client = MagicMock()
+        blob_client = client.get_blob_client.return_value
+        MyBlock = namedtuple("MyBlock", ["id", "size"])
+        blob_client.get_block_list.return_value = ([], [MyBlock(_DataHandler._get_block_id(0), 4)])
+        gate = threading.Barrier(2, timeout=5)
+        staged = {}
+
+        def _stage_block(block_id, data, **kwargs):
+            # The missing blocks are staged at the same time
+            gate.wait()
+            staged[block_id] = bytes(data)
+
+        blob_client.stage_block.side_effect = _stage_block
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "cloud.las")
+            with open(file_path, "wb") as f:
+                f.write(b"0123456789")
+            journal_dir = os.path.join(tmp_dir, "journal")
+            container_url = "https://account.blob.core.windows.net/container"
+            with patch.object(_DataHandler, "_BLOCK_SIZE", 4), patch.object(_DataHandler, "_JOURNAL_DIR", journal_dir):
+                journal_path = _DataHandler._get_journal_path(container_url, "cloud.las", file_path)
+                os.makedirs(journal_dir)
+                with open(journal_path, "w") as f:
+                    json.dump({"size": 10, "mtime": os.path.getmtime(file_path), "block_size": 4, "blocks": [0]}, f)
+                _DataHandler._upload_blocks(client, container_url, "cloud.las", file_path, 10,
+                                            lambda current, total: None, None, 2)
+        assert staged == {_DataHandler._get_block_id(1): b"4567", _DataHandler._get_block_id(2): b"89"}
+        committed = blob_client.commit_block_list.call_args.args[0]
+        assert [b.id for b in committed] == [_DataHandler._get_block_id(i) for i in range(3)]
+
+    def test_upload_blocks_expired(self):
+        client = MagicMock()
+        blob_client = client.get_blob_client.return_value
+        # The uncommitted blocks of the previous run were discarded with the blob
+        blob_client.get_block_list.side_effect = ResourceNotFoundError("BlobNotFound")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "cloud.las")
+            with open(file_path, "wb") as f:
+                f.write(b"0123456789")
+            journal_dir = os.path.join(tmp_dir, "journal")
+            container_url = "https://account.blob.core.windows.net/container"
+            with patch.object(_DataHandler, "_BLOCK_SIZE", 4), patch.object(_DataHandler, "_JOURNAL_DIR", journal_dir):
+                journal_path = _DataHandler._get_journal_path(container_url, "cloud.las", file_path)
+                os.makedirs(journal_dir)
+                with open(journal_path, "w") as f:
+                    json.dump({"size": 10, "mtime": os.path.getmtime(file_path), "block_size": 4, "blocks": [0]}, f)
+                _DataHandler._upload_blocks(client, container_url, "cloud.las", file_path, 10,
+                                            lambda current, total: None, None)
+            assert blob_client.stage_block.call_count == 3
+            blob_client.commit_block_list.assert_called_once()
+            assert not os.path.exists(journal_path)
+
+    @responses.activate
+    def test_copy_from_reality_data_link_error(self):
+        itwin_id = "1b21484b-8d97-4610-9001-b0b67cd83fbd"
+        rd_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/reality_data_read_access_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-management/reality-data/{rd_id}/readaccess',
+                      json=payload, status=200)
+        responses.add(responses.GET, f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json={"error": {"code": "BucketNotFound", "message": "Not found"}}, status=404)
+        r = self.bdh.copy_from_reality_data(itwin_id, rd_id)
+        assert r.is_error()
+        assert r.get_response_status_code() == 404
+
+    @responses.activate
+    def test_upload_bucket_streams(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        uploaded = {}
+
+        def _upload_blob(name, data, length=None, progress_hook=None, **kwargs):
+            content = data if isinstance(data, bytes) else data.read()
+            uploaded[name] = (content, length)
+            progress_hook(len(content), length)
+
+        mock_client_instance.upload_blob.side_effect = _upload_blob
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+
+        class _Pipe(io.RawIOBase):
+            def readable(self):
+                return True
+
+            def read(self, size=-1):
+                return b"piped"
+
+        stream = io.BytesIO(b"skipstream")
+        stream.seek(4)
+        progress = []
+        self.bdh.set_progress_hook(lambda p: progress.append(p) or True, 0)
+        items = (item for item in [("roi.json", b'{"roi": 1}'), ("mesh.bin", bytearray(b"mesh")),
+                                   ("view.bin", memoryview(b"0123456789")[2:5]), ("scene.xml", stream),
+                                   ("pipe.bin", _Pipe())])
+        r = self.bdh.upload_streams(itwin_id, items, "inputs/")
+        assert not r.is_error()
+        assert r.value.transferred == ["inputs/mesh.bin", "inputs/pipe.bin", "inputs/roi.json",
+                                       "inputs/scene.xml", "inputs/view.bin"]
+        assert uploaded["inputs/roi.json"] == (b'{"roi": 1}', 10)
+        assert uploaded["inputs/mesh.bin"] == (b"mesh", 4)
+        assert uploaded["inputs/view.bin"] == (b"234", 3)
+        assert uploaded["inputs/scene.xml"] == (b"stream", 6)
+        assert uploaded["inputs/pipe.bin"] == (b"piped", None)
+        assert progress[-1] == 100.0
+
+    @responses.activate
+    def test_upload_bucket_streams_failure(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob_except
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+        r = self.bdh.upload_streams(itwin_id, [("a.txt", b"a")])
+        assert r.is_error()
+        assert r.error.error.code == "UploadFailure"
+        mock_client_instance.close.assert_called_once()
+
+    @responses.activate
+    def test_read_bucket(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.download_blob.return_value.readall.return_value = b'{"asset": {}}'
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+        r = self.bdh.read_data(itwin_id, "tileset.json")
+        assert not r.is_error()
+        assert r.value == b'{"asset": {}}'
+        mock_client_instance.close.assert_called_once()
+
+    @responses.activate
+    def test_open_bucket_not_found(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.get_blob_client.return_value.get_blob_properties.side_effect = \
+            ResourceNotFoundError("not found")
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+        r = self.bdh.open_data(itwin_id, "missing.json")
+        assert r.is_error()
+        assert r.get_response_status_code() == 404
+        assert r.error.error.code == "FileNotFound"
+        mock_client_instance.close.assert_called_once()
+
     @responses.activate
     def test_download_bucket_link_error(self):
         itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
@@ -491,7 +1204,7 @@ class TestBucketDataHandler:
         MyBlob = namedtuple("MyBlob", ["name", "size"])
         mock_client_instance.list_blobs.return_value = [MyBlob("a.txt", 100)]
         mock_stream = MagicMock()
-        mock_stream.readall.return_value = b"mocked file content"
+        mock_stream.readinto.side_effect = lambda stream: stream.write(b"mocked file content")
         mock_client_instance.download_blob.return_value = mock_stream
 
         itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
@@ -507,6 +1220,46 @@ class TestBucketDataHandler:
             assert r.get_response_status_code() == 200
             assert os.path.exists(os.path.join(tmp_dir, "a.txt"))
 
+    @responses.activate
+    def test_download_bucket_resume(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        MyBlob = namedtuple("MyBlob", ["name", "size", "etag"])
+        mock_client_instance.list_blobs.return_value = [MyBlob("merged.las", 10, "0x1")]
+        content = b"0123456789"
+
+        def download_range(name, offset, length, **kwargs):
+            downloader = MagicMock()
+            downloader.readinto.side_effect = lambda stream: stream.write(content[offset:offset + length])
+            return downloader
+
+        mock_client_instance.download_blob.side_effect = download_range
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Simulate a previous run that downloaded the first range before failing
+            part_path = os.path.join(tmp_dir, "merged.las.part")
+            with open(part_path, "wb") as f:
+                f.write(b"0123")
+            with open(part_path + ".json", "w") as f:
+                json.dump({"etag": "0x1", "size": 10, "range_size": 4, "ranges": [[0, 4]]}, f)
+
+            with patch.object(_DataHandler, "_BLOCK_SIZE", 4):
+                r = self.bdh.download_data(itwin_id, tmp_dir, resume=True)
+            assert not r.is_error()
+            requested = [(c.kwargs["offset"], c.kwargs["length"])
+                         for c in mock_client_instance.download_blob.call_args_list]
+            assert requested == [(4, 4), (8, 2)]
+            with open(os.path.join(tmp_dir, "merged.las"), "rb") as f:
+                assert f.read() == content
+            assert not os.path.exists(part_path)
+            assert not os.path.exists(part_path + ".json")
+
     @responses.activate
     def test_delete_bucket_link_error(self):
         itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
@@ -524,7 +1277,7 @@ class TestBucketDataHandler:
     @responses.activate
     def test_delete_bucket_fail(self, mock_container_client_default):
         mock_client_class, mock_client_instance = mock_container_client_default
-        mock_client_instance.delete_blob.side_effect = mock_blob_except
+        mock_client_instance.delete_blobs.side_effect = mock_delete_blobs({"a.txt"})
 
         itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
         with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
@@ -540,7 +1293,7 @@ class TestBucketDataHandler:
     @responses.activate
     def test_delete_bucket_ok(self, mock_container_client_default):
         mock_client_class, mock_client_instance = mock_container_client_default
-        mock_client_instance.delete_blob = mock_blob
+        mock_client_instance.delete_blobs.side_effect = mock_delete_blobs(set())
 
         itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
         with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
@@ -552,3 +1305,890 @@ class TestBucketDataHandler:
         r = self.bdh.delete_data(itwin_id, ["a.txt"])
         assert not r.is_error()
         assert r.get_response_status_code() == 204
+
+    @responses.activate
+    def test_delete_bucket_prefix_batches(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.list_blobs.return_value = [MyBlob(f"tiles/{i}.b3dm", 1) for i in range(600)]
+        mock_client_instance.delete_blobs.side_effect = mock_delete_blobs({"tiles/42.b3dm", "a.txt"})
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+
+        r = self.bdh.delete_data(itwin_id, ["a.txt"], prefix="tiles/")
+        assert r.is_error()
+        assert r.get_response_status_code() == 400
+        assert [d.target for d in r.error.error.details] == ["a.txt", "tiles/42.b3dm"]
+        mock_client_instance.walk_blobs.assert_called_once_with(name_starts_with="tiles/", delimiter="/")
+        batches = [call.args for call in mock_client_instance.delete_blobs.call_args_list]
+        assert sorted(len(batch) for batch in batches) == [89, 256, 256]
+        assert sum(len(batch) for batch in batches) == 601
+
+    @responses.activate
+    def test_delete_bucket_batch_rejected(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.delete_blobs.side_effect = mock_blob_except
+        mock_client_instance.delete_blob.side_effect = lambda name: mock_blob_except() if name == "b.txt" else None
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+
+        r = self.bdh.delete_data(itwin_id, ["a.txt", "b.txt"])
+        assert r.is_error()
+        assert [d.target for d in r.error.error.details] == ["b.txt"]
+        assert mock_client_instance.delete_blob.call_count == 2
+
+
+class TestWalkBlobs:
+    @staticmethod
+    def _get_client(names):
+        from azure.storage.blob import BlobPrefix
+
+        def _walk_blobs(name_starts_with=None, delimiter="/"):
+            prefix = name_starts_with or ""
+            children = {}
+            for name in names:
+                if name.startswith(prefix):
+                    rest = name[len(prefix):]
+                    if delimiter in rest:
+                        sub = prefix + rest.split(delimiter)[0] + delimiter
+                        children[sub] = BlobPrefix(None, prefix=sub)
+                    else:
+                        children[name] = MyBlob(name, 1)
+            return list(children.values())
+
+        client = MagicMock()
+        client.walk_blobs.side_effect = _walk_blobs
+        client.list_blobs.side_effect = lambda name_starts_with=None: [MyBlob(n, 1) for n in names
+                                                                        if n.startswith(name_starts_with or "")]
+        return client
+
+    def test_walk_blobs(self):
+        names = ["root.json"] + [f"tiles/{i}/{j}/{k}.b3dm" for i in range(4) for j in range(3) for k in range(5)]
+        client = self._get_client(names)
+        blobs = list(_DataHandler._walk_blobs(client, ""))
+        assert sorted(blob.name for blob in blobs) == sorted(names)
+        # Two levels are walked, then the four tile folders are listed without delimiter
+        assert client.walk_blobs.call_count == 2
+        assert sorted(c.kwargs["name_starts_with"] for c in client.list_blobs.call_args_list) == \
+               [f"tiles/{i}/" for i in range(4)]
+
+    def test_walk_blobs_prefix(self):
+        client = self._get_client(["a/b/c.txt", "a/d.txt", "e.txt"])
+        assert sorted(blob.name for blob in _DataHandler._walk_blobs(client, "a/")) == ["a/b/c.txt", "a/d.txt"]
+
+    def test_walk_blobs_error(self):
+        client = self._get_client(["a/b/c.txt"])
+        client.list_blobs.side_effect = mock_blob_except
+        with pytest.raises(Exception, match="this is a test"):
+            list(_DataHandler._walk_blobs(client, ""))
+
+    def test_walk_blobs_close(self):
+        client = self._get_client([f"{i}/{j}.txt" for i in range(100) for j in range(100)])
+        walk = _DataHandler._walk_blobs(client, "")
+        assert next(walk) is not None
+        walk.close()
+
+
+class TestLinkCache:
+    def setup_method(self, _):
+        cf = os.path.dirname(os.path.abspath(__file__))
+        self.data_folder = os.path.join(cf, "data")
+
+    @staticmethod
+    def _get_url(expiry: float) -> str:
+        se = datetime.fromtimestamp(expiry, tz=timezone.utc).strftime("%Y-%m-%dT%H%%3A%M%%3A%SZ")
+        return f"https://account.blob.core.windows.net/container?sv=2020-08-04&se={se}&sr=c&sp=rl&sig=abc"
+
+    def test_get_sas_expiry(self):
+        assert _get_sas_expiry("https://a.blob.core.windows.net/c?se=2021-07-22T03%3A50%3A21Z&sig=x") == \
+               datetime(2021, 7, 22, 3, 50, 21, tzinfo=timezone.utc).timestamp()
+        assert _get_sas_expiry("https://a.blob.core.windows.net/c?se=2021-07-22&sig=x") == \
+               datetime(2021, 7, 22, tzinfo=timezone.utc).timestamp()
+        assert _get_sas_expiry("https://a.blob.core.windows.net/c?sig=x") is None
+        assert _get_sas_expiry("https://a.blob.core.windows.net/c?se=invalid") is None
+
+    def test_link_cache(self):
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        payload["_links"]["containerUrl"]["href"] = self._get_url(time.time() + 3600)
+        fetch = MagicMock(return_value=Response(200, None, BucketResponse.model_validate(payload)))
+        cache = _LinkCache()
+        assert not cache.get(("a",), fetch).is_error()
+        assert cache.get(("a",), fetch).value.links.container_url.href == payload["_links"]["containerUrl"]["href"]
+        assert fetch.call_count == 1
+        cache.get(("b",), fetch)
+        assert fetch.call_count == 2
+        # Links close to their expiry are renewed
+        payload["_links"]["containerUrl"]["href"] = self._get_url(time.time() + 60)
+        fetch.return_value = Response(200, None, BucketResponse.model_validate(payload))
+        cache = _LinkCache()
+        cache.get(("a",), fetch)
+        cache.get(("a",), fetch)
+        assert fetch.call_count == 4
+
+    def test_sas_credential_refresh(self):
+        renewed = self._get_url(time.time() + 3600)
+        refresh = MagicMock(return_value=renewed)
+        credential = _SasCredential(self._get_url(time.time() + 3600), refresh)
+        assert "sig=abc" in credential.signature
+        refresh.assert_not_called()
+        credential = _SasCredential(self._get_url(time.time() + 60), refresh)
+        assert credential.signature == renewed.split("?")[1]
+        assert credential.signature == renewed.split("?")[1]
+        assert refresh.call_count == 1
+
+    def test_sas_credential_refresh_failure(self):
+        url = self._get_url(time.time() + 60)
+        refresh = MagicMock(side_effect=Exception("this is a test"))
+        credential = _SasCredential(url, refresh)
+        assert credential.signature == url.split("?")[1]
+        assert credential.signature == url.split("?")[1]
+        assert refresh.call_count == 1
+
+    @responses.activate
+    def test_bucket_link_reused(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.list_blobs.return_value = [MyBlob("a.txt", 1)]
+
+        itwin_id = "d91751e9-9a24-417a-a29c-071c0dca33f0"
+        with open(f"{self.data_folder}/bucket_get_200.json", 'r') as payload_data:
+            payload = json.load(payload_data)
+        payload["_links"]["containerUrl"]["href"] = self._get_url(time.time() + 3600)
+        responses.add(responses.GET,
+                      f'https://api.bentley.com/reality-modeling/itwins/{itwin_id}/bucket',
+                      json=payload, status=200)
+
+        bdh = BucketDataHandler(FakeTokenFactory())
+        assert bdh.list_data(itwin_id).value == ["a.txt"]
+        assert bdh.list_data(itwin_id).value == ["a.txt"]
+        assert len(responses.calls) == 1
+        args, kwargs = mock_client_class.call_args
+        assert args[0] == "https://account.blob.core.windows.net/container"
+        assert isinstance(kwargs["credential"], _SasCredential)
+
+
+class TestCopyData:
+    src_url = "https://source.blob.core.windows.net/src?sv=2020-08-04&sr=c&sp=rl&sig=abc"
+    dst_url = "https://destination.blob.core.windows.net/dst?sv=2020-08-04&sr=c&sp=rwl&sig=def"
+
+    @pytest.fixture
+    def clients(self):
+        src_client = MagicMock()
+        src_client.walk_blobs.side_effect = \
+            lambda name_starts_with=None, delimiter=None: src_client.list_blobs(name_starts_with=name_starts_with)
+        dst_client = MagicMock()
+        with patch("azure.storage.blob.ContainerClient.from_container_url") as mock_client:
+            mock_client.side_effect = lambda url, **kwargs: src_client if "source" in url else dst_client
+            yield src_client, dst_client
+
+    @staticmethod
+    def _get_error(code, headers=None):
+        error = HttpResponseError(message=code, response=MagicMock(headers=headers or {}))
+        error.error_code = code
+        return error
+
+    def test_get_copy_name(self):
+        assert _DataHandler._get_copy_name("a/b/c.txt", "a", "") == "b/c.txt"
+        assert _DataHandler._get_copy_name("a/b/c.txt", "a/", "x/") == "x/b/c.txt"
+        assert _DataHandler._get_copy_name("a/b/c.txt", "a/b/c.txt", "x") == "x/c.txt"
+
+    def test_copy_pending(self, clients):
+        src_client, dst_client = clients
+        src_client.list_blobs.return_value = [MyBlob("a b.txt", 10)]
+        blob_client = dst_client.get_blob_client.return_value
+        blob_client.start_copy_from_url.return_value = {"copy_status": "pending"}
+        blob_client.get_blob_properties.side_effect = [MagicMock(copy=MagicMock(status="pending")),
+                                                       MagicMock(copy=MagicMock(status="success"))]
+
+        with patch("time.sleep") as sleep:
+            r = _DataHandler.copy_data(self.src_url, self.dst_url, "", "copy", None)
+        assert not r.is_error()
+        assert r.value.transferred == ["copy/a b.txt"]
+        dst_client.get_blob_client.assert_called_with("copy/a b.txt")
+        source_url = blob_client.start_copy_from_url.call_args.args[0]
+        assert source_url == "https://source.blob.core.windows.net/src/a%20b.txt?sv=2020-08-04&sr=c&sp=rl&sig=abc"
+        assert [call.args[0] for call in sleep.call_args_list] == [0.5, 1.0]
+        blob_client.upload_blob.assert_not_called()
+
+    def test_copy_relay(self, clients):
+        src_client, dst_client = clients
+        blob = MagicMock(size=10)
+        blob.name = "a.txt"
+        src_client.list_blobs.return_value = [blob]
+        src_client.download_blob.return_value.chunks.return_value = iter([b"0123456789"])
+        blob_client = dst_client.get_blob_client.return_value
+        blob_client.start_copy_from_url.side_effect = self._get_error("CannotVerifyCopySource")
+        # A copy left pending by a previous run is aborted before relaying
+        blob_client.get_blob_properties.return_value = MagicMock(copy=MagicMock(status="pending", id="copy-id"))
+
+        r = _DataHandler.copy_data(self.src_url, self.dst_url, "", "", None)
+        assert not r.is_error()
+        assert r.value.transferred == ["a.txt"]
+        blob_client.abort_copy.assert_called_once_with("copy-id")
+        args, kwargs = blob_client.upload_blob.call_args
+        assert list(args[0]) == [b"0123456789"]
+        assert kwargs["length"] == 10
+        assert kwargs["content_settings"] is blob.content_settings
+
+    def test_copy_failure(self, clients):
+        src_client, dst_client = clients
+        src_client.list_blobs.return_value = [MyBlob("a.txt", 10)]
+        blob_client = dst_client.get_blob_client.return_value
+        blob_client.start_copy_from_url.return_value = {"copy_status": "failed"}
+        blob_client.upload_blob.side_effect = mock_blob_except
+
+        r = _DataHandler.copy_data(self.src_url, self.dst_url, "", "", None)
+        assert r.is_error()
+        assert r.error.error.code == "CopyFailure"
+        # A copy the service ran and failed is not relayed
+        blob_client.upload_blob.assert_not_called()
+        src_client.close.assert_called_once()
+        dst_client.close.assert_called_once()
+
+    def test_copy_source_forbidden(self, clients):
+        src_client, dst_client = clients
+        blob = MagicMock(size=10)
+        blob.name = "a.txt"
+        src_client.list_blobs.return_value = [blob]
+        src_client.download_blob.return_value.chunks.return_value = iter([b"0123456789"])
+        blob_client = dst_client.get_blob_client.return_value
+        blob_client.start_copy_from_url.side_effect = self._get_error(
+            "AuthorizationFailure", {"x-ms-copy-source-status-code": "403"})
+        blob_client.get_blob_properties.side_effect = ResourceNotFoundError("BlobNotFound")
+
+        r = _DataHandler.copy_data(self.src_url, self.dst_url, "", "", None)
+        assert not r.is_error()
+        blob_client.upload_blob.assert_called_once()
+
+    def test_copy_destination_error(self, clients):
+        src_client, dst_client = clients
+        src_client.list_blobs.return_value = [MyBlob("a.txt", 10)]
+        blob_client = dst_client.get_blob_client.return_value
+        blob_client.start_copy_from_url.side_effect = self._get_error("AuthorizationPermissionMismatch")
+
+        r = _DataHandler.copy_data(self.src_url, self.dst_url, "", "", None)
+        assert r.is_error()
+        assert r.error.error.code == "CopyFailure"
+        blob_client.upload_blob.assert_not_called()
+
+    def test_copy_poll_error(self, clients):
+        src_client, dst_client = clients
+        src_client.list_blobs.return_value = [MyBlob("a.txt", 10)]
+        blob_client = dst_client.get_blob_client.return_value
+        blob_client.start_copy_from_url.return_value = {"copy_status": "pending"}
+        blob_client.get_blob_properties.side_effect = self._get_error("ServerBusy")
+
+        with patch("time.sleep"):
+            r = _DataHandler.copy_data(self.src_url, self.dst_url, "", "", None)
+        assert r.is_error()
+        # The copy may still be running, nothing is written over it
+        blob_client.upload_blob.assert_not_called()
+        blob_client.abort_copy.assert_not_called()
+
+
+class TestBufferReader:
+    def test_read(self):
+        reader = _BufferReader(bytearray(b"0123456789"))
+        assert reader.read(4) == b"0123"
+        assert reader.tell() == 4
+        assert reader.read() == b"456789"
+        assert reader.read(1) == b""
+        assert reader.seek(-3, io.SEEK_END) == 7
+        assert reader.read(10) == b"789"
+
+    def test_readinto(self):
+        reader = _BufferReader(memoryview(b"0123456789"))
+        buffer = bytearray(4)
+        assert reader.readinto(buffer) == 4
+        assert buffer == b"0123"
+        reader.seek(8)
+        assert reader.readinto(buffer) == 2
+        assert buffer[:2] == b"89"
+
+    def test_non_contiguous(self):
+        reader = _BufferReader(memoryview(b"0123456789")[::2])
+        assert reader.read() == b"02468"
+
+
+class TestRemoteFile:
+    content = bytes(range(256)) * 4
+
+    def _get_file(self, block_size=100, cache_blocks=16):
+        client = MagicMock()
+
+        def _download_blob(name, offset=None, length=None, **kwargs):
+            downloader = MagicMock()
+            downloader.readall.return_value = self.content[offset:offset + length]
+            return downloader
+
+        client.download_blob.side_effect = _download_blob
+        return RemoteFile(client, "file.bin", len(self.content), "etag", block_size, cache_blocks), client
+
+    def test_read_seek(self):
+        f, client = self._get_file()
+        with f:
+            assert f.read(10) == self.content[:10]
+            assert f.read(150) == self.content[10:160]
+            f.seek(-24, io.SEEK_END)
+            assert f.read() == self.content[-24:]
+            assert f.read(1) == b""
+            f.seek(0)
+            assert f.read() == self.content
+        assert f.closed
+        client.close.assert_called_once()
+
+    def test_cache(self):
+        f, client = self._get_file(cache_blocks=2)
+        with f:
+            f.seek(500)
+            f.read(10)
+            f.seek(505)
+            f.read(10)
+            # Random accesses fetch a single block, read again from the cache
+            assert client.download_blob.call_count == 1
+            assert client.download_blob.call_args.kwargs["etag"] == "etag"
+            for position in [0, 200, 400, 0]:
+                f.seek(position)
+                f.read(1)
+            assert client.download_blob.call_count == 5
+
+    def test_read_ahead(self):
+        f, client = self._get_file()
+        with f:
+            f.read(100)
+            f.read(100)
+            f._pending[2].result()
+            offsets = sorted(call.kwargs["offset"] for call in client.download_blob.call_args_list)
+            assert offsets == [0, 100, 200]
+            assert f.read(100) == self.content[200:300]
+            f._pending[3].result()
+            assert client.download_blob.call_count == 4
+
+    def test_closed(self):
+        f, _ = self._get_file()
+        f.close()
+        with pytest.raises(ValueError):
+            f.read(1)
+
+
+class TestScanFiles:
+    def test_scan_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, size in [("a.txt", 1), ("b/c.txt", 2), ("b/d/e.txt", 3), ("f/g.txt", 4)]:
+                os.makedirs(os.path.dirname(os.path.join(tmp, name)), exist_ok=True)
+                with open(os.path.join(tmp, name), "wb") as f:
+                    f.write(b"x" * size)
+            found = []
+            files = sorted(_DataHandler._scan_files(tmp, lambda name, size: found.append((name, size))))
+            expected = [("a.txt", 1), (os.path.join("b", "c.txt"), 2), (os.path.join("b", "d", "e.txt"), 3),
+                        (os.path.join("f", "g.txt"), 4)]
+            assert files == expected
+            assert sorted(found) == expected
+            assert _DataHandler._get_files_and_sizes(os.path.join(tmp, "b", "c.txt")) == [("c.txt", 2)]
+
+    @pytest.mark.skipif(os.name == "nt", reason="Symbolic links require privileges on Windows")
+    def test_scan_files_links(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as other:
+            with open(os.path.join(other, "a.txt"), "wb") as f:
+                f.write(b"abc")
+            os.symlink(other, os.path.join(tmp, "linked_dir"))
+            os.symlink(os.path.join(other, "a.txt"), os.path.join(tmp, "linked_file.txt"))
+            # Like os.walk, links to files are uploaded but links to directories are not followed
+            assert list(_DataHandler._scan_files(tmp)) == [("linked_file.txt", 3)]
+
+    def test_scan_files_error(self):
+        with pytest.raises(FileNotFoundError):
+            list(_DataHandler._scan_files(os.path.join(tempfile.gettempdir(), "missing", "folder", "")))
+
+    def test_upload_data_scan(self):
+        client = MagicMock()
+        controller = ConcurrencyController(max_workers=32)
+        progress = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for i in range(250):
+                with open(os.path.join(tmp, f"{i}.txt"), "wb") as f:
+                    f.write(b"x")
+            r = _DataHandler._upload_data(client, "https://account.blob.core.windows.net/container", tmp, "dst",
+                                          ProgressTracker(lambda p: progress.append(p) or True, 0), False, False,
+                                          controller, TransferScheduler())
+        assert not r.is_error()
+        assert len(r.value.transferred) == 250
+        assert client.upload_blob.call_count == 250
+        assert progress[-1] == 100.0
+        # The number of parallel files follows the files found by the scan
+        assert controller.workers >= 6
+
+
+class TestDataFilter:
+    def test_patterns(self):
+        data_filter = DataFilter(include=["*.las", "tiles/**"], exclude=["tmp_*"])
+        assert data_filter.matches("a/b/cloud.las", 1, None)
+        assert data_filter.matches("tiles/0/1.b3dm", 1, None)
+        assert not data_filter.matches("other/tiles/1.b3dm", 1, None)
+        assert not data_filter.matches("a/tmp_cloud.las", 1, None)
+        assert not data_filter.matches("cloud.LAS", 1, None)
+
+    def test_patterns_segments(self):
+        data_filter = DataFilter(include=["x/*"])
+        assert data_filter.matches("x/1.las", 1, None)
+        assert not data_filter.matches("x/y/z/2.las", 1, None)
+        data_filter = DataFilter(include=["x/**"])
+        assert data_filter.matches("x/1.las", 1, None)
+        assert data_filter.matches("x/y/z/2.las", 1, None)
+        assert not data_filter.matches("y/x/1.las", 1, None)
+        data_filter = DataFilter(include=["**/tiles/*.b3dm"])
+        assert data_filter.matches("tiles/1.b3dm", 1, None)
+        assert data_filter.matches("a/b/tiles/1.b3dm", 1, None)
+        assert not data_filter.matches("a/tiles/0/1.b3dm", 1, None)
+
+    def test_predicates(self):
+        since = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        data_filter = DataFilter(extensions=["las", ".LAZ"], min_size=10, max_size=100, modified_since=since)
+        assert data_filter.matches("cloud.laz", 10, since)
+        assert data_filter.matches("cloud.LAS", 100, since)
+        assert not data_filter.matches("cloud.las", 9, since)
+        assert not data_filter.matches("cloud.las", 101, since)
+        assert not data_filter.matches("cloud.jpg", 50, since)
+        assert not data_filter.matches("cloud.las", 50, datetime(2024, 12, 31, tzinfo=timezone.utc))
+        assert not data_filter.matches("cloud.las", 50, None)
+        assert DataFilter().matches("anything", 0, None)
+
+    def test_scan_files_filter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, size in [("a.jpg", 1), ("b.raw", 2), ("c/d.jpg", 300), ("c/e.JPG", 4)]:
+                os.makedirs(os.path.dirname(os.path.join(tmp, name)), exist_ok=True)
+                with open(os.path.join(tmp, name), "wb") as f:
+                    f.write(b"x" * size)
+            data_filter = DataFilter(extensions=["jpg"], max_size=100)
+            files = sorted(_DataHandler._scan_files(tmp, data_filter=data_filter))
+            assert files == [("a.jpg", 1), (os.path.join("c", "e.JPG"), 4)]
+            assert _DataHandler._get_files_and_sizes(os.path.join(tmp, "b.raw"), data_filter) == []
+
+
+class TestSizeScheduling:
+    mb = 1024 * 1024
+
+    def test_order_by_size(self):
+        files = [("a", 1), ("big", 30 * self.mb), ("b", 2), ("medium", 10 * self.mb), ("c", 3),
+                 ("large", 20 * self.mb), ("d", 4)]
+        ordered = [name for name, _ in _DataHandler._order_by_size(files, lambda f: f[1])]
+        # Largest first, small files interleaved in their original order
+        assert ordered == ["big", "a", "large", "b", "medium", "c", "d"]
+
+    def test_order_by_size_stream(self):
+        def _scan():
+            yield "a", 1
+            yield "big", 30 * self.mb
+            raise OSError("scan failed")
+
+        with pytest.raises(OSError):
+            list(_DataHandler._order_by_size(_scan(), lambda f: f[1]))
+        assert list(_DataHandler._order_by_size(iter([("a", 1)]), lambda f: f[1])) == [("a", 1)]
+
+    def test_split_large(self):
+        splits = []
+        with patch.object(_DataHandler, "_SPLIT_SIZE", 10), patch.object(_DataHandler, "_BLOCK_SIZE", 8):
+            work = list(_DataHandler._split_large([("a", 5), ("b", 25)], lambda f: f[1], splits))
+            assert list(_DataHandler._split_large([("b", 25)], lambda f: f[1], [], False)) == [(("b", 25), None, 0)]
+        assert [(item[0], part) for item, _, part in work] == [("a", 0), ("b", 0), ("b", 1), ("b", 2), ("b", 3)]
+        assert len(splits) == 1
+        assert [splits[0].get_range(i) for i in range(4)] == [(0, 8), (8, 8), (16, 8), (24, 1)]
+
+    def test_upload_split(self):
+        client = MagicMock()
+        blob_client = client.get_blob_client.return_value
+        staged = {}
+        blob_client.stage_block.side_effect = lambda block_id, data, **kwargs: staged.update({block_id: data})
+        content = bytes(range(25))
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "mesh.obj"), "wb") as f:
+                f.write(content)
+            with open(os.path.join(tmp, "small.txt"), "wb") as f:
+                f.write(b"abc")
+            with patch.object(_DataHandler, "_SPLIT_SIZE", 10), patch.object(_DataHandler, "_CHUNK_SIZE", 8):
+                r = _DataHandler._upload_data(client, "https://account.blob.core.windows.net/container", tmp, "",
+                                              ProgressTracker(), False, False, ConcurrencyController(),
+                                              TransferScheduler())
+        assert not r.is_error()
+        assert r.value.transferred == ["mesh.obj", "small.txt"]
+        assert len(staged) == 4
+        client.upload_blob.assert_called_once()
+        block_ids = [block.id for block in blob_client.commit_block_list.call_args.args[0]]
+        assert b"".join(staged[block_id] for block_id in block_ids) == content
+        blob_client.commit_block_list.assert_called_once()
+
+    def test_download_split(self):
+        client = MagicMock()
+        content = bytes(range(25))
+        blob = MagicMock(size=len(content), etag="0x1", content_settings=None, last_modified=None)
+        blob.name = "mesh.obj"
+        client.walk_blobs.side_effect = lambda name_starts_with=None, delimiter=None: iter([blob])
+
+        def _download_blob(name, offset=None, length=None, **kwargs):
+            # Parts are written aside, the destination only appears once the whole blob is downloaded
+            assert not os.path.exists(os.path.join(tmp, "mesh.obj"))
+            downloader = MagicMock()
+            downloader.readinto.side_effect = lambda stream: stream.write(content[offset:offset + length])
+            return downloader
+
+        client.download_blob.side_effect = _download_blob
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch.object(_DataHandler, "_SPLIT_SIZE", 10), patch.object(_DataHandler, "_BLOCK_SIZE", 8), \
+                    patch.object(_DataHandler, "_RETRY_DELAY", 0):
+                r = _DataHandler._download_data(client, tmp, "", ProgressTracker(), False, False, False,
+                                                ConcurrencyController(), TransferScheduler())
+                assert not r.is_error()
+                assert r.value.transferred == ["mesh.obj"]
+                with open(os.path.join(tmp, "mesh.obj"), "rb") as f:
+                    assert f.read() == content
+                assert os.listdir(tmp) == ["mesh.obj"]
+                assert client.download_blob.call_count == 4
+
+                # A failed block does not leave a partial file behind
+                os.remove(os.path.join(tmp, "mesh.obj"))
+                client.download_blob.side_effect = mock_blob_except
+                r = _DataHandler._download_data(client, tmp, "", ProgressTracker(), False, False, False,
+                                                ConcurrencyController(), TransferScheduler())
+                assert r.is_error()
+                assert os.listdir(tmp) == []
+
+    def test_download_split_interrupted(self):
+        client = MagicMock()
+        blob = MagicMock(size=25, etag="0x1", content_settings=None, last_modified=None)
+        blob.name = "mesh.obj"
+        client.walk_blobs.side_effect = lambda name_starts_with=None, delimiter=None: iter([blob])
+        downloader = MagicMock()
+        downloader.readinto.side_effect = lambda stream: stream.write(b"x" * 8)
+        client.download_blob.return_value = downloader
+        progress = ProgressTracker(lambda p: False, max_rate=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch.object(_DataHandler, "_SPLIT_SIZE", 10), patch.object(_DataHandler, "_BLOCK_SIZE", 8):
+                r = _DataHandler._download_data(client, tmp, "", progress, True, False, False,
+                                                ConcurrencyController(), TransferScheduler())
+            assert r.get_response_status_code() == 499
+            # No file of the size of the blob is left for a later sync to consider as downloaded
+            assert not os.path.exists(os.path.join(tmp, "mesh.obj"))
+            assert not os.path.exists(os.path.join(tmp, "mesh.obj.part"))
+
+
+class TestMappedUpload:
+    mb = 1024 * 1024
+
+    def test_get_block_size(self):
+        assert _DataHandler._get_block_size(3) == 4 * self.mb
+        assert _DataHandler._get_block_size(1024 * self.mb) == 4 * self.mb
+        assert _DataHandler._get_block_size(2048 * self.mb) == 8 * self.mb
+        assert _DataHandler._get_block_size(25 * 1024 * self.mb) == 64 * self.mb
+        # A blob never has more blocks than the service accepts
+        huge = 8 * 1024 * 1024 * self.mb
+        assert -(-huge // _DataHandler._get_block_size(huge)) <= 50000
+
+    def test_map_range(self):
+        content = os.urandom(3 * mmap.ALLOCATIONGRANULARITY)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data.bin")
+            with open(path, "wb") as f:
+                f.write(content)
+            with _DataHandler._map_range(path, 0, len(content)) as view:
+                assert isinstance(view, memoryview)
+                assert view == content
+            # Offsets do not need to be aligned on the allocation granularity
+            offset = mmap.ALLOCATIONGRANULARITY + 5
+            with _DataHandler._map_range(path, offset, 100) as view:
+                assert len(view) == 100
+                assert bytes(view) == content[offset:offset + 100]
+
+    def test_upload_mapped(self):
+        client = MagicMock()
+        blob_client = client.get_blob_client.return_value
+        staged = {}
+
+        def _stage_block(block_id, data, length=None, **kwargs):
+            # Blocks are slices of the mapped file, not copies
+            assert isinstance(data, memoryview)
+            assert len(data) == length
+            staged[block_id] = bytes(data)
+
+        blob_client.stage_block.side_effect = _stage_block
+        content = bytes(range(25))
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "mesh.obj"), "wb") as f:
+                f.write(content)
+            with open(os.path.join(tmp, "small.txt"), "wb") as f:
+                f.write(b"abc")
+            with patch.object(_DataHandler, "_CHUNK_SIZE", 8), patch.object(_DataHandler, "_MAP_SIZE", 10):
+                r = _DataHandler._upload_data(client, "https://account.blob.core.windows.net/container", tmp, "",
+                                              ProgressTracker(), False, False, ConcurrencyController(),
+                                              TransferScheduler())
+        assert not r.is_error()
+        assert r.value.transferred == ["mesh.obj", "small.txt"]
+        # Only the file fitting in a single block is sent with a single request
+        assert client.upload_blob.call_args.args[0] == "small.txt"
+        block_ids = [block.id for block in blob_client.commit_block_list.call_args.args[0]]
+        assert len(block_ids) == 4
+        assert b"".join(staged[block_id] for block_id in block_ids) == content
+
+    def test_upload_not_mappable(self):
+        client = MagicMock()
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "mesh.obj"), "wb") as f:
+                f.write(bytes(range(25)))
+            scheduler = TransferScheduler()
+            with patch.object(_DataHandler, "_CHUNK_SIZE", 8), patch.object(_DataHandler, "_MAP_SIZE", 10), \
+                    patch.object(_DataHandler, "_can_map", lambda path: False), \
+                    patch.object(scheduler, "reserve", wraps=scheduler.reserve) as reserve:
+                r = _DataHandler._upload_data(client, "https://account.blob.core.windows.net/container", tmp, "",
+                                              ProgressTracker(), False, False, ConcurrencyController(), scheduler)
+        assert not r.is_error()
+        # The file is uploaded by the buffered path, and its buffers are accounted for
+        client.upload_blob.assert_called_once()
+        client.get_blob_client.return_value.stage_block.assert_not_called()
+        assert reserve.call_args.args[0] == 25
+
+    def test_upload_medium_buffered(self):
+        client = MagicMock()
+        blob_client = client.get_blob_client.return_value
+        staged = {}
+
+        def _stage_block(block_id, data, length=None, **kwargs):
+            staged[block_id] = bytes(data)
+
+        blob_client.stage_block.side_effect = _stage_block
+        content = bytes(range(25))
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "mesh.obj"), "wb") as f:
+                f.write(content)
+            scheduler = TransferScheduler()
+            # Files below the map size are read into buffers, even when they are split
+            with patch.object(_DataHandler, "_CHUNK_SIZE", 8), patch.object(_DataHandler, "_map_range") as map_range, \
+                    patch.object(scheduler, "reserve", wraps=scheduler.reserve) as reserve:
+                r = _DataHandler._upload_data(client, "https://account.blob.core.windows.net/container", tmp, "",
+                                              ProgressTracker(), False, False, ConcurrencyController(), scheduler)
+                assert not r.is_error()
+                client.upload_blob.assert_called_once()
+                assert reserve.call_args.args[0] == 25
+                with patch.object(_DataHandler, "_SPLIT_SIZE", 10):
+                    r = _DataHandler._upload_data(client, "https://account.blob.core.windows.net/container", tmp, "",
+                                                  ProgressTracker(), False, False, ConcurrencyController(), scheduler)
+                assert not r.is_error()
+                assert sorted(c.args[0] for c in reserve.call_args_list[1:]) == [1, 8, 8, 8]
+            map_range.assert_not_called()
+        block_ids = [block.id for block in blob_client.commit_block_list.call_args.args[0]]
+        assert b"".join(staged[block_id] for block_id in block_ids) == content
+
+    def test_map_range_truncated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "mesh.obj")
+            with open(path, "wb") as f:
+                f.write(b"0123")
+            assert _DataHandler._can_map(path)
+            with pytest.raises(OSError, match="truncated"):
+                with _DataHandler._map_range(path, 0, 10):
+                    pass
+
+    def test_upload_mapped_failure(self):
+        client = MagicMock()
+        blob_client = client.get_blob_client.return_value
+        blob_client.stage_block.side_effect = mock_blob_except
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "mesh.obj")
+            with open(path, "wb") as f:
+                f.write(bytes(range(25)))
+            with patch.object(_DataHandler, "_CHUNK_SIZE", 8), pytest.raises(Exception, match="this is a test"):
+                _DataHandler._upload_mapped(client, "mesh.obj", path, 25, lambda current, total: None, None, 1)
+        # The remaining blocks are not sent and the blob is not committed
+        assert blob_client.stage_block.call_count == 1
+        blob_client.commit_block_list.assert_not_called()
+
+
+class TestRangeWriter:
+    @pytest.mark.parametrize("pwrite", [pytest.param(True, marks=pytest.mark.skipif(not hasattr(os, "pwrite"),
+                                                                            reason="no os.pwrite")), False])
+    def test_write_at(self, pwrite):
+        content = os.urandom(64 * 1024)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "merged.las")
+            with patch.object(_RangeWriter, "_PWRITE", pwrite):
+                writer = _RangeWriter(path, len(content))
+                # The file has its final size before any range is written
+                assert os.path.getsize(path) == len(content)
+                starts = list(range(0, len(content), 4096))
+                threads = [threading.Thread(target=writer.write_at, args=(content[i:i + 4096], i))
+                           for i in reversed(starts)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                writer.close()
+                writer.close()
+            with open(path, "rb") as f:
+                assert f.read() == content
+
+    def test_stream(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "merged.las")
+            writer = _RangeWriter(path, 10)
+            stream = writer.open_at(4)
+            assert stream.write(b"45") == 2
+            assert stream.tell() == 6
+            stream.seek(2, io.SEEK_CUR)
+            stream.write(memoryview(b"89"))
+            stream.seek(0)
+            stream.write(b"01")
+            with pytest.raises(io.UnsupportedOperation):
+                stream.seek(0, io.SEEK_END)
+            writer.close()
+            with open(path, "rb") as f:
+                assert f.read() == b"01\x00\x0045\x00\x0089"
+
+    def test_download_ranges_parallel(self):
+        client = MagicMock()
+        content = bytes(range(10))
+        blob = MagicMock(size=len(content), etag="0x1")
+        blob.name = "merged.las"
+        gate = threading.Barrier(3, timeout=5)
+
+        def _download_range(name, offset, length, **kwargs):
+            # The first ranges are downloaded at the same time
+            if offset < 6:
+                gate.wait()
+            downloader = MagicMock()
+            downloader.readinto.side_effect = lambda stream: stream.write(content[offset:offset + length])
+            return downloader
+
+        client.download_blob.side_effect = _download_range
+        calls = []
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "merged.las")
+            with patch.object(_DataHandler, "_BLOCK_SIZE", 2):
+                _DataHandler._download_ranges(client, blob, path, lambda current, total: calls.append(current), 3)
+            with open(path, "rb") as f:
+                assert f.read() == content
+            assert os.listdir(tmp) == ["merged.las"]
+        assert client.download_blob.call_count == 5
+        assert calls[-1] == len(content)
+
+
+def mock_blob_failing(failing, times=None):
+    calls = {}
+
+    def _upload_blob(name, *args, **kwargs):
+        calls[name] = calls.get(name, 0) + 1
+        if name in failing and (times is None or calls[name] <= times):
+            raise Exception("this is a test")
+        mock_blob(name, *args, **kwargs)
+    return _upload_blob, calls
+
+
+class TestFileRetries:
+    url = "https://account.blob.core.windows.net/container?sig=abc"
+
+    @staticmethod
+    def _write_files(folder, names):
+        for name in names:
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(name.encode())
+
+    def test_upload_retried(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect, calls = mock_blob_failing({"b.txt"}, times=2)
+        with tempfile.TemporaryDirectory() as tmp:
+            self._write_files(tmp, ["a.txt", "b.txt"])
+            r = _DataHandler.upload_data(self.url, tmp, "", None)
+        assert r.get_response_status_code() == 200
+        assert r.value.transferred == ["a.txt", "b.txt"]
+        assert r.value.failed == []
+        assert calls == {"a.txt": 1, "b.txt": 3}
+
+    def test_upload_partial(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect, calls = mock_blob_failing({"b.txt"})
+        with tempfile.TemporaryDirectory() as tmp:
+            self._write_files(tmp, ["a.txt", "b.txt", "c.txt"])
+            r = _DataHandler.upload_data(self.url, tmp, "", None)
+            assert r.is_error()
+            assert r.get_response_status_code() == 207
+            assert r.error.error.code == "UploadFailure"
+            assert [d.target for d in r.error.error.details] == ["b.txt"]
+            assert r.value.transferred == ["a.txt", "c.txt"]
+            assert r.value.failed == ["b.txt"]
+            assert calls["b.txt"] == 1 + _DataHandler._FILE_RETRIES
+
+            # Only the failed files are uploaded again
+            mock_client_instance.upload_blob.side_effect, calls = mock_blob_failing(set())
+            r = r.value.retry_failed()
+        assert r.get_response_status_code() == 200
+        assert r.value.transferred == ["b.txt"]
+        assert calls == {"b.txt": 1}
+        assert r.value.retry_failed().value.transferred == []
+
+    def test_upload_authentication_failure(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = ClientAuthenticationError("expired")
+        with tempfile.TemporaryDirectory() as tmp:
+            self._write_files(tmp, ["a.txt"])
+            r = _DataHandler.upload_data(self.url, tmp, "", None)
+        # Failures concerning every file are not retried
+        assert r.get_response_status_code() == 500
+        assert r.value is None
+        assert mock_client_instance.upload_blob.call_count == 1
+
+    def test_upload_split_partial(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        mock_client_instance.upload_blob.side_effect = mock_blob
+        blob_client = mock_client_instance.get_blob_client.return_value
+        blob_client.stage_block.side_effect = mock_blob_except
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "mesh.obj"), "wb") as f:
+                f.write(bytes(range(25)))
+            self._write_files(tmp, ["small.txt"])
+            with patch.object(_DataHandler, "_SPLIT_SIZE", 10), patch.object(_DataHandler, "_BLOCK_SIZE", 8):
+                r = _DataHandler.upload_data(self.url, tmp, "", None)
+        assert r.get_response_status_code() == 207
+        assert r.value.transferred == ["small.txt"]
+        assert r.value.failed == ["mesh.obj"]
+        blob_client.commit_block_list.assert_not_called()
+
+    def test_download_partial(self, mock_container_client_default):
+        mock_client_class, mock_client_instance = mock_container_client_default
+        blobs = []
+        for name in ["a.txt", "b.txt"]:
+            blob = MagicMock(size=5, etag="0x1", content_settings=None, last_modified=None)
+            blob.name = name
+            blobs.append(blob)
+        mock_client_instance.list_blobs.return_value = blobs
+        failing = {"b.txt"}
+
+        def _download_blob(name, **kwargs):
+            if name in failing:
+                raise Exception("this is a test")
+            downloader = MagicMock()
+            downloader.readinto.side_effect = lambda stream: stream.write(name[:1].encode() * 5)
+            return downloader
+
+        mock_client_instance.download_blob.side_effect = _download_blob
+        with tempfile.TemporaryDirectory() as tmp:
+            r = _DataHandler.download_data(self.url, tmp, "", None, mirror=True)
+            assert r.get_response_status_code() == 207
+            assert r.value.transferred == ["a.txt"]
+            assert r.value.failed == ["b.txt"]
+            assert not os.path.exists(os.path.join(tmp, "b.txt"))
+
+            failing.clear()
+            mock_client_instance.list_blobs.reset_mock()
+            r = r.value.retry_failed()
+            assert r.get_response_status_code() == 200
+            assert r.value.transferred == ["b.txt"]
+            # The retry neither lists the source again nor removes the files downloaded before
+            mock_client_instance.list_blobs.assert_not_called()
+            assert sorted(os.listdir(tmp)) == ["a.txt", "b.txt"]
+
@@ -0,0 +1,259 @@
+import threading
+import time
+from itertools import count
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from reality_capture.service.transfer import ConcurrencyController, TransferScheduler, ProgressTracker, TransferProgress
+
+
+def make_response(status_code, error_code=None):
+    response = MagicMock()
+    response.http_response.status_code = status_code
+    response.http_response.headers = {"x-ms-error-code": error_code} if error_code else {}
+    return response
+
+
+class TestConcurrencyController:
+    def test_start_bounded(self):
+        controller = ConcurrencyController(max_workers=8, max_concurrency=4)
+        controller.start(20)
+        assert controller.workers == 8
+        assert controller.concurrency == 4
+        controller.start(0)
+        assert controller.workers == 1
+
+    def test_grow(self):
+        controller = ConcurrencyController(max_workers=8, max_concurrency=4)
+        controller.start(4)
+        controller.grow(2)
+        assert controller.workers == 4
+        controller.grow(6)
+        assert controller.workers == 6
+        controller.grow(20)
+        assert controller.workers == 8
+
+    def test_additive_increase(self):
+        # One second per call so that every window sees the same throughput
+        clock = count()
+        with patch("reality_capture.service.transfer.time.monotonic", side_effect=lambda: float(next(clock))):
+            controller = ConcurrencyController(max_workers=8, max_concurrency=4, window=1)
+            controller.start(4)
+            controller.throttle()
+            assert controller.workers == 2
+            assert controller.concurrency == 2
+            for _ in range(10):
+                controller.record(1024, 0.1)
+        assert controller.workers == 8
+        assert controller.concurrency == 4
+
+    def test_throttle_once_per_window(self):
+        controller = ConcurrencyController(max_workers=16, max_concurrency=16, window=60)
+        controller.start(16)
+        controller.on_response(make_response(503))
+        controller.on_response(make_response(503))
+        assert controller.workers == 8
+        assert controller.concurrency == 8
+
+    def test_throttling_detection(self):
+        controller = ConcurrencyController(max_workers=16, max_concurrency=16, window=0)
+        controller.start(16)
+        controller.on_response(make_response(200))
+        controller.on_response(make_response(201))
+        assert controller.workers == 16
+        controller.on_response(make_response(500, "OperationTimedOut"))
+        assert controller.workers == 8
+        controller.on_response(make_response(429))
+        assert controller.workers == 4
+
+    def test_latency_decrease(self):
+        controller = ConcurrencyController(max_workers=16, max_concurrency=16, window=0)
+        controller.start(10)
+        controller.record(100, 0.1, small=True)
+        workers = controller.workers
+        controller.record(100, 1.0, small=True)
+        assert controller.workers == workers - 1
+
+    def test_acquire_limit(self):
+        controller = ConcurrencyController(max_workers=2, max_concurrency=1, window=60)
+        controller.start(2)
+        assert controller.try_acquire()
+        assert controller.try_acquire()
+        assert not controller.try_acquire()
+        controller.release()
+        assert controller.try_acquire()
+
+
+class TestTransferScheduler:
+    def test_default(self):
+        default = TransferScheduler.get_default()
+        assert TransferScheduler.get_default() is default
+        scheduler = TransferScheduler(max_threads=2)
+        TransferScheduler.set_default(scheduler)
+        try:
+            assert TransferScheduler.get_default() is scheduler
+        finally:
+            TransferScheduler.set_default(default)
+
+    def test_run_bounded_by_controller(self):
+        scheduler = TransferScheduler(max_threads=8)
+        controller = ConcurrencyController(max_workers=3, window=60)
+        controller.start(3)
+        lock = threading.Lock()
+        running = 0
+        peak = 0
+        processed = []
+
+        def fn(item):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+                processed.append(item)
+
+        scheduler.run(fn, range(20), controller)
+        assert sorted(processed) == list(range(20))
+        assert 1 <= peak <= 3
+
+    def test_run_empty(self):
+        TransferScheduler(max_threads=1).run(lambda x: None, [])
+
+    def test_run_error(self):
+        processed = []
+
+        def fn(item):
+            if item == 2:
+                raise InterruptedError("stop")
+            processed.append(item)
+
+        with pytest.raises(InterruptedError):
+            TransferScheduler(max_threads=2).run(fn, range(100))
+        assert len(processed) < 100
+
+    def test_reserve_budget(self):
+        scheduler = TransferScheduler(max_threads=2, max_connections=4, max_bytes=100)
+        acquired = threading.Event()
+
+        def worker():
+            with scheduler.reserve(60, 1):
+                acquired.set()
+
+        with scheduler.reserve(60, 1):
+            t = threading.Thread(target=worker)
+            t.start()
+            time.sleep(0.05)
+            assert not acquired.is_set()
+        t.join(1)
+        assert acquired.is_set()
+
+        with scheduler.reserve(1000, 100):
+            # Requests larger than the budget are bounded to it instead of waiting forever
+            pass
+
+    def test_reserve_connections(self):
+        scheduler = TransferScheduler(max_threads=2, max_connections=2, max_bytes=100)
+        acquired = threading.Event()
+
+        def worker():
+            with scheduler.reserve(1, 1):
+                acquired.set()
+
+        with scheduler.reserve(1, 2):
+            t = threading.Thread(target=worker)
+            t.start()
+            time.sleep(0.05)
+            assert not acquired.is_set()
+        t.join(1)
+        assert acquired.is_set()
+
+
+class TestProgressTracker:
+    def test_aggregation(self):
+        tracker = ProgressTracker()
+        tracker.start(300, 3)
+        tracker.update("a", 50)
+        tracker.update("a", 100)
+        tracker.update("b", 20)
+        tracker.complete("a", 100)
+        tracker.skip("c", 100)
+        progress = tracker.get()
+        assert progress.bytes_done == 220
+        assert progress.files_done == 2
+        assert progress.files_total == 3
+        tracker.add_total(100)
+        assert tracker.get().bytes_total == 400
+        assert tracker.get().files_total == 4
+
+    def test_restart(self):
+        tracker = ProgressTracker()
+        tracker.start(300, 3)
+        tracker.update("a", 50)
+        tracker.complete("b", 100)
+        # A tracker reused for another transfer, e.g. a retry, starts from zero
+        tracker.start(100, 1)
+        tracker.update("a", 20)
+        progress = tracker.get()
+        assert progress.bytes_done == 20
+        assert progress.files_done == 0
+        assert progress.bytes_total == 100
+
+    def test_rate_limited(self):
+        calls = []
+        tracker = ProgressTracker(lambda p: calls.append(p) or True, max_rate=0.01)
+        tracker.start(1000, 1)
+        for i in range(1000):
+            tracker.update("a", i)
+        assert len(calls) == 1
+        tracker.complete("a", 1000)
+        tracker.flush()
+        assert len(calls) == 2
+        assert calls[-1] == 100.0
+
+    def test_detailed(self):
+        calls = []
+        tracker = ProgressTracker(lambda p: calls.append(p) or True, max_rate=0, detailed=True)
+        tracker.start(100, 2)
+        tracker.complete("a", 50)
+        assert isinstance(calls[-1], TransferProgress)
+        assert calls[-1].bytes_done == 50
+        assert calls[-1].files_done == 1
+        assert calls[-1].percentage == 50.0
+
+    def test_empty_transfer(self):
+        calls = []
+        tracker = ProgressTracker(lambda p: calls.append(p) or True)
+        tracker.start(0, 0)
+        tracker.flush()
+        assert calls == [100.0]
+
+    def test_interrupted(self):
+        tracker = ProgressTracker(lambda p: False, max_rate=0.01)
+        tracker.start(100, 1)
+        with pytest.raises(InterruptedError):
+            tracker.update("a", 10)
+        # Later updates keep failing even if the hook is not called
+        with pytest.raises(InterruptedError):
+            tracker.update("a", 20)
+
+    def test_threads(self):
+        tracker = ProgressTracker(lambda p: True, max_rate=0)
+        tracker.start(8 * 1000, 8)
+
+        def worker(name):
+            for i in range(1, 1001):
+                tracker.update(name, i)
+            tracker.complete(name, 1000)
+
+        threads = [threading.Thread(target=worker, args=(str(i),)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        progress = tracker.get()
+        assert progress.bytes_done == 8000
+        assert progress.files_done == 8
+        assert progress.eta == 0.0